@@ -1,27 +1,34 @@
 from django.contrib import admin
-from cars.models import Car, CarRating
-from cars.serializers import CarSerializer
-from cars.services.vehicle_api import VehicleAPICConnector
+from cars.models import Car, CarRating, ImportJob
+from cars.services.car_import import import_cars
+from cars.services.vehicle_api import VehicleAPICConnector, get_vehicle_models_by_makes_data
+from cars.tasks import start_import_job
 from django.contrib import messages
+from rest_framework.exceptions import APIException
 
 
 @admin.action(description="Imports all car models by make of selected models")
 def get_all_cars_by_make(modeladmin, request, queryset):
-    car_makes = [{"make": make} for make in queryset.values_list("make", flat=True)]
-    for make in car_makes:
-        connector = VehicleAPICConnector(make)
-        list_of_cars = connector.get_vehicle_models_by_make_data()
-        formatted_list_of_cars = connector.validate_vehicles_by_make_data(list_of_cars)
-        length = 10 if len(formatted_list_of_cars) >= 10 else len(formatted_list_of_cars)
-        for car in formatted_list_of_cars[:length]:
-            car_to_create = CarSerializer(data=car)
-            if car_to_create.is_valid():
-                created_car, created = Car.objects.get_or_create(**car_to_create.validated_data)
-                if created:
-                    messages.add_message(request, messages.SUCCESS, f'Created {created_car.make} {created_car.model}')
-                messages.add_message(request, messages.INFO,
-                                     f'Car {created_car.make} {created_car.model} already exists')
-            messages.add_message(request, messages.ERROR, f'Car not created error: {car_to_create.errors}')
+    responses = get_vehicle_models_by_makes_data(queryset.values_list("make", flat=True).distinct())
+    cars_to_create = []
+    for make, list_of_cars in responses.items():
+        try:
+            if isinstance(list_of_cars, APIException):
+                raise list_of_cars
+            cars_to_create += VehicleAPICConnector({"make": make}).validate_vehicles_by_make_data(list_of_cars)
+        except APIException as e:
+            detail = e.detail if isinstance(e.detail, str) else ' '.join(e.detail)
+            messages.add_message(request, messages.ERROR, f'Make {make} not imported error: {detail}')
+    created_cars_ids, errors = import_cars(cars_to_create)
+    messages.add_message(request, messages.SUCCESS, f'Created {len(created_cars_ids)} car(s)')
+    for error in errors:
+        messages.add_message(request, messages.ERROR, f'Car not created error: {error["errors"]}')
+
+
+@admin.action(description="Imports all car models by make of selected models in background")
+def import_all_cars_by_make_in_background(modeladmin, request, queryset):
+    job = start_import_job(queryset.values_list("make", flat=True).distinct())
+    messages.add_message(request, messages.SUCCESS, f'Started import job {job.id} of {job.total_makes} make(s)')
 
 
 @admin.register(Car)
@@ -31,9 +38,31 @@ class CarAdmin(admin.ModelAdmin):
         'model',
         'avg_rating'
     ]
-    actions = [get_all_cars_by_make]
+    actions = [get_all_cars_by_make, import_all_cars_by_make_in_background]
 
 
 @admin.register(CarRating)
 class CarRatingAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = [
+        'id',
+        'status',
+        'processed_makes',
+        'total_makes',
+        'created_cars',
+        'created_at'
+    ]
+    readonly_fields = [
+        'makes',
+        'status',
+        'processed_makes',
+        'total_makes',
+        'created_cars',
+        'errors',
+        'created_at',
+        'finished_at'
+    ]
@@ -0,0 +1,169 @@
+"""
+Benchmarks of cars endpoints, skipped unless CARS_BENCHMARK_SIZES is set, e.g.:
+
+    CARS_BENCHMARK_SIZES=1000,10000,100000 pytest cars/benchmark_tests.py
+
+For each number of cars database is seeded once with cars and skewed ratings, then every endpoint is requested
+CARS_BENCHMARK_RUNS times. Tests fail when an endpoint runs more queries than its budget. Query counts, p50/p99
+latency and peak allocated memory are written as json to CARS_BENCHMARK_RESULTS file, so results of two commits
+can be diffed.
+"""
+import json
+import os
+import platform
+import random
+import statistics
+
+import pytest
+from django.db import connection
+from django.urls import reverse
+
+from cars.benchmarks import measure
+from cars.factories import CarFactory, CarRatingFactory
+from cars.models import Car, CarRating
+
+SIZES = [int(size) for size in os.environ.get('CARS_BENCHMARK_SIZES', '').split(',') if size.strip()]
+RUNS = int(os.environ.get('CARS_BENCHMARK_RUNS', 20))
+RESULTS_PATH = os.environ.get('CARS_BENCHMARK_RESULTS', 'benchmark-results.json')
+RATINGS_PER_CAR = 3
+MAKES = 50
+MODELS_PER_MAKE = 100
+
+QUERY_BUDGETS = {
+    'list': 1,
+    'retrieve': 1,
+    # car lookup, rating, car aggregates, INSERT of missing rating buckets and their UPDATE
+    'rate': 5,
+    'popular': 1,
+    # SQLite limits number of query parameters, so it inserts MODELS_PER_MAKE cars with two statements
+    'cars_by_make': 6,
+    # SQLite loads cars into search trie on first request
+    'search': 2,
+}
+
+pytestmark = [
+    pytest.mark.skipif(not SIZES, reason="set CARS_BENCHMARK_SIZES to run benchmarks"),
+    pytest.mark.django_db,
+]
+
+results = {}
+
+
+def seed(size, seed_value=0):
+    """
+    Creates "size" cars and RATINGS_PER_CAR ratings per car on average. Number of ratings per car follows Zipf
+    distribution (few cars get most ratings) and high ratings are more common than low ones.
+    """
+    rng = random.Random(seed_value)
+    Car.objects.bulk_create(
+        [CarFactory.build(make=f'Make{number % MAKES}') for number in range(size)],
+        batch_size=5000,
+    )
+    car_ids = list(Car.objects.order_by('id').values_list('id', flat=True))
+    rated_car_ids = rng.choices(car_ids, weights=[1 / rank for rank in range(1, size + 1)], k=size * RATINGS_PER_CAR)
+    ratings = rng.choices([1, 2, 3, 4, 5], weights=[5, 5, 15, 35, 40], k=len(rated_car_ids))
+    CarRating.objects.bulk_create(
+        [
+            CarRatingFactory.build(car_id=Car(pk=car_id), rating=rating)
+            for car_id, rating in zip(rated_car_ids, ratings)
+        ],
+        batch_size=5000,
+    )
+    Car.objects.recompute_rating_aggregates()
+
+
+def clear():
+    with connection.cursor() as cursor:
+        for model in (CarRating, Car):
+            cursor.execute(f'DELETE FROM {model._meta.db_table}')
+
+
+@pytest.fixture(scope='module', params=SIZES)
+def size(request, django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        seed(request.param)
+        yield request.param
+        clear()
+
+
+@pytest.fixture(scope='module', autouse=True)
+def results_file():
+    yield
+    if results:
+        with open(RESULTS_PATH, 'w') as output:
+            json.dump(
+                {'python': platform.python_version(), 'database': connection.vendor, 'runs': RUNS, 'sizes': results},
+                output,
+                indent=2,
+                sort_keys=True,
+            )
+
+
+@pytest.fixture(autouse=True)
+def uncached_responses(settings):
+    settings.RESPONSE_CACHE_TTL = 0
+
+
+@pytest.fixture(autouse=True)
+def unthrottled(settings):
+    settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+
+
+def benchmark(size, endpoint, request):
+    """
+    Performs request RUNS times rolling back its changes, checks its query count against budget and stores
+    p50/p99 latency in milliseconds and peak allocated memory of a single request.
+    """
+    runs = [measure(request) for _ in range(RUNS)]
+    milliseconds = [run['seconds'] * 1000 for run in runs]
+    percentiles = statistics.quantiles(milliseconds, n=100, method='inclusive')
+    queries = max(run['queries'] for run in runs)
+    results.setdefault(str(size), {})[endpoint] = {
+        'queries': queries,
+        'query_budget': QUERY_BUDGETS[endpoint],
+        'p50_ms': round(percentiles[49], 3),
+        'p99_ms': round(percentiles[98], 3),
+        'peak_memory_bytes': measure(request, trace_memory=True)['peak_memory'],
+    }
+    assert queries <= QUERY_BUDGETS[endpoint], f'{endpoint} ran {queries} queries'
+
+
+def assert_status(response, status_code):
+    assert response.status_code == status_code, response.content
+    return response
+
+
+def test_list(client, size):
+    benchmark(size, 'list', lambda: assert_status(client.get(reverse('cars:cars-list')), 200))
+
+
+def test_retrieve(client, size):
+    car_id = Car.objects.order_by('-rates_number', '-id').values_list('id', flat=True)[0]
+    benchmark(size, 'retrieve', lambda: assert_status(client.get(reverse('cars:cars-detail', args=[car_id])), 200))
+
+
+def test_rate(client, size):
+    car_id = Car.objects.order_by('id').values_list('id', flat=True)[size // 2]
+    benchmark(size, 'rate', lambda: assert_status(
+        client.post(reverse('cars:rate'), data={'car_id': car_id, 'rating': 4}), 201
+    ))
+
+
+def test_popular(client, size):
+    benchmark(size, 'popular', lambda: assert_status(client.get(reverse('cars:popular')), 200))
+
+
+def test_search(client, size):
+    benchmark(size, 'search', lambda: assert_status(client.get(reverse('cars:search'), {'q': 'make1'}), 200))
+
+
+def test_cars_by_make(client, size, vehicle_api_stub):
+    vehicle_api_stub.models = {
+        'benchmark': [
+            {'Make_ID': 1, 'Make_Name': 'Benchmark', 'Model_ID': number, 'Model_Name': f'Model {number}'}
+            for number in range(MODELS_PER_MAKE)
+        ]
+    }
+    benchmark(size, 'cars_by_make', lambda: assert_status(
+        client.post(reverse('cars:cars_by_make'), data={'make': 'Benchmark', 'create': 'True'}), 201
+    ))
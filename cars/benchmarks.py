@@ -0,0 +1,45 @@
+import time
+import tracemalloc
+
+from django.db import connection, transaction
+
+
+class Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(func, *args, rollback=True, trace_memory=False, **kwargs):
+    """
+    Runs function once and returns dict with its number of SQL queries, wall time in seconds and, if "trace_memory"
+    is set, peak memory allocated in bytes. Database changes are rolled back unless "rollback" is False.
+    """
+    result = {}
+    counter = QueryCounter()
+    try:
+        with transaction.atomic(), connection.execute_wrapper(counter):
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            func(*args, **kwargs)
+            result['seconds'] = time.perf_counter() - start
+            if trace_memory:
+                result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            result['queries'] = counter.count
+            if rollback:
+                raise Rollback
+    except Rollback:
+        pass
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+    return result
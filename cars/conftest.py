@@ -1,6 +1,16 @@
 import pytest
 
+from cars_API.celery import app as celery_app
+
 from cars.models import Car, CarRating
+from cars.services.metrics import get_request_metrics
+from cars.services.rating_buffer import get_rating_buffer
+from cars.services.response_cache import get_response_cache
+from cars.services.search import get_search_trie_cache
+from cars.services.token_buckets import get_token_buckets
+from cars.services.vehicle_api import get_circuit_breaker, get_vehicle_api_cache
+from cars.services.vehicle_api_stub import VehicleAPIStub
+from cars.throttling import get_upstream_limiter
 
 
 @pytest.fixture()
@@ -11,3 +21,85 @@ def car() -> Car:
 @pytest.fixture()
 def rating() -> CarRating:
     return CarRating.objects.create()
+
+
+@pytest.fixture(autouse=True)
+def vehicle_api_cache():
+    get_vehicle_api_cache.cache_clear()
+    yield get_vehicle_api_cache()
+    get_vehicle_api_cache.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def circuit_breaker():
+    get_circuit_breaker.cache_clear()
+    yield get_circuit_breaker()
+    get_circuit_breaker.cache_clear()
+
+
+@pytest.fixture()
+def vehicle_api_stub(settings):
+    stub = VehicleAPIStub().start()
+    settings.VPIC_BASE_URL = stub.url
+    settings.VPIC_BACKOFF_FACTOR = 0
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture()
+def celery_eager():
+    eager_config = {
+        'CELERY_TASK_ALWAYS_EAGER': True,
+        'CELERY_TASK_EAGER_PROPAGATES': True,
+        'CELERY_RESULT_BACKEND': 'cache+memory://',
+    }
+    config = {key: celery_app.conf.get(key) for key in eager_config}
+    celery_app.conf.update(eager_config)
+    yield celery_app
+    celery_app.conf.update(config)
+
+
+@pytest.fixture()
+def rating_buffer(settings):
+    settings.RATINGS_WRITE_BEHIND = True
+    settings.RATINGS_BUFFER_BACKEND = 'local'
+    get_rating_buffer.cache_clear()
+    yield get_rating_buffer()
+    get_rating_buffer.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def response_cache():
+    get_response_cache.cache_clear()
+    yield get_response_cache()
+    get_response_cache.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def search_trie_cache():
+    get_search_trie_cache.cache_clear()
+    yield get_search_trie_cache()
+    get_search_trie_cache.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def token_buckets():
+    get_token_buckets.cache_clear()
+    yield get_token_buckets()
+    get_token_buckets.cache_clear()
+
+
+@pytest.fixture()
+def upstream_limiter(settings):
+    settings.UPSTREAM_MAX_CONCURRENCY = 1
+    get_upstream_limiter.cache_clear()
+    yield get_upstream_limiter()
+    get_upstream_limiter.cache_clear()
+
+
+@pytest.fixture()
+def request_metrics(settings):
+    settings.REQUEST_METRICS_ENABLED = True
+    get_request_metrics.cache_clear()
+    yield get_request_metrics()
+    get_request_metrics.cache_clear()
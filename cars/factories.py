@@ -4,10 +4,16 @@ from cars.models import Car, CarRating
 
 
 class CarFactory(factory.django.DjangoModelFactory):
+    make = factory.Sequence(lambda n: f'Make{n}')
+    model = factory.Sequence(lambda n: f'Model{n}')
+
     class Meta:
         model = Car
 
 
 class CarRatingFactory(factory.django.DjangoModelFactory):
+    car_id = factory.SubFactory(CarFactory)
+    rating = factory.Faker('pyint', min_value=1, max_value=5)
+
     class Meta:
         model = CarRating
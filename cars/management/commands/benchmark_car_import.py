@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from cars.benchmarks import measure
+from cars.models import Car
+from cars.serializers import CarSerializer
+from cars.services.car_import import import_cars
+
+
+def import_cars_one_by_one(cars):
+    for car in cars:
+        car = CarSerializer(data=car)
+        if car.is_valid():
+            Car.objects.get_or_create(**car.validated_data)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares query count and wall time of importing generated models of a make one by one and with "
+        "bulk import. Changes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"models":>8} {"method":>12} {"queries":>8} {"seconds":>9}')
+        for size in options['sizes']:
+            cars = [{'make': 'Benchmark', 'model': f'Benchmark model {number}'} for number in range(size)]
+            for method, func, kwargs in [
+                ('one by one', import_cars_one_by_one, {}),
+                ('bulk', import_cars, {'batch_size': options['batch_size']}),
+            ]:
+                result = measure(func, cars, **kwargs)
+                self.stdout.write(f'{size:>8} {method:>12} {result["queries"]:>8} {result["seconds"]:>9.3f}')
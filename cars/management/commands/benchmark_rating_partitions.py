@@ -0,0 +1,116 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from cars.benchmarks import Rollback
+from cars.services.rating_partitions import month_start, next_month
+
+TABLE = 'benchmark_carrating'
+COLUMNS = "id bigserial, car_id bigint NOT NULL, rating smallint NOT NULL, idempotency_key varchar(64), " \
+          "created_at timestamp with time zone"
+
+
+def create_plain_table(cursor, first_month, last_month):
+    cursor.execute(f"CREATE TABLE {TABLE} ({COLUMNS}, PRIMARY KEY (id), UNIQUE (idempotency_key))")
+
+
+def create_partitioned_table(cursor, first_month, last_month):
+    cursor.execute(f"CREATE TABLE {TABLE} ({COLUMNS}) PARTITION BY RANGE (created_at)")
+    cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+    month = first_month
+    while month <= last_month:
+        cursor.execute(
+            f"CREATE TABLE {TABLE}_y{month.year}m{month.month:02} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+            [month, next_month(month)],
+        )
+        month = next_month(month)
+    cursor.execute(f"CREATE INDEX ON {TABLE} (id)")
+    cursor.execute(f"CREATE INDEX ON {TABLE} (idempotency_key)")
+
+
+def archive_plain(cursor, first_month):
+    cursor.execute(f"DELETE FROM {TABLE} WHERE created_at < %s", [next_month(first_month)])
+
+
+def archive_partitioned(cursor, first_month):
+    partition = f'{TABLE}_y{first_month.year}m{first_month.month:02}'
+    cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {partition}")
+    cursor.execute(f"DROP TABLE {partition}")
+
+
+LAYOUTS = {
+    'plain': (create_plain_table, archive_plain),
+    'partitioned': (create_partitioned_table, archive_partitioned),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares plain and monthly partitioned ratings tables on PostgreSQL: rows per second of inserting "
+        "generated ratings, time of aggregating ratings of all cars and of a sample of cars, and time of removing "
+        "the oldest month of ratings. Tables are created in a transaction which is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--cars', type=int, default=10000)
+        parser.add_argument('--months', type=int, default=12, help="Ratings are spread over that many months.")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows inserted with one statement.")
+        parser.add_argument('--sample', type=int, default=1000, help="Number of cars aggregated by id.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning benchmark requires PostgreSQL')
+        now = timezone.now()
+        first_month = month_start(now - timedelta(days=31 * (options['months'] - 1)))
+        self.stdout.write(
+            f'{"layout":>12} {"insert rows/s":>14} {"all cars s":>11} {"sample s":>9} {"drop month s":>13}'
+        )
+        for layout, (create_table, archive) in LAYOUTS.items():
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    create_table(cursor, first_month, month_start(now))
+                    cursor.execute(f"CREATE INDEX ON {TABLE} (car_id, rating)")
+                    timings = {
+                        'insert': self.timed(self.insert, cursor, options, first_month, now),
+                        'all_cars': self.timed(
+                            cursor.execute, f"SELECT car_id, sum(rating), count(*) FROM {TABLE} GROUP BY car_id"
+                        ),
+                        'sample': self.timed(
+                            cursor.execute,
+                            f"SELECT car_id, sum(rating), count(*) FROM {TABLE} WHERE car_id = ANY(%s) "
+                            f"GROUP BY car_id",
+                            [list(range(1, options['cars'] + 1, max(options['cars'] // options['sample'], 1)))],
+                        ),
+                        'archive': self.timed(archive, cursor, first_month),
+                    }
+                    self.stdout.write(
+                        f'{layout:>12} {options["rows"] / timings["insert"]:>14.0f} {timings["all_cars"]:>11.3f} '
+                        f'{timings["sample"]:>9.3f} {timings["archive"]:>13.3f}'
+                    )
+                    raise Rollback
+            except Rollback:
+                pass
+
+    @staticmethod
+    def timed(func, *args):
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def insert(cursor, options, first_month, now):
+        seconds = (now - first_month).total_seconds()
+        for offset in range(0, options['rows'], options['batch_size']):
+            cursor.execute(f"""
+                INSERT INTO {TABLE} (car_id, rating, idempotency_key, created_at)
+                SELECT 1 + (random() * (%s - 1))::bigint, 1 + (random() * 4)::smallint, md5(number::text),
+                       %s::timestamptz + random() * %s * interval '1 second'
+                FROM generate_series(%s, %s) AS number
+            """, [
+                options['cars'], first_month, seconds,
+                offset + 1, min(offset + options['batch_size'], options['rows']),
+            ])
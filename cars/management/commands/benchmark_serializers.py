@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from cars.benchmarks import Rollback, measure
+from cars.models import Car
+from cars.renderers import FastJSONRenderer
+from cars.serializers import CAR_VALUES_FIELDS, CarSerializer, car_values_representation
+
+
+def render_with_serializer(queryset):
+    return JSONRenderer().render(CarSerializer(queryset, many=True).data)
+
+
+def render_values(queryset):
+    return FastJSONRenderer().render([car_values_representation(row) for row in queryset.values(*CAR_VALUES_FIELDS)])
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares rows per second and peak memory of rendering cars list with CarSerializer and with values() "
+        "rows and FastJSONRenderer. Generated cars are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"cars":>8} {"method":>12} {"rows/s":>10} {"peak MiB":>9}')
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    Car.objects.bulk_create(
+                        [Car(make=f'Make {number % 100}', model=f'Model {number}', rating_sum=number % 50,
+                             rates_number=number % 10, avg_rating=(number % 50) / 10) for number in range(size)],
+                        batch_size=1000,
+                    )
+                    for method, func in [('serializer', render_with_serializer), ('values', render_values)]:
+                        timing = measure(func, Car.objects.all())
+                        memory = measure(func, Car.objects.all(), trace_memory=True)
+                        self.stdout.write(
+                            f'{size:>8} {method:>12} {size / timing["seconds"]:>10.0f} '
+                            f'{memory["peak_memory"] / 2 ** 20:>9.1f}'
+                        )
+                    raise Rollback
+            except Rollback:
+                pass
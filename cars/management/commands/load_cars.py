@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cars.services.bulk_load import load_cars
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads cars from CSV file with \"make,model\" header or from NDJSON file of "
+        "{\"make\", \"model\"} objects. Existing cars and invalid rows are skipped. "
+        "PostgreSQL loads file with COPY into a staging table, other databases insert rows in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to CSV or NDJSON file.")
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'ndjson'],
+            help="File format, guessed from file extension by default.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('ndjson' if options['path'].endswith(('.ndjson', '.jsonl')) else 'csv')
+        try:
+            result = load_cars(options['path'], file_format, options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot load file: {e}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {result['rows_loaded']} of {result['rows_read']} row(s) in {result['seconds']:.2f}s "
+            f"({result['rows_per_second']:.0f} rows/s)"
+        ))
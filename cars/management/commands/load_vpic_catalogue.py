@@ -0,0 +1,83 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from cars.models import VehicleMake, VehicleModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads local copy of NHTSA vPIC catalogue from a dump file. File holds json list of "
+        "{Make_ID, Make_Name, Model_ID, Model_Name} results, optionally wrapped in {\"Results\": [...]} "
+        "like vPIC responses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to vPIC dump file.")
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help="Remove whole catalogue before loading the file.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        results = self.read_results(options['path'])
+        with transaction.atomic():
+            if options['replace']:
+                VehicleMake.objects.all().delete()
+            makes = self.load_makes(results, options['batch_size'])
+            created_models = self.load_models(results, makes, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(makes)} make(s) and {created_models} new model(s)'))
+
+    def read_results(self, path):
+        try:
+            with open(path) as dump:
+                data = json.load(dump)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read vPIC dump: {e}')
+        results = data.get('Results') if isinstance(data, dict) else data
+        if not isinstance(results, list):
+            raise CommandError('vPIC dump must contain a list of results')
+        return results
+
+    def load_makes(self, results, batch_size):
+        """
+        Creates missing makes, renames changed ones and marks all makes from the file as fresh.
+        Returns mapping of vPIC make ids to primary keys.
+        """
+        names = {result['Make_ID']: result['Make_Name'] for result in results}
+        existing = {make.make_id: make for make in VehicleMake.objects.filter(make_id__in=names)}
+        now = timezone.now()
+        VehicleMake.objects.bulk_create(
+            [
+                VehicleMake(make_id=make_id, name=name, normalized_name=name.lower(), updated_at=now)
+                for make_id, name in names.items() if make_id not in existing
+            ],
+            batch_size=batch_size,
+        )
+        renamed = [make for make_id, make in existing.items() if make.name != names[make_id]]
+        for make in renamed:
+            make.name = names[make.make_id]
+            make.normalized_name = make.name.lower()
+        VehicleMake.objects.bulk_update(renamed, ['name', 'normalized_name'], batch_size=batch_size)
+        VehicleMake.objects.filter(make_id__in=names).update(updated_at=now)
+        return dict(VehicleMake.objects.filter(make_id__in=names).values_list('make_id', 'pk'))
+
+    def load_models(self, results, makes, batch_size):
+        existing = set(
+            VehicleModel.objects.filter(make_id__in=makes.values()).values_list('model_id', flat=True)
+        )
+        new_models = {
+            result['Model_ID']: VehicleModel(
+                model_id=result['Model_ID'],
+                make_id=makes[result['Make_ID']],
+                name=result['Model_Name'],
+                normalized_name=result['Model_Name'].lower(),
+            )
+            for result in results if result['Model_ID'] not in existing
+        }
+        VehicleModel.objects.bulk_create(new_models.values(), batch_size=batch_size, ignore_conflicts=True)
+        return len(new_models)
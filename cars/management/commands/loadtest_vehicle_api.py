@@ -0,0 +1,82 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from cars.services.async_vehicle_api import get_async_client
+from cars.services.vehicle_api import get_circuit_breaker
+from cars.services.vehicle_api_stub import VehicleAPIStub
+
+MODELS = [
+    {'Make_ID': 492, 'Make_Name': 'FIAT', 'Model_ID': 2055, 'Model_Name': '500'},
+    {'Make_ID': 492, 'Make_Name': 'FIAT', 'Model_ID': 3490, 'Model_Name': 'Freemont'},
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares throughput of sync cars_by_make view served by a fixed number of WSGI worker threads with "
+        "its async version served by a single event loop, against local vPIC stub delaying every response. "
+        "External API cache and throttling are disabled, so each request waits on the stub."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--threads', type=int, default=8, help="WSGI worker threads.")
+        parser.add_argument('--concurrency', type=int, default=200, help="Requests in flight in async run.")
+        parser.add_argument('--delay', type=float, default=0.2, help="Stub response delay in seconds.")
+
+    def handle(self, *args, **options):
+        stub = VehicleAPIStub(models={'fiat': MODELS}, delay=options['delay']).start()
+        get_circuit_breaker.cache_clear()
+        try:
+            with override_settings(
+                VPIC_BASE_URL=stub.url,
+                VPIC_CACHE_TTL=0,
+                VPIC_ASYNC_POOL_SIZE=options['concurrency'],
+                REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}},
+            ):
+                sync_results = self.run_sync(options['requests'], options['threads'])
+                self.report('wsgi', options['threads'], *sync_results)
+                async_results = asyncio.run(self.run_async(options['requests'], options['concurrency']))
+                self.report('asgi', options['concurrency'], *async_results)
+        finally:
+            stub.stop()
+            get_circuit_breaker.cache_clear()
+
+    def run_sync(self, requests, threads):
+        url = reverse('cars:cars_by_make')
+
+        def post(_):
+            return Client().post(url, data={'make': 'fiat'}, content_type='application/json').status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            statuses = list(executor.map(post, range(requests)))
+        return statuses, time.perf_counter() - start
+
+    async def run_async(self, requests, concurrency):
+        url = reverse('cars:async_cars_by_make')
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def post():
+            async with semaphore:
+                return (await client.post(url, data={'make': 'fiat'}, content_type='application/json')).status_code
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(post() for _ in range(requests)))
+        seconds = time.perf_counter() - start
+        await get_async_client().aclose()
+        return statuses, seconds
+
+    def report(self, name, concurrency, statuses, seconds):
+        failed = sum(status_code != 200 for status_code in statuses)
+        self.stdout.write(
+            f'{name}: {len(statuses)} requests, {concurrency} concurrent, {seconds:.2f}s, '
+            f'{len(statuses) / seconds:.0f} requests/s, {failed} failed'
+        )
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from cars.services.rating_partitions import ARCHIVE_SCHEMA, archive_partitions, create_upcoming_partitions, \
+    is_partitioned, list_partitions
+
+
+def month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise CommandError(f'Invalid month "{value}", expected YYYY-MM')
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates monthly partitions of ratings for upcoming months and archives old ones. Archived partitions "
+        f"are detached and moved to \"{ARCHIVE_SCHEMA}\" schema (or dropped), their ratings stop counting in "
+        "car aggregates. Requires ratings partitioned with RATINGS_PARTITIONED on PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=settings.RATINGS_PARTITIONS_AHEAD,
+            help="Number of months after the current one to create partitions for.",
+        )
+        parser.add_argument('--archive-before', type=month, help="Archive partitions of months before YYYY-MM.")
+        parser.add_argument('--drop', action='store_true', help="Drop archived partitions instead of moving them.")
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor):
+                raise CommandError('Ratings table is not partitioned')
+        for name in create_upcoming_partitions(options['months_ahead']):
+            self.stdout.write(f'Created partition {name}')
+        if options['archive_before']:
+            try:
+                archived = archive_partitions(options['archive_before'], drop=options['drop'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            for name in archived:
+                self.stdout.write(f'{"Dropped" if options["drop"] else "Archived"} partition {name}')
+        with connection.cursor() as cursor:
+            partitions = list_partitions(cursor)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(partitions)} monthly partition(s): ' + ', '.join(name for name, _ in partitions)
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from cars.models import Car, CarRatingBucket
+from cars.services.response_cache import invalidate_all
+
+
+class Command(BaseCommand):
+    help = "Backfills or reconciles denormalized rating aggregates and rating buckets of cars with CarRating rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report number of cars with aggregates out of sync.",
+        )
+
+    def handle(self, *args, **options):
+        out_of_sync = Car.objects.out_of_sync().count()
+        self.stdout.write(f'{out_of_sync} car(s) with rating aggregates out of sync')
+        if options['dry_run']:
+            return
+        updated = Car.objects.recompute_rating_aggregates()
+        buckets = CarRatingBucket.objects.rebuild()
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed rating aggregates of {updated} car(s)'))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {buckets} rating bucket(s)'))
@@ -0,0 +1,110 @@
+import asyncio
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from cars.services.metrics import RequestTimings, current_timings, get_request_metrics
+from cars_API.db_routers import reading_from
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures SQL queries, vPIC API requests, serialization and total time of each request. Timings are sent in
+    Server-Timing header and collected into histograms served by MetricsView.
+    Removed from middleware chain when REQUEST_METRICS_ENABLED is off, so disabled instrumentation costs nothing.
+    Works in sync and async chains, so async views aren't moved to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with self.instrumented() as timings:
+            response = self.get_response(request)
+        return self.process_response(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with self.instrumented() as timings:
+            response = await self.get_response(request)
+        return self.process_response(request, response, timings, time.perf_counter() - start)
+
+    @contextmanager
+    def instrumented(self):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                yield timings
+        finally:
+            current_timings.reset(token)
+
+    def process_response(self, request, response, timings, total_seconds):
+        response['Server-Timing'] = timings.server_timing(total_seconds)
+        match = request.resolver_match
+        get_request_metrics().observe(
+            timings,
+            total_seconds,
+            view=match.view_name if match else 'unmatched',
+            method=request.method,
+            status=response.status_code,
+        )
+        return response
+
+
+class ReadReplicaMiddleware:
+    """
+    Sends reads of safe method requests to a random read replica. Client which sent a write request gets a cookie
+    which makes its requests read from primary for READ_REPLICA_STICKY_SECONDS, so it sees its own writes.
+    Removed from middleware chain when READ_REPLICAS_ENABLED is off or there are no replicas.
+    """
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'read_primary'
+
+    def __init__(self, get_response):
+        if not settings.READ_REPLICAS_ENABLED or not settings.READ_REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with reading_from(self.read_database(request)):
+            response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        with reading_from(self.read_database(request)):
+            response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def read_database(self, request):
+        if request.method in SAFE_METHODS and self.cookie_name not in request.COOKIES:
+            return random.choice(settings.READ_REPLICA_DATABASES)
+        return None
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                self.cookie_name, '1', max_age=settings.READ_REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,54 @@
+# Generated by Django 3.2 on 2026-10-18 08:50
+
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, Round
+
+
+def rounded_average(rating_sum, rates_number):
+    return Coalesce(
+        ExpressionWrapper(
+            Round(ExpressionWrapper(rating_sum * 10.0 / NullIf(rates_number, 0), output_field=FloatField())) / 10.0,
+            output_field=FloatField()
+        ),
+        Value(0.0)
+    )
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Car = apps.get_model('cars', 'Car')
+    CarRating = apps.get_model('cars', 'CarRating')
+    ratings = CarRating.objects.filter(car_id=OuterRef('pk')).order_by().values('car_id')
+    rating_sum = Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total')), 0)
+    rates_number = Coalesce(Subquery(ratings.annotate(total=Count('id')).values('total')), 0)
+    Car.objects.update(
+        rating_sum=rating_sum,
+        rates_number=rates_number,
+        avg_rating=rounded_average(rating_sum, rates_number),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='avg_rating',
+            field=models.FloatField(default=0, editable=False, verbose_name='average rating'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rates_number',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of ratings'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='sum of ratings'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
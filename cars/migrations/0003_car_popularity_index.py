@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0002_car_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['-rates_number', '-id'], name='car_popularity_idx'),
+        ),
+    ]
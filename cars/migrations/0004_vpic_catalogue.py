@@ -0,0 +1,47 @@
+# Generated by Django 3.2 on 2026-10-18 08:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0003_car_popularity_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleMake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('make_id', models.PositiveIntegerField(unique=True, verbose_name='vPIC make id')),
+                ('name', models.CharField(max_length=100, verbose_name='name')),
+                ('normalized_name', models.CharField(db_index=True, editable=False, max_length=100, verbose_name='normalized name')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'Vehicle make',
+                'verbose_name_plural': 'Vehicle makes',
+            },
+        ),
+        migrations.CreateModel(
+            name='VehicleModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_id', models.PositiveIntegerField(unique=True, verbose_name='vPIC model id')),
+                ('name', models.CharField(max_length=100, verbose_name='name')),
+                ('normalized_name', models.CharField(editable=False, max_length=100, verbose_name='normalized name')),
+                ('make', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='models', to='cars.vehiclemake', verbose_name='make')),
+            ],
+            options={
+                'verbose_name': 'Vehicle model',
+                'verbose_name_plural': 'Vehicle models',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='vehiclemodel',
+            index=models.Index(fields=['make', 'normalized_name'], name='vehicle_model_lookup_idx'),
+        ),
+    ]
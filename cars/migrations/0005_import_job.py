@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-18 08:58
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0004_vpic_catalogue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('makes', models.JSONField(verbose_name='makes')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('finished', 'Finished')], default='pending', max_length=10, verbose_name='status')),
+                ('total_makes', models.PositiveIntegerField(default=0, verbose_name='number of makes')),
+                ('processed_makes', models.PositiveIntegerField(default=0, verbose_name='number of processed makes')),
+                ('created_cars', models.PositiveIntegerField(default=0, verbose_name='number of created cars')),
+                ('errors', models.JSONField(default=list, verbose_name='errors')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+            ],
+            options={
+                'verbose_name': 'Import job',
+                'verbose_name_plural': 'Import jobs',
+            },
+        ),
+    ]
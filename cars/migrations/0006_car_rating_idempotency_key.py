@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0005_import_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carrating',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='idempotency key'),
+        ),
+    ]
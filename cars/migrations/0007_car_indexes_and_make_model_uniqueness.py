@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0006_car_rating_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='car',
+            constraint=models.UniqueConstraint(fields=('make', 'model'), name='car_make_model_uniq'),
+        ),
+        migrations.AlterField(
+            model_name='car',
+            name='model',
+            field=models.CharField(max_length=100, verbose_name='model'),
+        ),
+        migrations.AddIndex(
+            model_name='carrating',
+            index=models.Index(fields=['car_id', 'rating'], name='car_rating_car_rating_idx'),
+        ),
+        migrations.AlterField(
+            model_name='carrating',
+            name='car_id',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='cars.car', verbose_name='rated car id'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(django.db.models.functions.text.Lower('make'), name='car_make_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 3.2 on 2026-10-18 09:22
+
+from django.db import migrations, models
+import django.db.models.functions.text
+from django.db.models import Count, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
+
+# default RATING_PRIOR_WEIGHT and RATING_PRIOR_MEAN, "recompute_car_ratings" applies changed ones
+PRIOR_WEIGHT, PRIOR_MEAN = 5, 3.0
+
+
+def bayesian_average(rating_sum, rates_number):
+    return Coalesce(
+        ExpressionWrapper(
+            (Value(PRIOR_WEIGHT * PRIOR_MEAN) + rating_sum) * 1.0 / NullIf(Value(PRIOR_WEIGHT) + rates_number, 0),
+            output_field=FloatField()
+        ),
+        Value(PRIOR_MEAN)
+    )
+
+
+def backfill_rating_histograms(apps, schema_editor):
+    Car = apps.get_model('cars', 'Car')
+    CarRating = apps.get_model('cars', 'CarRating')
+    ratings = CarRating.objects.filter(car_id=OuterRef('pk')).order_by().values('car_id')
+    Car.objects.update(
+        bayesian_score=bayesian_average(F('rating_sum'), F('rates_number')),
+        **{
+            f'rating_{rating}_count': Coalesce(
+                Subquery(ratings.filter(rating=rating).annotate(total=Count('id')).values('total')), 0
+            )
+            for rating in range(1, 6)
+        },
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0007_car_indexes_and_make_model_uniqueness'),
+    ]
+
+    operations = [
+        # SQLite rebuilds table on AddField and Django 3.2 can't recreate functional indexes then
+        migrations.RemoveIndex(
+            model_name='car',
+            name='car_make_lower_idx',
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='bayesian_score',
+            field=models.FloatField(default=PRIOR_MEAN, editable=False, verbose_name='bayesian rating score'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of 1 star ratings'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of 2 star ratings'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of 3 star ratings'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of 4 star ratings'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of 5 star ratings'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['-bayesian_score', '-id'], name='car_quality_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(django.db.models.functions.text.Lower('make'), name='car_make_lower_idx'),
+        ),
+        migrations.RunPython(backfill_rating_histograms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2 on 2026-10-18 09:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0008_car_rating_histogram'),
+    ]
+
+    operations = [
+        # existing ratings are left without creation time instead of being counted as created now
+        migrations.AddField(
+            model_name='carrating',
+            name='created_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='created at'),
+        ),
+        migrations.AlterField(
+            model_name='carrating',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, null=True, verbose_name='created at'),
+        ),
+        migrations.CreateModel(
+            name='CarRatingBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4, verbose_name='granularity')),
+                ('start', models.DateTimeField(verbose_name='start')),
+                ('count', models.IntegerField(default=0, verbose_name='number of ratings')),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_buckets', to='cars.car', verbose_name='car')),
+            ],
+            options={
+                'verbose_name': 'Car rating bucket',
+                'verbose_name_plural': 'Car rating buckets',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='carratingbucket',
+            constraint=models.UniqueConstraint(fields=('granularity', 'start', 'car'), name='car_rating_bucket_uniq'),
+        ),
+    ]
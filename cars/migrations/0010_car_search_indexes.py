@@ -0,0 +1,33 @@
+from django.db import migrations
+
+SEARCH_NAME = "lower(make || ' ' || model)"
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    Trigram index serves prefix, word prefix and similarity conditions of cars search, pattern index serves
+    prefix conditions of queries too short to have trigrams. Other databases search with in-memory trie.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(f"CREATE INDEX car_search_trgm_idx ON cars_car USING gin (({SEARCH_NAME}) gin_trgm_ops)")
+    schema_editor.execute(f"CREATE INDEX car_search_prefix_idx ON cars_car (({SEARCH_NAME}) text_pattern_ops)")
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS car_search_trgm_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS car_search_prefix_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0009_rating_buckets'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+RATINGS_TABLE = 'cars_carrating'
+CARS_TABLE = 'cars_car'
+DEFAULT_PARTITION = f'{RATINGS_TABLE}_default'
+IDEMPOTENCY_KEYS_TABLE = f'{RATINGS_TABLE}_idempotency_key'
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(month):
+    return month_start(month + timedelta(days=32))
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+                   [RATINGS_TABLE])
+    return cursor.fetchone()[0]
+
+
+def create_partitions(cursor, first_month, last_month):
+    month = month_start(first_month)
+    while month <= last_month:
+        cursor.execute(
+            f"CREATE TABLE {RATINGS_TABLE}_y{month.year}m{month.month:02} PARTITION OF {RATINGS_TABLE} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [month, next_month(month)],
+        )
+        month = next_month(month)
+
+
+def create_idempotency_keys_table(cursor):
+    """
+    Creates table of idempotency keys of partitioned ratings filled with keys of existing ratings and kept in sync
+    by a trigger, so inserting a rating with a key already saved (also by a concurrent transaction) fails
+    with unique violation like on plain table. Keys of archived ratings stay taken.
+    """
+    cursor.execute(f"CREATE TABLE {IDEMPOTENCY_KEYS_TABLE} (idempotency_key varchar(64) PRIMARY KEY)")
+    cursor.execute(f"""
+        INSERT INTO {IDEMPOTENCY_KEYS_TABLE}
+        SELECT idempotency_key FROM {RATINGS_TABLE} WHERE idempotency_key IS NOT NULL
+    """)
+    cursor.execute(f"""
+        CREATE FUNCTION {IDEMPOTENCY_KEYS_TABLE}_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.idempotency_key IS NOT NULL THEN
+                DELETE FROM {IDEMPOTENCY_KEYS_TABLE} WHERE idempotency_key = OLD.idempotency_key;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.idempotency_key IS NOT NULL THEN
+                INSERT INTO {IDEMPOTENCY_KEYS_TABLE} (idempotency_key) VALUES (NEW.idempotency_key);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {IDEMPOTENCY_KEYS_TABLE}_sync
+        AFTER INSERT OR UPDATE OF idempotency_key OR DELETE ON {RATINGS_TABLE}
+        FOR EACH ROW EXECUTE FUNCTION {IDEMPOTENCY_KEYS_TABLE}_sync()
+    """)
+
+
+def partition_ratings(apps, schema_editor):
+    """
+    Partitions ratings by month on PostgreSQL when RATINGS_PARTITIONED is on. To switch existing database
+    migrate back to 0010 and forward again with the setting changed.
+
+    Rows are copied, ratings without creation time go to the default partition. Partitioned tables can't have
+    unique constraints without partition key, so primary key is replaced with plain index, ids stay unique thanks
+    to the sequence. Idempotency keys are kept unique by a trigger which stores them in IDEMPOTENCY_KEYS_TABLE
+    with its own primary key.
+    """
+    if schema_editor.connection.vendor != 'postgresql' or not settings.RATINGS_PARTITIONED:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            return
+        cursor.execute(f"ALTER TABLE {RATINGS_TABLE} RENAME TO {RATINGS_TABLE}_unpartitioned")
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [f'{RATINGS_TABLE}_unpartitioned'])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"""
+            CREATE TABLE {RATINGS_TABLE} (LIKE {RATINGS_TABLE}_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (created_at)
+        """)
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {RATINGS_TABLE}.id")
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {RATINGS_TABLE} DEFAULT")
+        cursor.execute(f"SELECT min(created_at) FROM {RATINGS_TABLE}_unpartitioned")
+        now = timezone.now()
+        last_month = now
+        for _ in range(settings.RATINGS_PARTITIONS_AHEAD):
+            last_month = next_month(last_month)
+        create_partitions(cursor, cursor.fetchone()[0] or now, last_month)
+        cursor.execute(f"INSERT INTO {RATINGS_TABLE} SELECT * FROM {RATINGS_TABLE}_unpartitioned")
+        cursor.execute(f"DROP TABLE {RATINGS_TABLE}_unpartitioned")
+        cursor.execute(f"CREATE INDEX {RATINGS_TABLE}_id_idx ON {RATINGS_TABLE} (id)")
+        cursor.execute(f"CREATE INDEX {RATINGS_TABLE}_idempotency_key_idx ON {RATINGS_TABLE} (idempotency_key)")
+        cursor.execute(f"CREATE INDEX car_rating_car_rating_idx ON {RATINGS_TABLE} (car_id_id, rating)")
+        cursor.execute(f"""
+            ALTER TABLE {RATINGS_TABLE} ADD CONSTRAINT {RATINGS_TABLE}_car_id_id_fk
+            FOREIGN KEY (car_id_id) REFERENCES {CARS_TABLE} (id) DEFERRABLE INITIALLY DEFERRED
+        """)
+        create_idempotency_keys_table(cursor)
+
+
+def unpartition_ratings(apps, schema_editor):
+    """
+    Replaces partitioned ratings table with a plain table with all constraints of CarRating model. Sequence
+    of the partitioned table is renamed first, so the new table gets the original sequence name. Archived
+    partitions are left untouched.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    model = apps.get_model('cars', 'CarRating')
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return
+        cursor.execute(f"ALTER TABLE {RATINGS_TABLE} RENAME TO {RATINGS_TABLE}_partitioned")
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [f'{RATINGS_TABLE}_partitioned'])
+        cursor.execute(f"ALTER SEQUENCE {cursor.fetchone()[0]} RENAME TO {RATINGS_TABLE}_partitioned_id_seq")
+        cursor.execute("ALTER INDEX car_rating_car_rating_idx RENAME TO car_rating_car_rating_partitioned_idx")
+        schema_editor.create_model(model)
+        columns = ', '.join(field.column for field in model._meta.concrete_fields)
+        cursor.execute(f"INSERT INTO {RATINGS_TABLE} ({columns}) SELECT {columns} FROM {RATINGS_TABLE}_partitioned")
+        cursor.execute(f"""
+            SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 1), max(id) IS NOT NULL)
+            FROM {RATINGS_TABLE}
+        """, [RATINGS_TABLE])
+        cursor.execute(f"DROP TABLE {RATINGS_TABLE}_partitioned")
+        cursor.execute(f"DROP FUNCTION {IDEMPOTENCY_KEYS_TABLE}_sync()")
+        cursor.execute(f"DROP TABLE {IDEMPOTENCY_KEYS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0010_car_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_ratings, unpartition_ratings),
+    ]
@@ -0,0 +1,79 @@
+from django.db import migrations
+from django.db.models import ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import Coalesce, NullIf, Round
+
+RATING_COUNT_FIELDS = [f'rating_{rating}_count' for rating in range(1, 6)]
+AGGREGATE_FIELDS = ['rating_sum', 'rates_number', *RATING_COUNT_FIELDS]
+# default RATING_PRIOR_WEIGHT and RATING_PRIOR_MEAN, "recompute_car_ratings" applies changed ones
+PRIOR_WEIGHT, PRIOR_MEAN = 5, 3.0
+
+
+def normalize_name(value):
+    return value.strip().lower().capitalize()
+
+
+def merge_car(apps, duplicate_id, car_id):
+    """
+    Moves ratings, rating buckets and rating aggregates of duplicate car to the car and deletes the duplicate.
+    """
+    Car = apps.get_model('cars', 'Car')
+    CarRating = apps.get_model('cars', 'CarRating')
+    CarRatingBucket = apps.get_model('cars', 'CarRatingBucket')
+    duplicate = Car.objects.get(id=duplicate_id)
+    CarRating.objects.filter(car_id=duplicate_id).update(car_id=car_id)
+    for bucket in CarRatingBucket.objects.filter(car_id=duplicate_id):
+        same_bucket = CarRatingBucket.objects.filter(car_id=car_id, granularity=bucket.granularity, start=bucket.start)
+        if not same_bucket.update(count=F('count') + bucket.count):
+            CarRatingBucket.objects.filter(id=bucket.id).update(car_id=car_id)
+    Car.objects.filter(id=car_id).update(**{field: F(field) + getattr(duplicate, field) for field in AGGREGATE_FIELDS})
+    duplicate.delete()
+
+
+def merge_duplicate_cars(apps, schema_editor):
+    """
+    Merges cars differing only in case or surrounding whitespace of make and model into the oldest of them
+    and normalizes names of the others, so the case-insensitive unique index can be created.
+    """
+    Car = apps.get_model('cars', 'Car')
+    kept, renamed, merged = {}, {}, set()
+    for car_id, make, model in Car.objects.order_by('id').values_list('id', 'make', 'model').iterator():
+        name = (normalize_name(make), normalize_name(model))
+        if name not in kept:
+            kept[name] = car_id
+            if name != (make, model):
+                renamed[car_id] = name
+            continue
+        merge_car(apps, car_id, kept[name])
+        merged.add(kept[name])
+    for car_id, (make, model) in renamed.items():
+        Car.objects.filter(id=car_id).update(make=make, model=model)
+    Car.objects.filter(id__in=merged).update(
+        avg_rating=Coalesce(
+            ExpressionWrapper(
+                Round(ExpressionWrapper(F('rating_sum') * 10.0 / NullIf(F('rates_number'), 0),
+                                        output_field=FloatField())) / 10.0,
+                output_field=FloatField()
+            ),
+            Value(0.0)
+        ),
+        bayesian_score=ExpressionWrapper(
+            (Value(PRIOR_WEIGHT * PRIOR_MEAN) + F('rating_sum')) * 1.0 / (Value(PRIOR_WEIGHT) + F('rates_number')),
+            output_field=FloatField()
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0011_partitioned_car_ratings'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cars, migrations.RunPython.noop),
+        # Django 3.2 unique constraints can't have expressions, SQLite drops this index when it rebuilds the table
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX car_make_model_lower_uniq ON cars_car (lower(make), lower(model))",
+            "DROP INDEX car_make_model_lower_uniq",
+        ),
+    ]
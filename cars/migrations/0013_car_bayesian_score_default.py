@@ -0,0 +1,23 @@
+import cars.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0012_car_make_model_lower_uniqueness'),
+    ]
+
+    operations = [
+        # 0008 added the column with a fixed default, defaults aren't stored in the database
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='car',
+                    name='bayesian_score',
+                    field=models.FloatField(default=cars.models.prior_rating, editable=False,
+                                            verbose_name='bayesian rating score'),
+                ),
+            ],
+        ),
+    ]
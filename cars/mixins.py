@@ -0,0 +1,84 @@
+import time
+
+from django.conf import settings
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from cars.services.response_cache import get_response_cache
+from cars.throttling import get_upstream_limiter
+from cars_API.db_routers import reading_from_primary
+
+
+class CachedResponseMixin:
+    """
+    Serves GET responses from response cache. Responses carry ETag and Last-Modified headers derived from
+    versions of cached objects, so conditional requests of cached responses are answered with 304 without
+    touching database. On a miss response is rendered first, so missing objects still get 404.
+    Objects changed in last READ_REPLICA_STICKY_SECONDS are read from primary, so response cached under
+    their new version isn't read from a replica which hasn't caught up yet.
+    """
+
+    def cached_response(self, request, key, version_keys, get_response):
+        if not settings.RESPONSE_CACHE_TTL:
+            return get_response()
+        cache = get_response_cache()
+        versions = cache.get_versions(*version_keys)
+        etag = f'"{cache.make_key(key, versions)}"'
+        last_modified = max(versions) // 10 ** 9
+        headers = {'ETag': etag, 'Last-Modified': http_date(last_modified)}
+
+        if (data := cache.get(key, versions)) is not None:
+            if self.is_not_modified(request, etag, last_modified):
+                cache.count('not_modified')
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            cache.count('hits')
+            return Response(data=data, headers={**headers, 'X-Cache': 'HIT'})
+        cache.count('misses')
+        if time.time_ns() - max(versions) < settings.READ_REPLICA_STICKY_SECONDS * 10 ** 9:
+            with reading_from_primary():
+                response = get_response()
+        else:
+            response = get_response()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        cache.set(key, versions, response.data)
+        if self.is_not_modified(request, etag, last_modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        for header, value in {**headers, 'X-Cache': 'MISS'}.items():
+            response[header] = value
+        return response
+
+    @staticmethod
+    def is_not_modified(request, etag, last_modified):
+        """
+        "If-None-Match: *" matches any existing representation, it isn't a cache validator of GET requests,
+        so only exact ETags count.
+        """
+        if if_none_match := request.headers.get('If-None-Match'):
+            return etag in parse_etags(if_none_match)
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return if_modified_since is not None and last_modified <= if_modified_since
+
+
+class UpstreamLimitMixin:
+    """
+    Sheds requests over UPSTREAM_MAX_CONCURRENCY handled at once by the process with 503, for views calling vPIC API.
+    Slot is taken after throttles are checked and released when dispatch ends, also with an unhandled exception.
+    """
+    upstream_limited = True
+    has_upstream_slot = False
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.has_upstream_slot:
+                get_upstream_limiter().release()
+                self.has_upstream_slot = False
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.upstream_limited:
+            get_upstream_limiter().acquire()
+            self.has_upstream_slot = True
@@ -1,40 +1,552 @@
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
-from django.db.models import Avg
-from django.contrib import admin
-from django.utils.functional import cached_property
+from django.db.models import Avg, BooleanField, Case, CharField, Count, ExpressionWrapper, F, FloatField, Func, \
+    IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Lower, NullIf, Power, Round, TruncDay, TruncHour
+from django.utils import timezone
+
+
+def rounded_average(rating_sum, rates_number):
+    """
+    Builds database expression returning average rating rounded to one decimal place or 0 if car has no ratings.
+    """
+    return Coalesce(
+        ExpressionWrapper(
+            Round(ExpressionWrapper(rating_sum * 10.0 / NullIf(rates_number, 0), output_field=FloatField())) / 10.0,
+            output_field=FloatField()
+        ),
+        Value(0.0)
+    )
+
+
+def bayesian_average(rating_sum, rates_number):
+    """
+    Builds database expression returning average rating pulled towards RATING_PRIOR_MEAN as if every car had
+    RATING_PRIOR_WEIGHT extra ratings of that value, so cars with few ratings don't outrank well established ones.
+    """
+    prior_weight, prior_mean = settings.RATING_PRIOR_WEIGHT, settings.RATING_PRIOR_MEAN
+    return Coalesce(
+        ExpressionWrapper(
+            (Value(prior_weight * prior_mean) + rating_sum) * 1.0 / NullIf(Value(prior_weight) + rates_number, 0),
+            output_field=FloatField()
+        ),
+        Value(float(prior_mean))
+    )
+
+
+def histogram_median(histogram):
+    """
+    Returns median of ratings given as list of numbers of 1 to 5 star ratings, 0 if there are no ratings.
+    """
+    count = sum(histogram)
+    if not count:
+        return 0
+
+    def nth(index):
+        for rating, number in enumerate(histogram, start=1):
+            if index < number:
+                return rating
+            index -= number
+
+    return (nth((count - 1) // 2) + nth(count // 2)) / 2
+
+
+def prior_rating():
+    return settings.RATING_PRIOR_MEAN
+
+
+def search_name():
+    """
+    Builds database expression of lowercased "make model" name of a car, on PostgreSQL it matches expression
+    of "car_search_trgm_idx" and "car_search_prefix_idx" indexes.
+    """
+    return Func(
+        F('make'), Value(' '), F('model'),
+        arg_joiner=' || ',
+        template='lower(%(expressions)s)',
+        output_field=CharField()
+    )
+
+
+def trigram_similar(expression, value):
+    """
+    Builds PostgreSQL pg_trgm "%" condition, true when trigram similarity of expression and value
+    is above pg_trgm.similarity_threshold.
+    """
+    return Func(expression, Value(value), arg_joiner=' %% ', template='(%(expressions)s)', output_field=BooleanField())
+
+
+class EpochHours(Func):
+    """
+    Number of hours since Unix epoch of datetime expression.
+    """
+    template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) AS double precision) / 3600'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # julian day number of Unix epoch
+        return self.as_sql(compiler, connection, template='(julianday(%(expressions)s) - 2440587.5) * 24',
+                           **extra_context)
+
+
+# ranks of search matches, lower is better
+SEARCH_MATCH_NAME_PREFIX = 0
+SEARCH_MATCH_WORD_PREFIX = 1
+SEARCH_MATCH_SIMILAR = 2
+
+
+class CarQuerySet(models.QuerySet):
+
+    def apply_rating_deltas(self, deltas):
+        """
+        Updates denormalized rating aggregates of cars in a single UPDATE statement.
+        Takes mapping of (car id, rating) pairs to number of added (positive) or removed (negative) ratings.
+        Aggregates are changed with F expressions so concurrent updates don't overwrite each other.
+        """
+        sums, counts = defaultdict(int), defaultdict(int)
+        histograms = defaultdict(lambda: defaultdict(int))
+        for (car_id, rating), number in deltas.items():
+            sums[car_id] += rating * number
+            counts[car_id] += number
+            histograms[rating][car_id] += number
+        if not counts:
+            return 0
+
+        def per_car(values):
+            return Case(
+                *[When(pk=car_id, then=Value(value)) for car_id, value in values.items()],
+                default=Value(0),
+                output_field=IntegerField()
+            )
+
+        rating_sum = F('rating_sum') + per_car(sums)
+        rates_number = F('rates_number') + per_car(counts)
+        return self.filter(pk__in=counts.keys()).update(
+            rating_sum=rating_sum,
+            rates_number=rates_number,
+            avg_rating=rounded_average(rating_sum, rates_number),
+            bayesian_score=bayesian_average(rating_sum, rates_number),
+            **{
+                Car.rating_count_field(rating): F(Car.rating_count_field(rating)) + per_car(values)
+                for rating, values in histograms.items()
+            },
+        )
+
+    def by_make(self, make):
+        """
+        Filters cars of given make case-insensitively, comparison of lowercased names uses "car_make_lower_idx".
+        """
+        return self.alias(make_lower=Lower('make')).filter(make_lower=make.strip().lower())
+
+    def with_window_ratings(self, window, now=None):
+        """
+        Annotates cars rated within "24h", "7d" or "30d" window with number of their ratings in that window.
+        Counts are summed from hourly or daily CarRatingBucket rows, CarRating rows are not read.
+        """
+        granularity, span = CarRatingBucket.WINDOWS[window]
+        return self.filter(
+            rating_buckets__granularity=granularity,
+            rating_buckets__start__gte=CarRatingBucket.window_start(granularity, span, now),
+            rating_buckets__start__lte=CarRatingBucket.bucket_start(now or timezone.now(), granularity),
+        ).annotate(window_ratings=Sum('rating_buckets__count')).filter(window_ratings__gt=0)
+
+    def with_trending_score(self, now=None):
+        """
+        Annotates cars rated within last RATINGS_TRENDING_HOURS hours with exponentially decayed number of ratings,
+        ratings of each hourly bucket count half as much every RATINGS_TRENDING_HALF_LIFE hours. Weight of a bucket
+        is computed from its age in hours, only buckets of the window ending with current hour are read.
+        """
+        hours = settings.RATINGS_TRENDING_HOURS
+        current_hour = CarRatingBucket.bucket_start(now or timezone.now(), CarRatingBucket.HOUR)
+        age = Round(ExpressionWrapper(
+            Value(current_hour.timestamp() / 3600) - EpochHours('rating_buckets__start'), output_field=FloatField()
+        ))
+        weight = Power(Value(0.5), age / Value(float(settings.RATINGS_TRENDING_HALF_LIFE)))
+        return self.filter(
+            rating_buckets__granularity=CarRatingBucket.HOUR,
+            rating_buckets__start__gt=current_hour - timedelta(hours=hours),
+            rating_buckets__start__lte=current_hour,
+        ).annotate(
+            trending_score=Sum(ExpressionWrapper(F('rating_buckets__count') * weight, output_field=FloatField()))
+        ).filter(trending_score__gt=0)
+
+    def search(self, query):
+        """
+        Filters cars whose name starts with the query, has a word starting with it or, for queries of 3 or more
+        characters, is trigram similar to it. Cars are annotated with "match" rank of those cases.
+        Conditions are served by pg_trgm indexes, so it works on PostgreSQL only.
+        """
+        query = query.strip().lower()
+        queryset = self.alias(search_name=search_name())
+        conditions = Q(search_name__startswith=query) | Q(search_name__contains=f' {query}')
+        if len(query) >= 3:
+            conditions |= Q(trigram_similar(search_name(), query))
+        return queryset.filter(conditions).annotate(match=Case(
+            When(search_name__startswith=query, then=Value(SEARCH_MATCH_NAME_PREFIX)),
+            When(search_name__contains=f' {query}', then=Value(SEARCH_MATCH_WORD_PREFIX)),
+            default=Value(SEARCH_MATCH_SIMILAR),
+            output_field=IntegerField()
+        ))
+
+    def with_actual_rating_aggregates(self):
+        """
+        Annotates cars with rating aggregates computed from CarRating rows instead of denormalized columns.
+        """
+        ratings = CarRating.objects.filter(car_id=OuterRef('pk')).order_by().values('car_id')
+        return self.annotate(
+            actual_rating_sum=Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total')), 0),
+            actual_rates_number=Coalesce(Subquery(ratings.annotate(total=Count('id')).values('total')), 0),
+            actual_avg_rating=Coalesce(Subquery(ratings.annotate(avg=Avg('rating')).values('avg')), 0.0),
+            **{
+                f'actual_{Car.rating_count_field(rating)}': Coalesce(
+                    Subquery(ratings.filter(rating=rating).annotate(total=Count('id')).values('total')), 0
+                )
+                for rating in Car.RATINGS
+            },
+        )
+
+    def out_of_sync(self):
+        return self.with_actual_rating_aggregates().exclude(
+            rating_sum=F('actual_rating_sum'),
+            rates_number=F('actual_rates_number'),
+            **{field: F(f'actual_{field}') for field in Car.rating_count_fields()},
+        )
+
+    def recompute_rating_aggregates(self):
+        """
+        Recomputes denormalized rating aggregates of cars from CarRating rows in a single UPDATE statement.
+        """
+        ratings = CarRating.objects.filter(car_id=OuterRef('pk')).order_by().values('car_id')
+        rating_sum = Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total')), 0)
+        rates_number = Coalesce(Subquery(ratings.annotate(total=Count('id')).values('total')), 0)
+        return self.update(
+            rating_sum=rating_sum,
+            rates_number=rates_number,
+            avg_rating=rounded_average(rating_sum, rates_number),
+            bayesian_score=bayesian_average(rating_sum, rates_number),
+            **{
+                Car.rating_count_field(rating): Coalesce(
+                    Subquery(ratings.filter(rating=rating).annotate(total=Count('id')).values('total')), 0
+                )
+                for rating in Car.RATINGS
+            },
+        )
 
 
 class Car(models.Model):
     make = models.CharField("make", max_length=100)
-    model = models.CharField("model", max_length=100, unique=True)
+    model = models.CharField("model", max_length=100)
+    rating_sum = models.PositiveIntegerField("sum of ratings", default=0, editable=False)
+    rates_number = models.PositiveIntegerField("number of ratings", default=0, editable=False)
+    avg_rating = models.FloatField("average rating", default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField("number of 1 star ratings", default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField("number of 2 star ratings", default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField("number of 3 star ratings", default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField("number of 4 star ratings", default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField("number of 5 star ratings", default=0, editable=False)
+    bayesian_score = models.FloatField("bayesian rating score", default=prior_rating, editable=False)
+
+    RATINGS = range(1, 6)
+
+    objects = CarQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Car"
         verbose_name_plural = "Cars"
+        constraints = [
+            # names are stored normalized and "car_make_model_lower_uniq" unique index on lowercased names, created
+            # by migration 0012, also rejects names differing in case only
+            models.UniqueConstraint(fields=['make', 'model'], name='car_make_model_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['-rates_number', '-id'], name='car_popularity_idx'),
+            models.Index(Lower('make'), name='car_make_lower_idx'),
+            models.Index(fields=['-bayesian_score', '-id'], name='car_quality_idx'),
+        ]
 
     def __str__(self):
         return f'{self.make}: {self.model}'
 
-    @cached_property
-    @admin.display(description="average rating")
-    def avg_rating(self):
-        if car_rating := self.ratings.aggregate(Avg('rating'))['rating__avg']:
-            return round(car_rating, 1)
-        return 0
+    @staticmethod
+    def rating_count_field(rating):
+        return f'rating_{rating}_count'
 
-    @cached_property
-    def rates_number(self):
-        return self.ratings.count()
+    @classmethod
+    def rating_count_fields(cls):
+        return [cls.rating_count_field(rating) for rating in cls.RATINGS]
+
+    @property
+    def rating_histogram(self):
+        return {str(rating): getattr(self, self.rating_count_field(rating)) for rating in self.RATINGS}
+
+    @property
+    def median_rating(self):
+        return histogram_median([getattr(self, field) for field in self.rating_count_fields()])
 
 
 class CarRating(models.Model):
-    car_id = models.ForeignKey('Car', on_delete=models.CASCADE, verbose_name="rated car id", related_name="ratings")
+    car_id = models.ForeignKey('Car', on_delete=models.CASCADE, verbose_name="rated car id", related_name="ratings",
+                               db_index=False)
     rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    idempotency_key = models.CharField("idempotency key", max_length=64, unique=True, null=True, blank=True,
+                                       editable=False)
+    # empty for ratings created before creation time was recorded
+    created_at = models.DateTimeField("created at", default=timezone.now, null=True, editable=False)
 
     class Meta:
         verbose_name = "Car rating"
         verbose_name_plural = "Cars ratings"
+        # with RATINGS_PARTITIONED migration 0011 replaces primary key of "id" and unique "idempotency_key" with
+        # plain indexes and idempotency keys trigger, so migrations changing them must be written by hand for both
+        # table layouts, tests reject autodetected ones
+        indexes = [
+            # replaces foreign key index, covers per car aggregates of ratings
+            models.Index(fields=['car_id', 'rating'], name='car_rating_car_rating_idx'),
+        ]
 
     def __str__(self):
         return f'{self.car_id.model}: {self.rating}'
+
+
+class CarRatingBucketQuerySet(models.QuerySet):
+
+    def apply_rating_deltas(self, deltas):
+        """
+        Updates hourly and daily buckets of ratings with one INSERT of missing buckets and one UPDATE.
+        Takes mapping of (car id, rating creation time) pairs to number of added (positive) or removed (negative)
+        ratings. Counts are changed with F expressions so concurrent updates don't overwrite each other, ratings
+        without creation time or older than the retention of buckets of a granularity are skipped.
+        """
+        retention_starts = CarRatingBucket.retention_starts()
+        buckets = defaultdict(int)
+        for (car_id, created_at), number in deltas.items():
+            if created_at is None:
+                continue
+            for granularity, retention_start in retention_starts.items():
+                if (start := CarRatingBucket.bucket_start(created_at, granularity)) >= retention_start:
+                    buckets[granularity, start, car_id] += number
+        cars_by_delta = defaultdict(list)
+        for (granularity, start, car_id), number in buckets.items():
+            if number:
+                cars_by_delta[granularity, start, number].append(car_id)
+        if not cars_by_delta:
+            return 0
+
+        self.bulk_create(
+            [
+                CarRatingBucket(granularity=granularity, start=start, car_id=car_id)
+                for (granularity, start, number), car_ids in cars_by_delta.items() if number > 0
+                for car_id in car_ids
+            ],
+            ignore_conflicts=True,
+        )
+        return self.filter(
+            reduce(or_, [
+                Q(granularity=granularity, start=start, car_id__in=car_ids)
+                for (granularity, start, _), car_ids in cars_by_delta.items()
+            ])
+        ).update(count=F('count') + Case(
+            *[
+                When(granularity=granularity, start=start, car_id__in=car_ids, then=Value(number))
+                for (granularity, start, number), car_ids in cars_by_delta.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField()
+        ))
+
+    def prune(self, now=None):
+        """
+        Deletes buckets older than the longest window served from them. Returns number of deleted buckets.
+        """
+        return self.filter(reduce(or_, [
+            Q(granularity=granularity, start__lt=retention_start)
+            for granularity, retention_start in CarRatingBucket.retention_starts(now).items()
+        ])).delete()[0]
+
+    def rebuild(self, now=None):
+        """
+        Recreates buckets of the retention period from CarRating rows.
+        """
+        self.all().delete()
+        truncates = {CarRatingBucket.HOUR: TruncHour, CarRatingBucket.DAY: TruncDay}
+        created = 0
+        for granularity, span in CarRatingBucket.retention().items():
+            rows = CarRating.objects.filter(
+                created_at__gte=CarRatingBucket.window_start(granularity, span, now)
+            ).annotate(
+                start=truncates[granularity]('created_at', tzinfo=timezone.utc)
+            ).order_by().values('car_id', 'start').annotate(count=Count('id'))
+            created += len(self.bulk_create(
+                [CarRatingBucket(granularity=granularity, **row) for row in rows.iterator()],
+                batch_size=settings.RATINGS_IMPORT_BATCH_SIZE,
+            ))
+        return created
+
+
+class CarRatingBucket(models.Model):
+    """
+    Number of ratings a car got within an hour or a day, kept up to date on each rating insert and delete,
+    so rankings of time windows are summed from a few buckets per car instead of CarRating rows.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITIES = {
+        HOUR: timedelta(hours=1),
+        DAY: timedelta(days=1),
+    }
+    WINDOWS = {
+        '24h': (HOUR, timedelta(hours=24)),
+        '7d': (DAY, timedelta(days=7)),
+        '30d': (DAY, timedelta(days=30)),
+    }
+
+    car = models.ForeignKey('Car', on_delete=models.CASCADE, verbose_name="car", related_name="rating_buckets")
+    granularity = models.CharField("granularity", max_length=4, choices=[(HOUR, 'Hour'), (DAY, 'Day')])
+    start = models.DateTimeField("start")
+    count = models.IntegerField("number of ratings", default=0)
+
+    objects = CarRatingBucketQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Car rating bucket"
+        verbose_name_plural = "Car rating buckets"
+        constraints = [
+            # also covers window queries: buckets of given granularity starting after given time
+            models.UniqueConstraint(fields=['granularity', 'start', 'car'], name='car_rating_bucket_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.car_id} {self.granularity} {self.start:%Y-%m-%d %H:%M}: {self.count}'
+
+    @classmethod
+    def bucket_start(cls, moment, granularity):
+        start = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        return start.replace(hour=0) if granularity == cls.DAY else start
+
+    @classmethod
+    def window_start(cls, granularity, span, now=None):
+        """
+        Returns start of the oldest bucket of a window ending with current bucket.
+        """
+        return cls.bucket_start(now or timezone.now(), granularity) - span + cls.GRANULARITIES[granularity]
+
+    @classmethod
+    def retention(cls):
+        """
+        Returns mapping of granularity to the longest window served from its buckets.
+        """
+        retention = {cls.HOUR: timedelta(hours=settings.RATINGS_TRENDING_HOURS)}
+        for granularity, span in cls.WINDOWS.values():
+            retention[granularity] = max(retention.get(granularity, span), span)
+        return retention
+
+    @classmethod
+    def retention_starts(cls, now=None):
+        """
+        Returns mapping of granularity to start of the oldest bucket kept.
+        """
+        return {granularity: cls.window_start(granularity, span, now) for granularity, span in cls.retention().items()}
+
+
+class VehicleMakeQuerySet(models.QuerySet):
+
+    def fresh(self):
+        """
+        Filters makes loaded to the catalogue less than VPIC_CATALOGUE_MAX_AGE seconds ago, 0 means they never expire.
+        """
+        if not settings.VPIC_CATALOGUE_MAX_AGE:
+            return self
+        return self.filter(updated_at__gte=timezone.now() - timedelta(seconds=settings.VPIC_CATALOGUE_MAX_AGE))
+
+
+class VehicleMake(models.Model):
+    """
+    Car make from local copy of NHTSA vPIC catalogue, loaded with "load_vpic_catalogue" command.
+    """
+    make_id = models.PositiveIntegerField("vPIC make id", unique=True)
+    name = models.CharField("name", max_length=100)
+    normalized_name = models.CharField("normalized name", max_length=100, db_index=True, editable=False)
+    updated_at = models.DateTimeField("updated at", default=timezone.now)
+
+    objects = VehicleMakeQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Vehicle make"
+        verbose_name_plural = "Vehicle makes"
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = self.name.lower()
+        super().save(*args, **kwargs)
+
+
+class VehicleModel(models.Model):
+    """
+    Car model from local copy of NHTSA vPIC catalogue, loaded with "load_vpic_catalogue" command.
+    """
+    model_id = models.PositiveIntegerField("vPIC model id", unique=True)
+    make = models.ForeignKey('VehicleMake', on_delete=models.CASCADE, verbose_name="make", related_name="models")
+    name = models.CharField("name", max_length=100)
+    normalized_name = models.CharField("normalized name", max_length=100, editable=False)
+
+    class Meta:
+        verbose_name = "Vehicle model"
+        verbose_name_plural = "Vehicle models"
+        indexes = [
+            models.Index(fields=['make', 'normalized_name'], name='vehicle_model_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.make.name}: {self.name}'
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = self.name.lower()
+        super().save(*args, **kwargs)
+
+    def as_vehicle_api_result(self):
+        return {
+            'Make_ID': self.make.make_id,
+            'Make_Name': self.make.name,
+            'Model_ID': self.model_id,
+            'Model_Name': self.name,
+        }
+
+
+class ImportJob(models.Model):
+    """
+    Background import of all models of given makes, each make is imported by separate celery task.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FINISHED, 'Finished'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    makes = models.JSONField("makes")
+    status = models.CharField("status", max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total_makes = models.PositiveIntegerField("number of makes", default=0)
+    processed_makes = models.PositiveIntegerField("number of processed makes", default=0)
+    created_cars = models.PositiveIntegerField("number of created cars", default=0)
+    errors = models.JSONField("errors", default=list)
+    created_at = models.DateTimeField("created at", auto_now_add=True)
+    finished_at = models.DateTimeField("finished at", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Import job"
+        verbose_name_plural = "Import jobs"
+
+    def __str__(self):
+        return f'{self.id}: {self.status}'
@@ -0,0 +1,150 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+INVALID_CURSOR_ERROR_MSG = "Invalid cursor"
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward only keyset pagination. Cursor holds values of ordering fields of the last item on a page,
+    next page is fetched with a WHERE clause on those values, so each page costs an index range scan
+    of page size rows no matter how deep it is. Ordering must end with a unique field.
+    View may set "pinned" value kept in cursors of next pages, e.g. reference time of ranking computed
+    when listed, and read it back with get_pinned(), so all pages are ordered by the same values.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'ordering', self.ordering)
+        self.pinned = getattr(view, 'pinned', None)
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        if position := self.decode_cursor(request, queryset):
+            queryset = queryset.filter(self.after_position_filter(position))
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def after_position_filter(self, position):
+        """
+        Builds lexicographic "comes after" condition, e.g. for ordering ("-rates_number", "-id"):
+        rates_number <= x AND (rates_number < x OR (rates_number = x AND id < y)). The redundant bound
+        of the leading field lets the database start index range scan at the position instead of filtering
+        all entries before it.
+        """
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {previous.lstrip('-'): position[i] for i, previous in enumerate(self.ordering[:index])}
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': position[index]}))
+        first = self.ordering[0]
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+        return bound & reduce(or_, conditions)
+
+    def get_position(self, item):
+        fields = [field.lstrip('-') for field in self.ordering]
+        if isinstance(item, dict):
+            return [item[field] for field in fields]
+        return [getattr(item, field) for field in fields]
+
+    def encode_cursor(self, position):
+        cursor = {'position': position}
+        if self.pinned is not None:
+            cursor['pinned'] = self.pinned
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+    def load_cursor(self, request):
+        """
+        Returns {"position", "pinned"} dict decoded from cursor param, None without cursor. Raises NotFound
+        if it can't be decoded.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(INVALID_CURSOR_ERROR_MSG)
+        if not isinstance(cursor, dict) or not isinstance(cursor.get('position'), list):
+            raise NotFound(INVALID_CURSOR_ERROR_MSG)
+        return cursor
+
+    def get_pinned(self, request):
+        """
+        Returns value pinned by the view in cursor of the request, None on the first page.
+        """
+        cursor = self.load_cursor(request)
+        return cursor.get('pinned') if cursor else None
+
+    def get_ordering_fields(self, queryset):
+        """
+        Returns model fields or output fields of annotations the queryset is ordered by.
+        """
+        fields = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if name in queryset.query.annotations:
+                fields.append(queryset.query.annotations[name].output_field)
+            else:
+                fields.append(queryset.model._meta.get_field(name))
+        return fields
+
+    def decode_cursor(self, request, queryset):
+        """
+        Returns position decoded from cursor param with each value converted to type of its ordering field,
+        raises NotFound if it can't be decoded or doesn't match the ordering.
+        """
+        cursor = self.load_cursor(request)
+        if cursor is None:
+            return None
+        position = cursor['position']
+        if len(position) != len(self.ordering):
+            raise NotFound(INVALID_CURSOR_ERROR_MSG)
+        try:
+            position = [field.to_python(value) for field, value in zip(self.get_ordering_fields(queryset), position)]
+        except ValidationError:
+            raise NotFound(INVALID_CURSOR_ERROR_MSG)
+        if None in position:
+            raise NotFound(INVALID_CURSOR_ERROR_MSG)
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.get_position(self.page[-1])))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -1,22 +1,43 @@
 from rest_framework import serializers
+from rest_framework.validators import UniqueTogetherValidator
 
-from cars.models import Car, CarRating
+from cars.models import Car, CarRating, ImportJob, histogram_median
+from cars.services.car_import import normalize_name
 from cars.services.vehicle_api import VehicleAPICConnector
 
 
 class CarSerializer(serializers.ModelSerializer):
     avg_rating = serializers.ReadOnlyField()
     rates_number = serializers.ReadOnlyField()
+    median_rating = serializers.ReadOnlyField()
+    bayesian_score = serializers.ReadOnlyField()
+    rating_histogram = serializers.ReadOnlyField()
 
     class Meta:
         model = Car
-        fields = ['id', 'make', 'model', 'avg_rating', 'rates_number']
+        fields = ['id', 'make', 'model', 'avg_rating', 'rates_number', 'median_rating', 'bayesian_score',
+                  'rating_histogram']
+        validators = [UniqueTogetherValidator(queryset=Car.objects.all(), fields=['make', 'model'])]
 
     def validate_make(self, value):
-        return value.lower().capitalize()
+        return normalize_name(value)
 
     def validate_model(self, value):
-        return value.lower().capitalize()
+        return normalize_name(value)
+
+
+CAR_VALUES_FIELDS = ['id', 'make', 'model', 'avg_rating', 'rates_number', 'bayesian_score', *Car.rating_count_fields()]
+
+
+def car_values_representation(row):
+    """
+    Turns values() row with CAR_VALUES_FIELDS into the same dict as CarSerializer returns, without instantiating
+    model and serializer.
+    """
+    histogram = [row.pop(field) for field in Car.rating_count_fields()]
+    row['median_rating'] = histogram_median(histogram)
+    row['rating_histogram'] = {str(rating): number for rating, number in zip(Car.RATINGS, histogram)}
+    return row
 
 
 class CreateCarSerializer(CarSerializer):
@@ -43,7 +64,22 @@ class CarRatingSerializer(serializers.ModelSerializer):
 
 class CarPopularitySerializer(serializers.ModelSerializer):
     rates_number = serializers.ReadOnlyField()
+    bayesian_score = serializers.ReadOnlyField()
 
     class Meta:
         model = Car
-        fields = ['id', 'make', 'model', 'rates_number']
+        fields = ['id', 'make', 'model', 'rates_number', 'bayesian_score']
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    makes = serializers.ListField(child=serializers.CharField(max_length=100), allow_empty=False)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'status', 'makes', 'total_makes', 'processed_makes', 'created_cars', 'errors', 'created_at',
+            'finished_at'
+        ]
+        read_only_fields = [
+            'status', 'total_makes', 'processed_makes', 'created_cars', 'errors', 'created_at', 'finished_at'
+        ]
@@ -0,0 +1,113 @@
+import asyncio
+import random
+import time
+import weakref
+from urllib.parse import quote
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from cars.services.metrics import record_upstream
+from cars.services.vehicle_api import RETRY_STATUS_CODES, VehicleAPICConnectionError, VehicleAPICConnector, \
+    get_circuit_breaker, get_vehicle_api_cache
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Returns HTTP client of the running event loop, connections of a client can't be shared between loops.
+    Under ASGI the loop and its client live as long as the worker. Under WSGI Django runs each async view in
+    a new loop, so its client has to be closed with close_async_client() at the end of the request.
+    """
+    loop = asyncio.get_running_loop()
+    if (client := _clients.get(loop)) is None:
+        client = _clients[loop] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=settings.VPIC_ASYNC_POOL_SIZE),
+            timeout=httpx.Timeout(settings.VPIC_READ_TIMEOUT, connect=settings.VPIC_CONNECT_TIMEOUT),
+        )
+    return client
+
+
+async def close_async_client():
+    """
+    Closes HTTP client of the running event loop, if it has one.
+    """
+    if (client := _clients.pop(asyncio.get_running_loop(), None)) is not None:
+        await client.aclose()
+
+
+async def async_request_vehicle_api(path, params=None):
+    """
+    Non-blocking version of request_vehicle_api(), shares its circuit breaker, retries and backoff.
+    """
+    circuit_breaker = get_circuit_breaker()
+    circuit_breaker.before_request()
+    succeeded = False
+    try:
+        data = await _async_get_with_retries(f'{settings.VPIC_BASE_URL}{path}', params)
+        succeeded = True
+    finally:
+        # any other error, also of the trial request, counts as failure, so the trial doesn't stay in progress
+        if succeeded:
+            circuit_breaker.record_success()
+        else:
+            circuit_breaker.record_failure()
+    return data
+
+
+async def _async_get_with_retries(url, params):
+    error = None
+    for attempt in range(settings.VPIC_MAX_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(random.uniform(0, settings.VPIC_BACKOFF_FACTOR * 2 ** (attempt - 1)))
+        start = time.perf_counter()
+        try:
+            response = await get_async_client().get(url, params=params)
+        except httpx.HTTPError as e:
+            record_upstream(time.perf_counter() - start, 'error')
+            error = e
+            continue
+        record_upstream(time.perf_counter() - start, response.status_code)
+        if response.status_code in RETRY_STATUS_CODES:
+            error = f'Vehicle API responded with status {response.status_code}'
+            continue
+        try:
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPStatusError, ValueError) as e:
+            raise VehicleAPICConnectionError(e)
+    raise VehicleAPICConnectionError(error)
+
+
+class AsyncVehicleAPICConnector(VehicleAPICConnector):
+    """
+    VehicleAPICConnector awaiting external API instead of blocking a thread. Local catalogue is read in a thread,
+    validation and formatting of responses are inherited.
+    """
+
+    async def async_get_vehicle_data(self):
+        if (results := await sync_to_async(self.get_catalogue_model)()) is not None:
+            return {'Results': results}
+        return await self.async_get_models_for_make()
+
+    async def async_get_vehicle_models_by_make_data(self):
+        if (results := await sync_to_async(self.get_catalogue_models)()) is not None:
+            return {'Results': results}
+        return await self.async_get_models_for_make()
+
+    async def async_get_models_for_make(self):
+        """
+        Returns models of given make from the cache shared with sync connector, external API is awaited on miss.
+        """
+        if not settings.VPIC_CACHE_TTL:
+            return await self.async_fetch_models_for_make()
+        return await get_vehicle_api_cache().async_get_or_fetch(
+            self.make.strip().lower(), self.async_fetch_models_for_make, self.fetch_models_for_make
+        )
+
+    async def async_fetch_models_for_make(self):
+        return await async_request_vehicle_api(
+            f'vehicles/GetModelsForMake/{quote(self.make)}', params={'format': 'json'}
+        )
@@ -0,0 +1,192 @@
+import csv
+import io
+import json
+import time
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from rest_framework import serializers
+
+from cars.models import Car, CarRating, CarRatingBucket, prior_rating
+from cars.services.car_import import chunks, import_cars
+from cars.services.rating_import import created_at_field, import_ratings
+from cars.services.response_cache import invalidate_all
+
+CAR_FIELDS = ('make', 'model')
+RATING_FIELDS = ('car_id', 'rating', 'created_at')
+
+
+def read_rows(path, fields, file_format):
+    """
+    Iterates over dicts with given fields read from CSV file with header row or from NDJSON file.
+    Missing fields are None.
+    """
+    with open(path, newline='') as input_file:
+        if file_format == 'csv':
+            rows = csv.DictReader(input_file)
+        else:
+            rows = (json.loads(line) for line in input_file if line.strip())
+        for row in rows:
+            yield {field: row.get(field) for field in fields}
+
+
+class CSVStream(io.TextIOBase):
+    """
+    Readable file-like object producing CSV text from rows on demand, lets COPY consume rows without buffering them.
+    """
+
+    def __init__(self, rows, fields):
+        self.lines = self._lines(rows, fields)
+        self.buffer = ''
+        self.rows_read = 0
+
+    def _lines(self, rows, fields):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        for row in rows:
+            self.rows_read += 1
+            writer.writerow(['' if row[field] is None else row[field] for field in fields])
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.lines)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def normalized_name_sql(column):
+    """
+    SQL equivalent of normalize_name(): trimmed value with first letter uppercase and the rest lowercase.
+    """
+    return f"upper(left(trim({column}), 1)) || lower(substr(trim({column}), 2))"
+
+
+def copy_to_staging(cursor, table, rows, fields):
+    cursor.execute(f"CREATE TEMPORARY TABLE {table} ({', '.join(f'{field} text' for field in fields)}) "
+                   f"ON COMMIT DROP")
+    stream = CSVStream(rows, fields)
+    cursor.copy_expert(f"COPY {table} ({', '.join(fields)}) FROM STDIN WITH (FORMAT csv)", stream)
+    return stream.rows_read
+
+
+def load_cars_postgresql(rows):
+    car_table = Car._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        rows_read = copy_to_staging(cursor, 'cars_car_staging', rows, CAR_FIELDS)
+        cursor.execute(f"""
+            INSERT INTO {car_table} (make, model, rating_sum, rates_number, avg_rating, bayesian_score,
+                                     {', '.join(Car.rating_count_fields())})
+            SELECT DISTINCT ON (make, model) make, model, 0, 0, 0, %s, {', '.join('0' for _ in Car.RATINGS)}
+            FROM (
+                SELECT {normalized_name_sql('make')} AS make, {normalized_name_sql('model')} AS model
+                FROM cars_car_staging
+            ) AS normalized
+            WHERE make <> '' AND model <> '' AND length(make) <= 100 AND length(model) <= 100
+            ORDER BY make, model
+            ON CONFLICT DO NOTHING
+        """, [prior_rating()])
+        return rows_read, cursor.rowcount
+
+
+def with_parsed_created_at(rows, counter):
+    """
+    Iterates over rating rows with "created_at" converted to ISO format, rows with invalid one are skipped.
+    Counts all read rows in counter["rows_read"].
+    """
+    for row in rows:
+        counter['rows_read'] += 1
+        try:
+            created_at = created_at_field.run_validation(row['created_at'])
+        except serializers.ValidationError:
+            continue
+        yield {**row, 'created_at': created_at and created_at.isoformat()}
+
+
+def load_ratings_postgresql(rows):
+    rating_table = CarRating._meta.db_table
+    car_column = CarRating._meta.get_field('car_id').column
+    car_table = Car._meta.db_table
+    valid_rows = "car_id ~ '^[0-9]{1,18}$' AND rating IN ('1', '2', '3', '4', '5')"
+    counter = {'rows_read': 0}
+    with transaction.atomic(), connection.cursor() as cursor:
+        copy_to_staging(cursor, 'cars_carrating_staging', with_parsed_created_at(rows, counter), RATING_FIELDS)
+        cursor.execute(f"""
+            INSERT INTO {rating_table} ({car_column}, rating, created_at)
+            SELECT staging.car_id::bigint, staging.rating::smallint, staging.created_at::timestamptz
+            FROM cars_carrating_staging AS staging
+            JOIN {car_table} AS car ON car.id = staging.car_id::bigint
+            WHERE {valid_rows}
+        """)
+        rows_loaded = cursor.rowcount
+        cursor.execute(f"""
+            SELECT car.id, date_trunc('hour', staging.created_at::timestamptz), count(*)
+            FROM cars_carrating_staging AS staging
+            JOIN {car_table} AS car ON car.id = staging.car_id::bigint
+            WHERE {valid_rows} AND staging.created_at::timestamptz >= %s
+            GROUP BY 1, 2
+        """, [min(CarRatingBucket.retention_starts().values())])
+        CarRatingBucket.objects.apply_rating_deltas(
+            {(car_id, created_at): number for car_id, created_at, number in cursor.fetchall()}
+        )
+        Car.objects.filter(
+            pk__in=RawSQL(f"SELECT DISTINCT car_id::bigint FROM cars_carrating_staging WHERE {valid_rows}", [])
+        ).recompute_rating_aggregates()
+        return counter['rows_read'], rows_loaded
+
+
+def load_cars_in_chunks(rows, batch_size):
+    rows_read = rows_loaded = 0
+    for batch in chunks(rows, batch_size):
+        created_ids, _ = import_cars(batch, batch_size=batch_size)
+        rows_read += len(batch)
+        rows_loaded += len(created_ids)
+    return rows_read, rows_loaded
+
+
+def load_ratings_in_chunks(rows, batch_size):
+    rows_read = rows_loaded = 0
+    for batch in chunks(rows, batch_size):
+        created, _ = import_ratings(batch, batch_size=batch_size, with_created_at=True)
+        rows_read += len(batch)
+        rows_loaded += created
+    return rows_read, rows_loaded
+
+
+def bulk_load(path, file_format, fields, load_postgresql, load_in_chunks, batch_size):
+    """
+    Loads rows from file with PostgreSQL COPY into staging table merged with set-based SQL, or with chunked
+    bulk inserts on other databases. Returns dict with number of read and loaded rows, seconds and rows per second.
+    """
+    start = time.perf_counter()
+    rows = read_rows(path, fields, file_format)
+    if connection.vendor == 'postgresql':
+        rows_read, rows_loaded = load_postgresql(rows)
+    else:
+        rows_read, rows_loaded = load_in_chunks(rows, batch_size)
+    invalidate_all()
+    seconds = time.perf_counter() - start
+    return {
+        'rows_read': rows_read,
+        'rows_loaded': rows_loaded,
+        'seconds': seconds,
+        'rows_per_second': rows_read / seconds if seconds else 0,
+    }
+
+
+def load_cars(path, file_format='csv', batch_size=1000):
+    return bulk_load(path, file_format, CAR_FIELDS, load_cars_postgresql, load_cars_in_chunks, batch_size)
+
+
+def load_ratings(path, file_format='csv', batch_size=1000):
+    return bulk_load(path, file_format, RATING_FIELDS, load_ratings_postgresql, load_ratings_in_chunks, batch_size)
@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from cars.services.redis_client import get_redis_client
+
+
+class LocalCache:
+    """
+    In-process cache with per entry expiry time. When it holds max_size entries the least recently used one is evicted.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, expires_at = self._entries[key]
+            except KeyError:
+                return None
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """
+    Cache shared by all processes. Values are stored as JSON under prefixed keys, LRU eviction is left
+    to Redis "maxmemory-policy" setting.
+    """
+
+    def __init__(self, prefix, url=None):
+        self.prefix = prefix
+        self.client = get_redis_client(url)
+
+    def make_key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get(self, key):
+        value = self.client.get(self.make_key(key))
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, timeout=None):
+        self.client.set(self.make_key(key), json.dumps(value), ex=timeout)
+
+    def delete(self, key):
+        self.client.delete(self.make_key(key))
+
+    def lock(self, key, timeout):
+        """
+        Returns lock shared by all processes, it expires after "timeout" seconds if its holder dies.
+        Its token isn't thread local, so async callers can acquire it in a worker thread and release it in the loop.
+        """
+        return self.client.lock(self.make_key(f'lock:{key}'), timeout=timeout, thread_local=False)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.make_key('*')))
+        if keys:
+            self.client.delete(*keys)
+
+
+def get_cache(backend, prefix, max_size=1024, url=None):
+    if backend == 'local':
+        return LocalCache(max_size=max_size)
+    if backend == 'redis':
+        return RedisCache(prefix=prefix, url=url)
+    raise ValueError(f'Unknown cache backend: {backend}')
@@ -0,0 +1,83 @@
+from itertools import islice
+
+from django.conf import settings
+
+from cars.models import Car
+from cars.services.response_cache import invalidate_cars
+
+MAX_NAME_LENGTH = 100
+EMPTY_NAME_ERROR_MSG = "This field may not be blank."
+TOO_LONG_NAME_ERROR_MSG = f"Ensure this field has no more than {MAX_NAME_LENGTH} characters."
+
+
+def normalize_name(value):
+    return value.strip().lower().capitalize()
+
+
+def validate_car(car):
+    """
+    Validates and normalizes single {"make", "model"} dict the same way CarSerializer does.
+    Returns tuple of normalized car and dict of field errors.
+    """
+    normalized, errors = {}, {}
+    for field in ('make', 'model'):
+        value = normalize_name(str(car.get(field) or ''))
+        if not value:
+            errors[field] = [EMPTY_NAME_ERROR_MSG]
+        elif len(value) > MAX_NAME_LENGTH:
+            errors[field] = [TOO_LONG_NAME_ERROR_MSG]
+        normalized[field] = value
+    return normalized, errors
+
+
+def chunks(items, size):
+    """
+    Yields lists of at most "size" items, items can be any iterable and are consumed lazily.
+    """
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def existing_cars(makes_models):
+    """
+    Returns cars with any of given (make, model) pairs, possibly with some other pairs of the same makes and models.
+    Filtering by both columns is served by "car_make_model_uniq" index.
+    """
+    makes, models = zip(*makes_models)
+    return Car.objects.filter(make__in=set(makes), model__in=set(models))
+
+
+def import_cars(cars, batch_size=None):
+    """
+    Validates list of {"make", "model"} dicts in one pass and inserts cars which don't exist yet with bulk_create
+    in chunks of "batch_size" rows. Existing cars and duplicates (same make and model) are skipped.
+    Returns tuple of list of created cars ids and list of {"index", "errors"} dicts of invalid rows.
+    """
+    batch_size = batch_size or settings.CARS_IMPORT_BATCH_SIZE
+    new_cars, errors = {}, []
+    for index, car in enumerate(cars):
+        normalized, car_errors = validate_car(car)
+        if car_errors:
+            errors.append({'index': index, 'errors': car_errors})
+        else:
+            new_cars.setdefault((normalized['make'], normalized['model']), normalized)
+
+    for batch in chunks(list(new_cars), batch_size):
+        for make_model in existing_cars(batch).values_list('make', 'model'):
+            new_cars.pop(make_model, None)
+
+    Car.objects.bulk_create(
+        [Car(**car) for car in new_cars.values()],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    created_ids = []
+    for batch in chunks(new_cars, batch_size):
+        created_ids += [
+            car_id for car_id, make, model in existing_cars(batch).values_list('id', 'make', 'model')
+            if (make, model) in new_cars
+        ]
+    if created_ids:
+        invalidate_cars()
+    return sorted(created_ids), errors
@@ -0,0 +1,63 @@
+import csv
+import json
+
+from django.conf import settings
+
+from cars.models import Car
+from cars.serializers import CAR_VALUES_FIELDS, CarSerializer, car_values_representation
+
+# all fields of CarSerializer after the original export columns, so exported cars have what the API returns
+EXPORT_FIELDS = ['id', 'make', 'model', 'rating_sum', 'rates_number', 'avg_rating']
+EXPORT_FIELDS += [field for field in CarSerializer.Meta.fields if field not in EXPORT_FIELDS]
+# CSV has a column per rating of histogram instead of nested object
+CSV_FIELDS = [field for field in EXPORT_FIELDS if field != 'rating_histogram'] + Car.rating_count_fields()
+
+
+class Echo:
+    """
+    File-like object returning written value instead of storing it, lets csv.writer produce lines lazily.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_rows(chunk_size=None):
+    """
+    Iterates over all cars with their rating aggregates as dicts with EXPORT_FIELDS, represented like
+    by CarSerializer. Rows are fetched with server-side cursor in chunks of "chunk_size" so memory use doesn't
+    depend on table size.
+    """
+    rows = (
+        Car.objects.order_by('id')
+        .values('rating_sum', *CAR_VALUES_FIELDS)
+        .iterator(chunk_size=chunk_size or settings.CARS_EXPORT_CHUNK_SIZE)
+    )
+    return (car_values_representation(row) for row in rows)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps({field: row[field] for field in EXPORT_FIELDS}) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for row in rows:
+        histogram = row.pop('rating_histogram')
+        yield writer.writerow([*(row[field] for field in EXPORT_FIELDS if field in row), *histogram.values()])
+
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
+
+
+def export_cars(export_format, chunk_size=None):
+    """
+    Returns tuple of generator of text lines of all cars in given format and its content type.
+    """
+    lines, content_type = EXPORT_FORMATS[export_format]
+    return lines(export_rows(chunk_size)), content_type
@@ -0,0 +1,210 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Timings of a single request: SQL queries, external API requests and serialization.
+    Shared by threads fetching external API on behalf of the request, so updates are locked.
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.upstream_requests = 0
+        self.upstream_seconds = 0.0
+        self.upstream_statuses = []
+        self.serialization_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper counting queries and their time.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self._lock:
+                self.db_queries += 1
+                self.db_seconds += time.perf_counter() - start
+
+    def add_upstream(self, seconds, status):
+        with self._lock:
+            self.upstream_requests += 1
+            self.upstream_seconds += seconds
+            self.upstream_statuses.append(status)
+
+    def add_serialization(self, seconds):
+        with self._lock:
+            self.serialization_seconds += seconds
+
+    def server_timing(self, total_seconds):
+        """
+        Returns value of Server-Timing header, durations are in milliseconds.
+        """
+        metrics = [
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"',
+            f'serialize;dur={self.serialization_seconds * 1000:.1f}',
+        ]
+        if self.upstream_requests:
+            statuses = ' '.join(str(status) for status in self.upstream_statuses)
+            metrics.append(f'upstream;dur={self.upstream_seconds * 1000:.1f};desc="{statuses}"')
+        metrics.append(f'total;dur={total_seconds * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def record_upstream(seconds, status):
+    """
+    Adds external API request to timings of current request, does nothing outside of instrumented request.
+    """
+    if (timings := current_timings.get()) is not None:
+        timings.add_upstream(seconds, status)
+
+
+@contextmanager
+def timed_serialization():
+    if (timings := current_timings.get()) is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_serialization(time.perf_counter() - start)
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+class Histogram:
+    """
+    Prometheus-style cumulative histogram with separate series per labels set.
+    """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        if (series := self.series.get(key)) is None:
+            series = self.series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+        series['counts'][bisect_left(self.buckets, value)] += 1
+        series['sum'] += value
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for key, series in sorted(self.series.items()):
+            labels = format_labels(key)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series['counts']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series["sum"]}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    metric_type = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, **labels):
+        key = tuple(sorted(labels.items()))
+        self.series[key] = self.series.get(key, 0) + 1
+
+    def set(self, value, **labels):
+        self.series[tuple(sorted(labels.items()))] = value
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.metric_type}']
+        lines += [f'{self.name}{{{format_labels(key)}}} {value}' for key, value in sorted(self.series.items())]
+        return lines
+
+
+class Gauge(Counter):
+    metric_type = 'gauge'
+
+
+def cache_exposition(caches):
+    """
+    Renders lookups and hit rates of caches of current process in Prometheus text format, "caches" maps cache
+    name to its stats(): "hit_rate" and numbers of lookups by result.
+    """
+    lookups = Counter('cache_lookups_total', 'Cache lookups by result.')
+    hit_rate = Gauge('cache_hit_rate', 'Share of cache lookups served without fetching data.')
+    for cache, stats in caches.items():
+        for result, value in stats.items():
+            if result == 'hit_rate':
+                hit_rate.set(value, cache=cache)
+            else:
+                lookups.set(value, cache=cache, result=result)
+    return '\n'.join(lookups.exposition() + hit_rate.exposition()) + '\n'
+
+
+class RequestMetrics:
+    """
+    Metrics of requests handled by current process, rendered in Prometheus text format.
+    """
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            'http_request_duration_seconds', 'Total request time.', DURATION_BUCKETS
+        )
+        self.db_seconds = Histogram(
+            'http_request_db_duration_seconds', 'Time spent in SQL queries per request.', DURATION_BUCKETS
+        )
+        self.db_queries = Histogram(
+            'http_request_db_queries', 'Number of SQL queries per request.', QUERY_COUNT_BUCKETS
+        )
+        self.upstream_seconds = Histogram(
+            'http_request_upstream_duration_seconds', 'Time spent waiting on vPIC API per request.', DURATION_BUCKETS
+        )
+        self.serialization_seconds = Histogram(
+            'http_request_serialization_duration_seconds', 'Time spent rendering response body.', DURATION_BUCKETS
+        )
+        self.upstream_responses = Counter(
+            'vpic_responses_total', 'vPIC API responses by status, "error" for connection errors.'
+        )
+        self._lock = threading.Lock()
+
+    def observe(self, timings, total_seconds, view, method, status):
+        with self._lock:
+            self.request_seconds.observe(total_seconds, view=view, method=method, status=status)
+            self.db_seconds.observe(timings.db_seconds, view=view)
+            self.db_queries.observe(timings.db_queries, view=view)
+            self.serialization_seconds.observe(timings.serialization_seconds, view=view)
+            if timings.upstream_requests:
+                self.upstream_seconds.observe(timings.upstream_seconds, view=view)
+            for upstream_status in timings.upstream_statuses:
+                self.upstream_responses.inc(status=upstream_status)
+
+    def exposition(self):
+        with self._lock:
+            lines = []
+            for metric in (self.request_seconds, self.db_seconds, self.db_queries, self.upstream_seconds,
+                           self.serialization_seconds, self.upstream_responses):
+                lines += metric.exposition()
+        return '\n'.join(lines) + '\n'
+
+
+@lru_cache(maxsize=None)
+def get_request_metrics():
+    return RequestMetrics()
@@ -0,0 +1,122 @@
+import json
+import logging
+import threading
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+
+from cars.services.rating_import import import_ratings
+from cars.services.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class LocalRatingBuffer:
+    """
+    In-process ratings buffer, ratings are visible only to the process which buffered them.
+    Meant for tests and single process deployments.
+    """
+
+    def __init__(self):
+        self._pending = deque()
+        self._processing = []
+        self._lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    def push(self, rating):
+        with self._lock:
+            self._pending.append(rating)
+
+    def take(self, size):
+        """
+        Returns up to "size" ratings which are kept in processing list until ack() is called.
+        Ratings left in processing list by a flush which failed are returned first.
+        """
+        with self._lock:
+            if not self._processing:
+                while self._pending and len(self._processing) < size:
+                    self._processing.append(self._pending.popleft())
+            return list(self._processing)
+
+    def ack(self):
+        with self._lock:
+            self._processing = []
+
+    def __len__(self):
+        return len(self._pending) + len(self._processing)
+
+
+class RedisRatingBuffer:
+    """
+    Ratings buffer shared by all processes, kept in Redis list. Taken ratings are atomically moved to processing list
+    and removed from it only after they are saved, so ratings of a crashed flush are saved by the next one.
+    """
+    key = 'ratings:buffer'
+    processing_key = 'ratings:buffer:processing'
+
+    def __init__(self, url=None):
+        self.client = get_redis_client(url)
+        self.flush_lock = self.client.lock('ratings:buffer:flush', timeout=5 * 60)
+
+    def push(self, rating):
+        self.client.rpush(self.key, json.dumps(rating))
+
+    def take(self, size):
+        if not self.client.llen(self.processing_key):
+            with self.client.pipeline() as pipe:
+                for _ in range(size):
+                    pipe.lmove(self.key, self.processing_key, 'LEFT', 'RIGHT')
+                pipe.execute()
+        return [json.loads(rating) for rating in self.client.lrange(self.processing_key, 0, -1)]
+
+    def ack(self):
+        self.client.delete(self.processing_key)
+
+    def __len__(self):
+        return self.client.llen(self.key) + self.client.llen(self.processing_key)
+
+
+@lru_cache(maxsize=None)
+def get_rating_buffer():
+    if settings.RATINGS_BUFFER_BACKEND == 'local':
+        return LocalRatingBuffer()
+    if settings.RATINGS_BUFFER_BACKEND == 'redis':
+        return RedisRatingBuffer()
+    raise ValueError(f'Unknown ratings buffer backend: {settings.RATINGS_BUFFER_BACKEND}')
+
+
+def buffer_rating(car_id, rating, idempotency_key):
+    """
+    Buffers rating with time it was submitted, which is saved as its creation time.
+    """
+    get_rating_buffer().push({
+        'car_id': car_id, 'rating': rating, 'idempotency_key': idempotency_key,
+        'created_at': timezone.now().isoformat(),
+    })
+
+
+def flush_rating_buffer(flush_size=None):
+    """
+    Saves buffered ratings in chunks of "flush_size" (RATINGS_BUFFER_FLUSH_SIZE by default) until buffer is empty.
+    Each chunk is inserted with bulk insert and per car aggregates are updated with a single statement.
+    Ratings keep the time they were buffered, so they are counted in rating buckets of that time.
+    Ratings are delivered at least once, duplicates are skipped by their idempotency keys.
+    Returns number of saved ratings or None if other flush is in progress.
+    """
+    flush_size = flush_size or settings.RATINGS_BUFFER_FLUSH_SIZE
+    buffer = get_rating_buffer()
+    if not buffer.flush_lock.acquire(blocking=False):
+        return None
+    try:
+        saved = 0
+        while ratings := buffer.take(flush_size):
+            created, errors = import_ratings(ratings, batch_size=flush_size, with_created_at=True)
+            buffer.ack()
+            for error in errors:
+                logger.warning("Dropped buffered rating %s: %s", ratings[error['index']], error['errors'])
+            saved += created
+        return saved
+    finally:
+        buffer.flush_lock.release()
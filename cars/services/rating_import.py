@@ -0,0 +1,131 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from cars.models import Car, CarRating, CarRatingBucket
+from cars.services.car_import import chunks
+from cars.services.response_cache import invalidate_cars
+
+CAR_DOES_NOT_EXIST_ERROR_MSG = 'Invalid pk "{pk_value}" - object does not exist.'
+
+car_id_field = serializers.IntegerField()
+rating_field = serializers.IntegerField(min_value=1, max_value=5)
+idempotency_key_field = serializers.CharField(max_length=64, required=False, allow_null=True)
+
+
+class OptionalDateTimeField(serializers.DateTimeField):
+    """
+    Datetime field treating empty string, e.g. empty CSV cell, as null.
+    """
+
+    def validate_empty_values(self, data):
+        return super().validate_empty_values(None if data == '' else data)
+
+
+created_at_field = OptionalDateTimeField(required=False, allow_null=True)
+
+
+def validate_rating(row, with_created_at=False):
+    """
+    Validates single {"car_id", "rating", "idempotency_key"} dict with the same rules as CarRatingSerializer,
+    except for car existence. Idempotency key is optional, so is "created_at" validated with "with_created_at".
+    Returns tuple of validated values and dict of field errors.
+    """
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ['Invalid data. Expected a dictionary.']}
+    validated, errors = {}, {}
+    fields = (('car_id', car_id_field), ('rating', rating_field), ('idempotency_key', idempotency_key_field))
+    if with_created_at:
+        fields += (('created_at', created_at_field),)
+    for name, field in fields:
+        try:
+            validated[name] = field.run_validation(row.get(name, serializers.empty))
+        except serializers.ValidationError as e:
+            errors[name] = e.detail
+        except serializers.SkipField:
+            validated[name] = None
+    return validated, errors
+
+
+def import_ratings(rows, batch_size=None, with_created_at=False):
+    """
+    Validates list of {"car_id", "rating"} dicts in one pass, checks that rated cars exist with one IN query
+    per chunk, inserts valid ratings with bulk_create in chunks of "batch_size" and updates aggregates and rating
+    buckets of rated cars with one UPDATE each per chunk. Rows with optional "idempotency_key" which was already
+    saved are skipped. Ratings are created now unless "with_created_at" is set, then rows keep their optional
+    "created_at" and ratings without it are saved without creation time, like ratings created before it was
+    recorded.
+    Returns tuple of number of created ratings and list of {"index", "errors"} dicts of invalid rows.
+    """
+    batch_size = batch_size or settings.RATINGS_IMPORT_BATCH_SIZE
+    valid_rows, errors = [], []
+    for index, row in enumerate(rows):
+        validated, row_errors = validate_rating(row, with_created_at)
+        if row_errors:
+            errors.append({'index': index, 'errors': row_errors})
+        else:
+            valid_rows.append((index, validated))
+
+    existing_cars = set()
+    for batch in chunks({row['car_id'] for _, row in valid_rows}, batch_size):
+        existing_cars.update(Car.objects.filter(pk__in=batch).values_list('pk', flat=True))
+    saved_keys = saved_idempotency_keys(
+        {row['idempotency_key'] for _, row in valid_rows if row['idempotency_key']}, batch_size
+    )
+
+    ratings = []
+    for index, row in valid_rows:
+        if row['idempotency_key'] in saved_keys:
+            continue
+        if row['car_id'] in existing_cars:
+            created_at = {'created_at': row['created_at']} if with_created_at else {}
+            ratings.append(CarRating(car_id_id=row['car_id'], rating=row['rating'],
+                                     idempotency_key=row['idempotency_key'], **created_at))
+            if row['idempotency_key']:
+                saved_keys.add(row['idempotency_key'])
+        else:
+            errors.append({'index': index, 'errors': {
+                'car_id': [CAR_DOES_NOT_EXIST_ERROR_MSG.format(pk_value=row['car_id'])]
+            }})
+
+    created = sum(save_ratings(batch, batch_size) for batch in chunks(ratings, batch_size))
+    return created, sorted(errors, key=lambda error: error['index'])
+
+
+def saved_idempotency_keys(keys, batch_size):
+    """
+    Returns those of given idempotency keys which are already saved, checked with one IN query per chunk.
+    """
+    saved_keys = set()
+    for batch in chunks(keys, batch_size):
+        saved_keys.update(
+            CarRating.objects.filter(idempotency_key__in=batch).values_list('idempotency_key', flat=True)
+        )
+    return saved_keys
+
+
+def save_ratings(ratings, batch_size):
+    """
+    Inserts ratings and updates aggregates and rating buckets of rated cars in one transaction. When a concurrent
+    request saved some of idempotency keys since they were checked, ratings with saved keys are dropped and
+    the rest is inserted again. Returns number of inserted ratings.
+    """
+    while True:
+        try:
+            with transaction.atomic():
+                CarRating.objects.bulk_create(ratings)
+                Car.objects.apply_rating_deltas(Counter((rating.car_id_id, rating.rating) for rating in ratings))
+                CarRatingBucket.objects.apply_rating_deltas(
+                    Counter((rating.car_id_id, rating.created_at) for rating in ratings)
+                )
+                invalidate_cars({rating.car_id_id for rating in ratings})
+            return len(ratings)
+        except IntegrityError:
+            saved_keys = saved_idempotency_keys(
+                {rating.idempotency_key for rating in ratings if rating.idempotency_key}, batch_size
+            )
+            if not saved_keys:
+                raise
+            ratings = [rating for rating in ratings if rating.idempotency_key not in saved_keys]
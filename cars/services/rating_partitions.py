@@ -0,0 +1,152 @@
+import logging
+from datetime import datetime, timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from cars.models import Car, CarRating, CarRatingBucket
+from cars.services.response_cache import invalidate_all
+
+logger = logging.getLogger(__name__)
+
+RATINGS_TABLE = CarRating._meta.db_table
+DEFAULT_PARTITION = f'{RATINGS_TABLE}_default'
+IDEMPOTENCY_KEYS_TABLE = f'{RATINGS_TABLE}_idempotency_key'
+ARCHIVE_SCHEMA = 'cars_archive'
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(month):
+    return month_start(month + timedelta(days=32))
+
+
+def partition_name(month):
+    return f'{RATINGS_TABLE}_y{month.year}m{month.month:02}'
+
+
+def is_partitioned(cursor):
+    if cursor.db.vendor != 'postgresql':
+        return False
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+                   [RATINGS_TABLE])
+    return cursor.fetchone()[0]
+
+
+def list_partitions(cursor):
+    """
+    Returns list of (name, first month) tuples of monthly partitions of ratings table, oldest first.
+    """
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(%s) AND child.relname <> %s
+        ORDER BY child.relname
+    """, [RATINGS_TABLE, DEFAULT_PARTITION])
+    return [
+        (name, datetime.strptime(name[-8:], 'y%Ym%m').replace(tzinfo=timezone.utc))
+        for name, in cursor.fetchall()
+    ]
+
+
+def create_partition(cursor, month):
+    """
+    Creates partition of ratings of given month. PostgreSQL can't create a partition while the default one holds
+    its rows, so then the partition is created as a plain table, default partition is detached while the rows
+    are moved to it and both are attached again.
+    """
+    name = partition_name(month)
+    bounds = [month, next_month(month)]
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s)", bounds
+    )
+    if not cursor.fetchone()[0]:
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {RATINGS_TABLE} FOR VALUES FROM (%s) TO (%s)", bounds)
+        return
+    cursor.execute(f"CREATE TABLE {name} (LIKE {RATINGS_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(f"ALTER TABLE {RATINGS_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+    cursor.execute(f"""
+        WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s RETURNING *)
+        INSERT INTO {name} SELECT * FROM moved
+    """, bounds)
+    cursor.execute(f"ALTER TABLE {RATINGS_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+    cursor.execute(f"ALTER TABLE {RATINGS_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+    # trigger of the default partition may have released idempotency keys of moved rows
+    cursor.execute(f"""
+        INSERT INTO {IDEMPOTENCY_KEYS_TABLE}
+        SELECT idempotency_key FROM {name} WHERE idempotency_key IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def create_partitions(cursor, first_month, last_month):
+    """
+    Creates missing monthly partitions from first to last month, returns names of created partitions.
+    Each month is created in its own savepoint, a month which fails is logged and skipped.
+    """
+    existing = {name for name, _ in list_partitions(cursor)}
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        if (name := partition_name(month)) not in existing:
+            try:
+                with transaction.atomic():
+                    create_partition(cursor, month)
+            except DatabaseError:
+                logger.exception("Creating ratings partition %s failed", name)
+            else:
+                created.append(name)
+        month = next_month(month)
+    return created
+
+
+def create_upcoming_partitions(months_ahead):
+    """
+    Creates partitions of current and next "months_ahead" months, does nothing if ratings aren't partitioned.
+    Ratings created after the last partition would land in the default partition, so it should run regularly.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return []
+        now = timezone.now()
+        last_month = now
+        for _ in range(months_ahead):
+            last_month = next_month(last_month)
+        return create_partitions(cursor, now, last_month)
+
+
+def archive_partitions(before, drop=False):
+    """
+    Detaches monthly partitions of ratings created before given month and moves them to ARCHIVE_SCHEMA
+    (or drops them). Detaching costs the same no matter how many rows a partition has, aggregates of rated cars
+    are decreased by one grouped scan of the partition, so archived ratings stop counting like deleted ones.
+    Only partitions older than the longest rating buckets window can be archived.
+    Returns list of archived partitions.
+    """
+    oldest_bucket = min(CarRatingBucket.retention_starts().values())
+    if month_start(before) > oldest_bucket:
+        raise ValueError(f'Only ratings created before {oldest_bucket:%Y-%m-%d} can be archived')
+    archived = []
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            raise ValueError('Ratings table is not partitioned')
+        for name, month in list_partitions(cursor):
+            if month >= month_start(before):
+                break
+            with transaction.atomic():
+                cursor.execute(f"SELECT car_id_id, rating, count(*) FROM {name} GROUP BY car_id_id, rating")
+                Car.objects.apply_rating_deltas(
+                    {(car_id, rating): -number for car_id, rating, number in cursor.fetchall()}
+                )
+                cursor.execute(f"ALTER TABLE {RATINGS_TABLE} DETACH PARTITION {name}")
+                if drop:
+                    cursor.execute(f"DROP TABLE {name}")
+                else:
+                    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+                    cursor.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+                invalidate_all()
+            archived.append(name)
+    return archived
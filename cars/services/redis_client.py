@@ -0,0 +1,13 @@
+from functools import lru_cache
+
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_redis_client(url=None):
+    """
+    Returns Redis client shared by the whole process. Connection pool is created lazily on first command.
+    """
+    import redis
+
+    return redis.Redis.from_url(url or settings.REDIS_URL)
@@ -0,0 +1,100 @@
+import hashlib
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+
+from cars.services.cache import get_cache
+
+GENERATION_KEY = 'generation'
+CARS_LIST_KEY = 'cars'
+
+
+def car_key(car_id):
+    return f'car:{car_id}'
+
+
+def page_key(path):
+    return f'{CARS_LIST_KEY}:{hashlib.md5(path.encode()).hexdigest()}'
+
+
+class ResponseCache:
+    """
+    Caches response data under keys combined with versions of cached objects. Version is a nanosecond timestamp
+    of the last change, so changing data is a single version bump and it also gives Last-Modified time.
+    Global generation is part of every key and bumping it invalidates everything.
+    Versions expire after "version_ttl" seconds (never by default). Backend of a single process doesn't see
+    bumps of other processes, so its versions have to expire like cached data, or ETags would never change.
+    Counts hits, misses and not modified responses of the current process.
+    """
+
+    def __init__(self, backend, ttl, version_ttl=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def get_versions(self, *keys):
+        """
+        Returns versions of global generation and given keys. Missing versions (never changed or evicted)
+        are set to now, which is always safe because it only makes cached entries unreachable.
+        """
+        versions = []
+        for key in (GENERATION_KEY,) + keys:
+            if (version := self.backend.get(f'version:{key}')) is None:
+                version = self.bump(key)
+            versions.append(version)
+        return versions
+
+    def bump(self, *keys):
+        version = time.time_ns()
+        for key in keys:
+            self.backend.set(f'version:{key}', version, timeout=self.version_ttl)
+        return version
+
+    def get(self, key, versions):
+        return self.backend.get(self.make_key(key, versions))
+
+    def set(self, key, versions, data):
+        self.backend.set(self.make_key(key, versions), data, timeout=self.ttl)
+
+    @staticmethod
+    def make_key(key, versions):
+        return f'{key}:{"-".join(map(str, versions))}'
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        requests = self.hits + self.misses + self.not_modified
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'hit_rate': (self.hits + self.not_modified) / requests if requests else 0,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_response_cache():
+    backend = get_cache(settings.RESPONSE_CACHE_BACKEND, prefix='responses', max_size=settings.RESPONSE_CACHE_MAX_SIZE)
+    version_ttl = settings.RESPONSE_CACHE_TTL if settings.RESPONSE_CACHE_BACKEND == 'local' else None
+    return ResponseCache(backend, ttl=settings.RESPONSE_CACHE_TTL, version_ttl=version_ttl)
+
+
+def invalidate_cars(car_ids=()):
+    """
+    Invalidates cached responses of given cars and all pages of cars list once current transaction is committed.
+    """
+    car_ids = list(car_ids)
+    transaction.on_commit(lambda: get_response_cache().bump(CARS_LIST_KEY, *map(car_key, car_ids)))
+
+
+def invalidate_all():
+    transaction.on_commit(lambda: get_response_cache().bump(GENERATION_KEY))
@@ -0,0 +1,120 @@
+import difflib
+import heapq
+import threading
+from functools import lru_cache
+
+from django.db import connection
+
+from cars.models import SEARCH_MATCH_NAME_PREFIX, SEARCH_MATCH_SIMILAR, SEARCH_MATCH_WORD_PREFIX, Car
+from cars.services.response_cache import CARS_LIST_KEY, get_response_cache
+
+SEARCH_FIELDS = ['id', 'make', 'model', 'rates_number', 'avg_rating', 'bayesian_score']
+SIMILAR_WORDS_CUTOFF = 0.7
+
+
+class SearchTrie:
+    """
+    In-memory prefix trie of lowercased car names. Every name is inserted from the start of each of its words,
+    so a lookup finds cars by prefix of the name or of any word. Words are kept separately for fuzzy matching
+    and bayesian scores for ranking. Used instead of pg_trgm indexes on databases other than PostgreSQL.
+    """
+    ids_key = None
+
+    def __init__(self, cars=()):
+        self.root = {}
+        self.words = {}
+        self.scores = {}
+        for car_id, make, model, bayesian_score in cars:
+            self.add(car_id, f'{make} {model}'.lower())
+            self.scores[car_id] = bayesian_score
+
+    def add(self, car_id, name):
+        start = 0
+        for word in name.split(' '):
+            node = self.root
+            for char in name[start:]:
+                node = node.setdefault(char, {})
+            node.setdefault(self.ids_key, {})[car_id] = start == 0
+            self.words.setdefault(word, set()).add(car_id)
+            start += len(word) + 1
+
+    def prefix_matches(self, prefix):
+        """
+        Returns mapping of ids of cars with name or a word of name starting with prefix to their match rank.
+        """
+        node = self.root
+        for char in prefix:
+            if (node := node.get(char)) is None:
+                return {}
+        matches = {}
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            for key, child in node.items():
+                if key is self.ids_key:
+                    for car_id, is_name_prefix in child.items():
+                        match = SEARCH_MATCH_NAME_PREFIX if is_name_prefix else SEARCH_MATCH_WORD_PREFIX
+                        matches[car_id] = min(match, matches.get(car_id, match))
+                else:
+                    nodes.append(child)
+        return matches
+
+    def similar_matches(self, query):
+        """
+        Returns ids of cars with a word similar to the query, as compared by difflib.
+        """
+        if not self.words:
+            return set()
+        words = difflib.get_close_matches(query, self.words, n=len(self.words), cutoff=SIMILAR_WORDS_CUTOFF)
+        return {car_id for word in words for car_id in self.words[word]}
+
+    def search(self, query, limit):
+        """
+        Returns list of up to "limit" ids of best matching cars.
+        """
+        matches = self.prefix_matches(query)
+        if len(query) >= 3:
+            for car_id in self.similar_matches(query):
+                matches.setdefault(car_id, SEARCH_MATCH_SIMILAR)
+        return heapq.nsmallest(limit, matches, key=lambda car_id: (matches[car_id], -self.scores[car_id], car_id))
+
+
+class SearchTrieCache:
+    """
+    Keeps search trie of the current process, rebuilt when version of cars list in response cache changes,
+    which happens on every change of a car or its ratings.
+    """
+
+    def __init__(self):
+        self.trie = None
+        self.versions = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        versions = get_response_cache().get_versions(CARS_LIST_KEY)
+        with self._lock:
+            if versions != self.versions:
+                self.trie = SearchTrie(Car.objects.values_list('id', 'make', 'model', 'bayesian_score').iterator())
+                self.versions = versions
+            return self.trie
+
+
+@lru_cache(maxsize=None)
+def get_search_trie_cache():
+    return SearchTrieCache()
+
+
+def search_cars(query, limit):
+    """
+    Returns up to "limit" dicts of SEARCH_FIELDS of cars matching the query, ordered by match rank
+    (name prefix, word prefix, similar name), then by bayesian score of ratings.
+    PostgreSQL runs single query served by pg_trgm indexes, other databases match names with search trie.
+    """
+    query = query.strip().lower()
+    if connection.vendor == 'postgresql':
+        return list(
+            Car.objects.search(query).order_by('match', '-bayesian_score', 'id').values(*SEARCH_FIELDS)[:limit]
+        )
+    car_ids = get_search_trie_cache().get().search(query, limit)
+    rows = {row['id']: row for row in Car.objects.filter(id__in=car_ids).values(*SEARCH_FIELDS)}
+    return [rows[car_id] for car_id in car_ids if car_id in rows]
@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from cars.services.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# KEYS are buckets, ARGV holds rate and capacity of each of them. Tokens are taken only if every bucket has one,
+# otherwise returns seconds until all of them have. Time is taken from Redis, so app servers clocks don't matter.
+TAKE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate, capacity = tonumber(ARGV[i * 2 - 1]), tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local updated_at = tonumber(state[2]) or now
+    tokens[i] = math.min(capacity, (tonumber(state[1]) or capacity) + math.max(now - updated_at, 0) * rate)
+    if tokens[i] < 1 then
+        wait = math.max(wait, (1 - tokens[i]) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local rate, capacity = tonumber(ARGV[i * 2 - 1]), tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'updated_at', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+end
+return '0'
+"""
+
+
+class LocalTokenBuckets:
+    """
+    In-process token buckets, each process limits only requests it serves. When it holds max_size buckets
+    the least recently used one is evicted, which refills it.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, limits):
+        """
+        Takes a token from each of (key, rate, capacity) buckets if all of them have one, rate is number of tokens
+        added per second. Returns 0 if tokens were taken, otherwise number of seconds until they can be.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens = []
+            for key, rate, capacity in limits:
+                bucket_tokens, updated_at = self._buckets.get(key, (capacity, now))
+                tokens.append(min(capacity, bucket_tokens + (now - updated_at) * rate))
+            wait = max((1 - bucket_tokens) / rate for bucket_tokens, (_, rate, _) in zip(tokens, limits))
+            if wait > 0:
+                return wait
+            for bucket_tokens, (key, _, _) in zip(tokens, limits):
+                self._buckets[key] = (bucket_tokens - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+            return 0
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisTokenBuckets:
+    """
+    Token buckets shared by all processes, all buckets of a request are checked and taken atomically by a Lua script.
+    While Redis is unavailable "fallback" buckets are used instead, so requests are still limited per process.
+    """
+    prefix = 'throttle'
+
+    def __init__(self, fallback, url=None):
+        self.client = get_redis_client(url)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+        self.fallback = fallback
+        self.available = True
+
+    def take(self, limits):
+        try:
+            wait = float(self.script(
+                keys=[f'{self.prefix}:{key}' for key, _, _ in limits],
+                args=[value for _, rate, capacity in limits for value in (rate, capacity)],
+            ))
+        except RedisError:
+            if self.available:
+                logger.warning("Redis is unavailable, throttling with in-process token buckets", exc_info=True)
+            self.available = False
+            return self.fallback.take(limits)
+        self.available = True
+        return wait
+
+
+@lru_cache(maxsize=None)
+def get_token_buckets():
+    local_buckets = LocalTokenBuckets(max_size=settings.THROTTLE_LOCAL_MAX_SIZE)
+    if settings.THROTTLE_BACKEND == 'local':
+        return local_buckets
+    if settings.THROTTLE_BACKEND == 'redis':
+        return RedisTokenBuckets(fallback=local_buckets)
+    raise ValueError(f'Unknown throttle backend: {settings.THROTTLE_BACKEND}')
@@ -1,18 +1,331 @@
-import socket
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from functools import lru_cache
+from urllib.parse import quote
 
+from django.conf import settings
 from rest_framework import status
 from rest_framework.exceptions import APIException, ValidationError
 import requests
+from asgiref.sync import sync_to_async
+from redis.exceptions import LockError
+from requests.adapters import HTTPAdapter
+
+from cars.models import VehicleMake, VehicleModel
+from cars.services.cache import get_cache
+from cars.services.car_import import normalize_name
+from cars.services.metrics import record_upstream
+
+logger = logging.getLogger(__name__)
 
-BASE_URL = 'https://vpic.nhtsa.dot.gov/api/'
 NO_MAKE_ERROR_MSG = "This car make doesn't exist"
 NO_MODEL_ERROR_MSG = "This car model doesn't exist"
+CIRCUIT_OPEN_ERROR_MSG = "Vehicle API is unavailable, try again later"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
 
 class VehicleAPICConnectionError(APIException):
     status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
 
 
+class CircuitBreaker:
+    """
+    Stops calling external API after "failure_threshold" failed requests in a row. While circuit is open calls
+    fail fast, after "reset_timeout" seconds single trial request is let through and closes circuit if it succeeds.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_request(self):
+        with self._lock:
+            if not self.is_open:
+                return
+            if self._trial_in_progress or time.monotonic() - self.opened_at < self.reset_timeout:
+                raise VehicleAPICConnectionError(CIRCUIT_OPEN_ERROR_MSG)
+            self._trial_in_progress = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.is_open or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: only the first one runs, the others wait for it and get its result
+    or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            if leader := key not in self._calls:
+                self._calls[key] = {'done': threading.Event()}
+            call = self._calls[key]
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = func()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+    async def async_do(self, key, func):
+        """
+        do() for coroutine functions, calls are coalesced within event loop. Waiter being cancelled doesn't cancel
+        the shared call.
+        """
+        task_key = (asyncio.get_running_loop(), key)
+        if (task := self._tasks.get(task_key)) is None:
+            task = self._tasks[task_key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+        return await asyncio.shield(task)
+
+
+@lru_cache(maxsize=None)
+def get_circuit_breaker():
+    return CircuitBreaker(
+        failure_threshold=settings.VPIC_CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=settings.VPIC_CIRCUIT_RESET_TIMEOUT,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_session():
+    """
+    Returns HTTP session shared by the whole process, so connections to external API are kept alive and reused.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.VPIC_POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def request_vehicle_api(path, params=None):
+    """
+    Performs GET request to external API and returns decoded json response.
+    Connection errors, timeouts and 429/5xx responses are retried with jittered exponential backoff.
+    Raises VehicleAPICConnectionError when all attempts fail or when circuit breaker is open.
+    """
+    circuit_breaker = get_circuit_breaker()
+    circuit_breaker.before_request()
+    succeeded = False
+    try:
+        data = _get_with_retries(f'{settings.VPIC_BASE_URL}{path}', params)
+        succeeded = True
+    finally:
+        # any other error, also of the trial request, counts as failure, so the trial doesn't stay in progress
+        if succeeded:
+            circuit_breaker.record_success()
+        else:
+            circuit_breaker.record_failure()
+    return data
+
+
+def _get_with_retries(url, params):
+    error = None
+    for attempt in range(settings.VPIC_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(random.uniform(0, settings.VPIC_BACKOFF_FACTOR * 2 ** (attempt - 1)))
+        start = time.perf_counter()
+        try:
+            response = get_session().get(
+                url,
+                params=params,
+                timeout=(settings.VPIC_CONNECT_TIMEOUT, settings.VPIC_READ_TIMEOUT),
+            )
+        except requests.RequestException as e:
+            record_upstream(time.perf_counter() - start, 'error')
+            error = e
+            continue
+        record_upstream(time.perf_counter() - start, response.status_code)
+        if response.status_code in RETRY_STATUS_CODES:
+            error = f'Vehicle API responded with status {response.status_code}'
+            continue
+        try:
+            response.raise_for_status()
+            return response.json()
+        except (requests.HTTPError, ValueError) as e:
+            raise VehicleAPICConnectionError(e)
+    raise VehicleAPICConnectionError(error)
+
+
+class VehicleAPICache:
+    """
+    Caches external API responses per make. Entry is fresh for "ttl" seconds, after that for "stale_ttl" seconds
+    it's still returned while a background thread fetches a new one (stale-while-revalidate).
+    Concurrent misses of the same make share a single fetch (single-flight), with shared backend across processes too.
+    Counts hits, stale hits and misses of the current process.
+    """
+
+    def __init__(self, backend, ttl, stale_ttl, lock_timeout=30):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self.single_flight = SingleFlight()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, key, fetch):
+        entry = self.backend.get(key)
+        if entry is None:
+            self._count('misses')
+            return self.single_flight.do(key, lambda: self.fetch_once(key, fetch))
+        if entry['fresh_until'] <= time.time():
+            self._count('stale_hits')
+            self.refresh_in_background(key, fetch)
+        else:
+            self._count('hits')
+        return entry['data']
+
+    async def async_get_or_fetch(self, key, async_fetch, fetch):
+        """
+        get_or_fetch() awaiting "async_fetch" on miss, stale entries are refreshed with "fetch" in background thread.
+        Cache backend (redis) is blocking, so it's called in a thread, not on the event loop.
+        """
+        entry = await sync_to_async(self.backend.get, thread_sensitive=False)(key)
+        if entry is None:
+            self._count('misses')
+            return await self.single_flight.async_do(key, lambda: self.async_fetch_once(key, async_fetch))
+        if entry['fresh_until'] <= time.time():
+            self._count('stale_hits')
+            self.refresh_in_background(key, fetch)
+        else:
+            self._count('hits')
+        return entry['data']
+
+    def fetch_once(self, key, fetch):
+        """
+        Fetches and stores missing entry. With backend shared by processes (redis) it's done under lock,
+        processes which wait for the lock get entry stored by its holder. If waiting takes longer than
+        "lock_timeout" seconds entry is fetched anyway.
+        """
+        if not hasattr(self.backend, 'lock'):
+            return self.store(key, fetch())
+        lock = self.backend.lock(key, timeout=self.lock_timeout)
+        acquired = lock.acquire(blocking_timeout=self.lock_timeout)
+        try:
+            if (data := self.get_fresh(key)) is not None:
+                return data
+            return self.store(key, fetch())
+        finally:
+            self.release(lock, acquired)
+
+    async def async_fetch_once(self, key, async_fetch):
+        store = sync_to_async(self.store, thread_sensitive=False)
+        if not hasattr(self.backend, 'lock'):
+            return await store(key, await async_fetch())
+        lock = self.backend.lock(key, timeout=self.lock_timeout)
+        acquired = await sync_to_async(lock.acquire, thread_sensitive=False)(blocking_timeout=self.lock_timeout)
+        try:
+            if (data := await sync_to_async(self.get_fresh, thread_sensitive=False)(key)) is not None:
+                return data
+            return await store(key, await async_fetch())
+        finally:
+            await sync_to_async(self.release, thread_sensitive=False)(lock, acquired)
+
+    def get_fresh(self, key):
+        entry = self.backend.get(key)
+        return entry['data'] if entry is not None and entry['fresh_until'] > time.time() else None
+
+    @staticmethod
+    def release(lock, acquired):
+        if not acquired:
+            return
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("Vehicle API cache lock expired before fetch finished")
+
+    def store(self, key, data):
+        self.backend.set(key, {'data': data, 'fresh_until': time.time() + self.ttl}, timeout=self.ttl + self.stale_ttl)
+        return data
+
+    def refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+
+    def _refresh(self, key, fetch):
+        try:
+            self.store(key, fetch())
+        except Exception:
+            logger.warning("Refreshing vehicle API cache entry %s failed", key, exc_info=True)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.stale_hits) / lookups if lookups else 0,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_vehicle_api_cache():
+    backend = get_cache(
+        settings.VPIC_CACHE_BACKEND,
+        prefix='vpic',
+        max_size=settings.VPIC_CACHE_MAX_SIZE,
+    )
+    return VehicleAPICache(
+        backend,
+        ttl=settings.VPIC_CACHE_TTL,
+        stale_ttl=settings.VPIC_CACHE_STALE_TTL,
+        lock_timeout=settings.VPIC_CACHE_LOCK_TIMEOUT,
+    )
+
+
 class VehicleAPICConnector:
 
     def __init__(self, car_data):
@@ -21,16 +334,12 @@ class VehicleAPICConnector:
 
     def get_vehicle_data(self):
         """
-        Method performs request to external API to check if requested car make exists.
+        Method checks if requested car make exists, first in local catalogue and then in external API.
         Returns json response with list of models or empty list if there is no such car make.
         """
-        try:
-            response = requests.get(
-                url=f'{BASE_URL}vehicles/getmodelsformake/{self.make}?format=json',
-            )
-        except socket.error as e:
-            raise VehicleAPICConnectionError(e)
-        return response.json()
+        if (results := self.get_catalogue_model()) is not None:
+            return {'Results': results}
+        return self.get_models_for_make()
 
     def validate_vehicle_data(self, response):
         if not response.get('Results'):
@@ -46,16 +355,48 @@ class VehicleAPICConnector:
 
     def get_vehicle_models_by_make_data(self):
         """
-        Method performs request to external API to get a list of models of given make.
+        Method gets a list of models of given make, first from local catalogue and then from external API.
         Returns json response with a list of models of given make or empty list if there is no such car make.
         """
-        try:
-            response = requests.get(
-                url=f'{BASE_URL}/vehicles/GetModelsForMake/{self.make}?format=json'
-            )
-        except socket.error as e:
-            raise VehicleAPICConnectionError(e)
-        return response.json()
+        if (results := self.get_catalogue_models()) is not None:
+            return {'Results': results}
+        return self.get_models_for_make()
+
+    def get_catalogue_model(self):
+        """
+        Looks up requested model in local catalogue with a single indexed query.
+        Returns list with matching model, list of all models of the make if model is missing or None if make
+        is not in the catalogue or it's stale.
+        """
+        vehicle_models = VehicleModel.objects.select_related('make').filter(
+            make__in=VehicleMake.objects.fresh().filter(normalized_name=self.make.strip().lower()),
+            normalized_name=self.model.strip().lower(),
+        )
+        if results := [vehicle_model.as_vehicle_api_result() for vehicle_model in vehicle_models]:
+            return results
+        return self.get_catalogue_models()
+
+    def get_catalogue_models(self):
+        """
+        Returns list of all models of requested make from local catalogue or None if make is not in the catalogue
+        or it's stale.
+        """
+        makes = list(VehicleMake.objects.fresh().filter(normalized_name=self.make.strip().lower()))
+        if not makes:
+            return None
+        vehicle_models = VehicleModel.objects.select_related('make').filter(make__in=makes).order_by('model_id')
+        return [vehicle_model.as_vehicle_api_result() for vehicle_model in vehicle_models]
+
+    def get_models_for_make(self):
+        """
+        Returns cached list of models of given make, external API is requested only on cache miss.
+        """
+        if not settings.VPIC_CACHE_TTL:
+            return self.fetch_models_for_make()
+        return get_vehicle_api_cache().get_or_fetch(self.make.strip().lower(), self.fetch_models_for_make)
+
+    def fetch_models_for_make(self):
+        return request_vehicle_api(f'vehicles/GetModelsForMake/{quote(self.make)}', params={'format': 'json'})
 
     def formatted_vehicle_data(self, result_list):
         """
@@ -64,24 +405,60 @@ class VehicleAPICConnector:
         If list is not empty checks if car model passed in car_data variable is present in the list of models.
         If it's present it returns dict which contain car data, else returns response ValidationError - no such model.
         """
-        if result := [result for result in result_list if result['Model_Name'] == self.model]:
-            formatted_result = result[0]
-            if formatted_result.get("Make_ID"):
-                formatted_result.pop("Make_ID")
-            if formatted_result.get("Model_ID"):
-                formatted_result.pop("Model_ID")
-            formatted_result["make"] = formatted_result.pop("Make_Name")
-            formatted_result["model"] = formatted_result.pop("Model_Name")
-            return formatted_result
+        model = self.model.lower()
+        if result := [result for result in result_list if result['Model_Name'].lower() == model]:
+            return self.formatted_vehicle(result[0])
         else:
             raise ValidationError(NO_MODEL_ERROR_MSG)
 
     def formatted_vehicles_data(self, results_list):
-        for result in results_list:
-            if result.get("Make_ID"):
-                result.pop("Make_ID")
-            if result.get("Model_ID"):
-                result.pop("Model_ID")
-            result["make"] = result.pop("Make_Name")
-            result["model"] = result.pop("Model_Name")
-        return results_list
+        return [self.formatted_vehicle(result) for result in results_list]
+
+    @staticmethod
+    def formatted_vehicle(result):
+        """
+        Returns copy of external API result with "Make_Name" and "Model_Name" renamed to "make" and "model",
+        normalized like names of all cars, and without ids. Results are not changed in place because they can be
+        shared through the cache.
+        """
+        formatted_result = {
+            key: value for key, value in result.items()
+            if key not in ("Make_ID", "Model_ID", "Make_Name", "Model_Name")
+        }
+        formatted_result["make"] = normalize_name(result["Make_Name"])
+        formatted_result["model"] = normalize_name(result["Model_Name"])
+        return formatted_result
+
+
+def get_vehicle_models_by_makes_data(makes, max_workers=None):
+    """
+    Gets lists of models of many makes at once. Makes are deduplicated case-insensitively, makes present in local
+    catalogue are read from it and the rest is fetched from external API in a thread pool with at most
+    "max_workers" (VPIC_MAX_CONCURRENCY by default) requests in flight, so it takes about as long as the slowest fetch.
+    Returns dict mapping make to json response or to APIException raised while fetching it.
+    """
+    unique_makes = {}
+    for make in makes:
+        unique_makes.setdefault(make.strip().lower(), make.strip())
+    responses, connectors = {}, []
+    for make in unique_makes.values():
+        connector = VehicleAPICConnector({"make": make})
+        if (results := connector.get_catalogue_models()) is not None:
+            responses[make] = {'Results': results}
+        else:
+            connectors.append(connector)
+    if not connectors:
+        return responses
+    max_workers = min(max_workers or settings.VPIC_MAX_CONCURRENCY, len(connectors))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # each fetch runs in a copy of caller's context, so it's recorded in timings of current request
+        futures = {
+            executor.submit(copy_context().run, connector.get_models_for_make): connector.make
+            for connector in connectors
+        }
+        for future in as_completed(futures):
+            try:
+                responses[futures[future]] = future.result()
+            except APIException as e:
+                responses[futures[future]] = e
+    return responses
@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+MODELS_FOR_MAKE_PATH = '/api/vehicles/GetModelsForMake/'
+
+
+class VehicleAPIStubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.server.requests.append(path)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if self.server.take_failure():
+            return self.respond(503, {'Message': 'Service Unavailable'})
+        if not path.startswith(MODELS_FOR_MAKE_PATH):
+            return self.respond(404, {'Message': 'Not Found'})
+        make = unquote(path[len(MODELS_FOR_MAKE_PATH):])
+        results = self.server.models.get(make.lower(), [])
+        self.respond(200, {'Count': len(results), 'Results': results})
+
+    def respond(self, status_code, data):
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class VehicleAPIStub(ThreadingHTTPServer):
+    """
+    Local HTTP server imitating NHTSA vPIC "GetModelsForMake" endpoint, used in tests and load tests.
+    "models" maps lowercase make to list of results, "failures" is number of next requests answered with 503
+    and "delay" is number of seconds each response is delayed by.
+    """
+    daemon_threads = True
+
+    def __init__(self, models=None, delay=0):
+        super().__init__(('127.0.0.1', 0), VehicleAPIStubHandler)
+        self.models = models or {}
+        self.delay = delay
+        self.failures = 0
+        self.requests = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/api/'
+
+    def take_failure(self):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                return True
+            return False
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
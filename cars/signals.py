@@ -0,0 +1,32 @@
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from cars.models import Car, CarRating, CarRatingBucket
+from cars.services.response_cache import invalidate_cars
+
+
+@receiver(post_save, sender=CarRating)
+def add_rating_to_car_aggregates(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Car.objects.apply_rating_deltas(Counter({(instance.car_id_id, instance.rating): 1}))
+        CarRatingBucket.objects.apply_rating_deltas(Counter({(instance.car_id_id, instance.created_at): 1}))
+
+
+@receiver(post_delete, sender=CarRating)
+def remove_rating_from_car_aggregates(sender, instance, **kwargs):
+    Car.objects.apply_rating_deltas(Counter({(instance.car_id_id, instance.rating): -1}))
+    CarRatingBucket.objects.apply_rating_deltas(Counter({(instance.car_id_id, instance.created_at): -1}))
+
+
+@receiver(post_save, sender=CarRating)
+@receiver(post_delete, sender=CarRating)
+def invalidate_rated_car_responses(sender, instance, **kwargs):
+    invalidate_cars([instance.car_id_id])
+
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+def invalidate_car_responses(sender, instance, **kwargs):
+    invalidate_cars([instance.pk])
@@ -0,0 +1,83 @@
+import logging
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from cars.models import CarRatingBucket, ImportJob
+from cars.services.car_import import import_cars
+from cars.services.rating_buffer import flush_rating_buffer
+from cars.services.rating_partitions import create_upcoming_partitions
+from cars.services.vehicle_api import VehicleAPICConnector
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FAILED_ERROR_MSG = "Import of this make failed unexpectedly"
+
+
+@shared_task
+def import_make(job_id, make):
+    """
+    Imports all models of a make and increments progress of the job.
+    Returns dict with number of created cars and list of errors which is collected by finish_import_job task.
+    Any failure is recorded as error of the make, so the chord always reaches finish_import_job.
+    """
+    created, errors = 0, []
+    try:
+        connector = VehicleAPICConnector({"make": make})
+        list_of_cars = connector.get_vehicle_models_by_make_data()
+        formatted_list_of_cars = connector.validate_vehicles_by_make_data(list_of_cars)
+        created_cars_ids, car_errors = import_cars(formatted_list_of_cars)
+        created = len(created_cars_ids)
+        errors = [{'make': make, 'car': formatted_list_of_cars[error['index']], 'errors': error['errors']}
+                  for error in car_errors]
+    except APIException as e:
+        errors = [{'make': make, 'errors': e.detail}]
+    except Exception:
+        logger.exception("Importing make %s of import job %s failed", make, job_id)
+        errors = [{'make': make, 'errors': [IMPORT_FAILED_ERROR_MSG]}]
+    ImportJob.objects.filter(pk=job_id).update(
+        status=ImportJob.RUNNING,
+        processed_makes=F('processed_makes') + 1,
+        created_cars=F('created_cars') + created,
+    )
+    return {'created': created, 'errors': errors}
+
+
+@shared_task
+def finish_import_job(results, job_id):
+    ImportJob.objects.filter(pk=job_id).update(
+        status=ImportJob.FINISHED,
+        errors=[error for result in results for error in result['errors']],
+        finished_at=timezone.now(),
+    )
+
+
+def start_import_job(makes):
+    """
+    Creates import job and fans it out to one import_make task per make, finish_import_job runs when all are done.
+    """
+    unique_makes = {}
+    for make in makes:
+        unique_makes.setdefault(make.strip().lower(), make.strip())
+    makes = list(unique_makes.values())
+    job = ImportJob.objects.create(makes=makes, total_makes=len(makes))
+    chord(import_make.s(str(job.id), make) for make in makes)(finish_import_job.s(str(job.id)))
+    return job
+
+
+@shared_task
+def flush_buffered_ratings():
+    return flush_rating_buffer()
+
+
+@shared_task
+def prune_rating_buckets():
+    return CarRatingBucket.objects.prune()
+
+
+@shared_task
+def create_rating_partitions():
+    return create_upcoming_partitions(settings.RATINGS_PARTITIONS_AHEAD)
@@ -1,10 +1,47 @@
+import asyncio
+import base64
+import importlib
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 import pytest
+from django.core.management import CommandError, call_command
+from django.apps import apps as django_apps
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.operations import AddConstraint, RemoveConstraint
+from django.db.migrations.state import ProjectState
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from redis.exceptions import LockNotOwnedError
+from redis.lock import Lock
 from rest_framework import status
 
-from cars.services.vehicle_api import NO_MAKE_ERROR_MSG, NO_MODEL_ERROR_MSG
+from cars.factories import CarFactory, CarRatingFactory
+from cars.models import Car, CarRating, CarRatingBucket, ImportJob, VehicleMake, VehicleModel, histogram_median, \
+    prior_rating
+from cars.pagination import INVALID_CURSOR_ERROR_MSG, KeysetPagination
+from cars.serializers import CarPopularitySerializer, CarSerializer
+from cars.services.async_vehicle_api import AsyncVehicleAPICConnector, get_async_client
+from cars.services.bulk_load import CSVStream, load_cars_postgresql, load_ratings_postgresql
+from cars.services.cache import LocalCache, RedisCache
+from cars.services.car_import import existing_cars, import_cars
+from cars.services.rating_buffer import flush_rating_buffer
+from cars.services.response_cache import get_response_cache
+from cars.services.rating_partitions import archive_partitions, create_upcoming_partitions, month_start, next_month, \
+    partition_name
+from cars.services.token_buckets import LocalTokenBuckets, RedisTokenBuckets
+from cars_API.db_routers import reading_from
+from cars.services.vehicle_api import NO_MAKE_ERROR_MSG, NO_MODEL_ERROR_MSG, CIRCUIT_OPEN_ERROR_MSG, \
+    VehicleAPICache, VehicleAPICConnectionError, VehicleAPICConnector, get_vehicle_models_by_makes_data
+from cars.tasks import IMPORT_FAILED_ERROR_MSG
+from cars.throttling import parse_rate
 
 pytestmark = pytest.mark.django_db
 
@@ -71,7 +108,7 @@ def test_create_car(client):
     assert response.status_code == status.HTTP_201_CREATED
 
     assert response.json().get("model") == "Freemont"
-    assert response.json().get("make") == "FIAT"
+    assert response.json().get("make") == "Fiat"
 
 
 def test_get_details_of_a_car(client, car):
@@ -125,12 +162,101 @@ def test_create_car_rating(client, car):
     assert response.status_code == status.HTTP_201_CREATED
 
 
+# tests for denormalized rating aggregates
+
+def test_creating_ratings_updates_car_aggregates(car):
+    CarRatingFactory(car_id=car, rating=5)
+    CarRatingFactory(car_id=car, rating=4)
+    car.refresh_from_db()
+    assert (car.rating_sum, car.rates_number, car.avg_rating) == (9, 2, 4.5)
+
+
+def test_deleting_rating_updates_car_aggregates(car):
+    CarRatingFactory(car_id=car, rating=5)
+    rating = CarRatingFactory(car_id=car, rating=2)
+    CarRatingFactory(car_id=car, rating=2)
+    rating.delete()
+    car.refresh_from_db()
+    assert (car.rating_sum, car.rates_number, car.avg_rating) == (7, 2, 3.5)
+    car.ratings.all().delete()
+    car.refresh_from_db()
+    assert (car.rating_sum, car.rates_number, car.avg_rating) == (0, 0, 0)
+
+
+def test_cars_list_runs_single_query(client, django_assert_num_queries):
+    for car in CarFactory.create_batch(5):
+        CarRatingFactory.create_batch(3, car_id=car)
+    with django_assert_num_queries(1):
+        response = client.get(reverse("cars:cars-list"))
+    assert len(response.json()) == 5
+
+
+def test_recompute_car_ratings_command_reconciles_aggregates(car):
+    CarRatingFactory.create_batch(3, car_id=car, rating=3)
+    CarRatingFactory(car_id=car, rating=4)
+    Car.objects.update(rating_sum=0, rates_number=0, avg_rating=0)
+    assert Car.objects.out_of_sync().count() == 1
+    call_command("recompute_car_ratings")
+    car.refresh_from_db()
+    assert (car.rating_sum, car.rates_number, car.avg_rating) == (13, 4, 3.3)
+    assert Car.objects.out_of_sync().count() == 0
+
+
+def test_migration_backfills_rating_aggregates(car):
+    migration = importlib.import_module('cars.migrations.0002_car_rating_aggregates')
+    CarRatingFactory.create_batch(3, car_id=car, rating=3)
+    CarRatingFactory(car_id=car, rating=4)
+    CarFactory()
+    Car.objects.update(rating_sum=0, rates_number=0, avg_rating=1)
+    migration.backfill_rating_aggregates(django_apps, None)
+    assert list(Car.objects.order_by('id').values_list('rating_sum', 'rates_number', 'avg_rating')) == [
+        (13, 4, 3.3), (0, 0, 0)
+    ]
+
+
 # test for popular list
 
 def test_popular_car_list_returns_empty_list(client):
     response = client.get(reverse("cars:popular"))
     assert response.status_code == status.HTTP_200_OK
-    assert response.json() == []
+    assert response.json() == {'next': None, 'results': []}
+
+
+def test_popular_car_list_pages_through_cars_by_number_of_ratings(client, django_assert_num_queries):
+    cars = CarFactory.create_batch(5)
+    for rates_number, car in zip([2, 0, 3, 2, 1], cars):
+        CarRatingFactory.create_batch(rates_number, car_id=car)
+    expected = [cars[2].id, cars[3].id, cars[0].id, cars[4].id, cars[1].id]
+
+    received = []
+    url = reverse("cars:popular") + "?page_size=2"
+    while url:
+        with django_assert_num_queries(1):
+            response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        received += [car["id"] for car in response.json()["results"]]
+        url = response.json()["next"]
+    assert received == expected
+
+
+@pytest.mark.parametrize("cursor", [
+    "invalid", b'[1, 2]', b'{"position": [{"a": 1}, "x"]}', b'{"position": [null, 1]}', b'{"position": [1, "x"]}',
+    b'{"position": [1]}', b'{"position": 1}',
+])
+@pytest.mark.parametrize("params", [{}, {"sort": "trending"}, {"window": "24h"}])
+def test_popular_car_list_rejects_invalid_cursor(client, cursor, params):
+    if isinstance(cursor, bytes):
+        cursor = base64.urlsafe_b64encode(cursor).decode()
+    response = client.get(reverse("cars:popular"), {**params, "cursor": cursor})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": INVALID_CURSOR_ERROR_MSG}
+
+
+@pytest.mark.parametrize("pinned", ['"yesterday"', '"2026-10-18T10:00:00"', '1'])
+def test_trending_car_list_rejects_cursor_with_invalid_ranking_time(client, pinned):
+    cursor = base64.urlsafe_b64encode(f'{{"position": [1, 2], "pinned": {pinned}}}'.encode()).decode()
+    response = client.get(reverse("cars:popular"), {"sort": "trending", "cursor": cursor})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
 
 
 # tests for get car models by make
@@ -174,10 +300,12 @@ def test_all_cars_by_make_creates_three_objs_from_response(client):
         }
     )
     assert response.status_code == status.HTTP_201_CREATED
+    no_ratings = {'avg_rating': 0, 'rates_number': 0, 'median_rating': 0, 'bayesian_score': 3.0,
+                  'rating_histogram': {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}}
     assert response.json() == [
-        {'id': 2, 'make': 'Fiat', 'model': '500', 'avg_rating': 0, 'rates_number': 0},
-        {'id': 3, 'make': 'Fiat', 'model': 'Freemont', 'avg_rating': 0, 'rates_number': 0},
-        {'id': 4, 'make': 'Fiat', 'model': 'Ducato', 'avg_rating': 0, 'rates_number': 0}
+        {'id': 2, 'make': 'Fiat', 'model': '500', **no_ratings},
+        {'id': 3, 'make': 'Fiat', 'model': 'Freemont', **no_ratings},
+        {'id': 4, 'make': 'Fiat', 'model': 'Ducato', **no_ratings}
     ]
 
 
@@ -195,3 +323,1234 @@ def test_all_cars_by_make_create_objects_from_response_action(client):
     response = client.get(reverse("admin:cars_car_changelist"))
     print(response.__dict__)
     assert response.status_code == status.HTTP_200_OK
+
+
+# tests for external API responses cache
+
+FIAT_MODELS = {'Results': [
+    {'Make_ID': 492, 'Make_Name': 'FIAT', 'Model_ID': 2055, 'Model_Name': '500'},
+    {'Make_ID': 492, 'Make_Name': 'FIAT', 'Model_ID': 3490, 'Model_Name': 'Freemont'},
+    {'Make_ID': 492, 'Make_Name': 'FIAT', 'Model_ID': 25128, 'Model_Name': 'Ducato'}]}
+
+
+def test_repeated_creates_for_same_make_request_external_api_once(client, vehicle_api_cache, vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    for model in ['500', 'freemont', 'ducato']:
+        response = client.post(reverse("cars:cars-list"), data={'make': 'fiat', 'model': model})
+        assert response.status_code == status.HTTP_201_CREATED
+    assert len(vehicle_api_stub.requests) == 1
+    assert vehicle_api_cache.stats() == {'hits': 2, 'stale_hits': 0, 'misses': 1, 'hit_rate': 2 / 3}
+
+
+def test_vehicle_api_cache_serves_stale_entry_while_refreshing():
+    fetch = MagicMock(side_effect=[{'Results': ['old']}, {'Results': ['new']}])
+    cache = VehicleAPICache(LocalCache(), ttl=0, stale_ttl=60)
+    assert cache.get_or_fetch('fiat', fetch) == {'Results': ['old']}
+    assert cache.get_or_fetch('fiat', fetch) == {'Results': ['old']}
+    deadline = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert fetch.call_count == 2
+    assert cache.backend.get('fiat')['data'] == {'Results': ['new']}
+    assert cache.stats() == {'hits': 0, 'stale_hits': 1, 'misses': 1, 'hit_rate': 1 / 2}
+
+
+def test_local_cache_evicts_least_recently_used_entry():
+    cache = LocalCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+
+# tests for external API connection
+
+def test_connector_retries_failed_requests(vehicle_api_stub, settings):
+    settings.VPIC_MAX_RETRIES = 2
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    vehicle_api_stub.failures = 2
+    data = VehicleAPICConnector({'make': 'fiat'}).fetch_models_for_make()
+    assert data['Results'] == FIAT_MODELS['Results']
+    assert len(vehicle_api_stub.requests) == 3
+
+
+def test_connector_raises_connection_error_on_timeout(vehicle_api_stub, settings):
+    settings.VPIC_MAX_RETRIES = 1
+    settings.VPIC_READ_TIMEOUT = 0.05
+    vehicle_api_stub.delay = 0.5
+    with pytest.raises(VehicleAPICConnectionError):
+        VehicleAPICConnector({'make': 'fiat'}).fetch_models_for_make()
+    assert len(vehicle_api_stub.requests) == 2
+
+
+def test_open_circuit_fails_fast_without_requesting_external_api(vehicle_api_stub, circuit_breaker, settings, client):
+    settings.VPIC_MAX_RETRIES = 0
+    circuit_breaker.failure_threshold = 2
+    circuit_breaker.reset_timeout = 60
+    vehicle_api_stub.failures = 10
+    for _ in range(2):
+        with pytest.raises(VehicleAPICConnectionError):
+            VehicleAPICConnector({'make': 'fiat'}).fetch_models_for_make()
+    response = client.post(reverse("cars:cars-list"), data={'make': 'fiat', 'model': '500'})
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+    assert response.json() == {'detail': CIRCUIT_OPEN_ERROR_MSG}
+    assert len(vehicle_api_stub.requests) == 2
+
+
+def test_circuit_closes_after_successful_trial_request(circuit_breaker):
+    circuit_breaker.reset_timeout = 0
+    for _ in range(circuit_breaker.failure_threshold):
+        circuit_breaker.record_failure()
+    assert circuit_breaker.is_open
+    circuit_breaker.before_request()
+    with pytest.raises(VehicleAPICConnectionError):
+        circuit_breaker.before_request()
+    circuit_breaker.record_success()
+    assert not circuit_breaker.is_open
+
+
+def test_unexpected_error_of_trial_request_reopens_circuit(vehicle_api_stub, circuit_breaker):
+    circuit_breaker.reset_timeout = 0
+    for _ in range(circuit_breaker.failure_threshold):
+        circuit_breaker.record_failure()
+    with patch('cars.services.vehicle_api._get_with_retries', side_effect=KeyError('Results')):
+        with pytest.raises(KeyError):
+            VehicleAPICConnector({'make': 'fiat'}).fetch_models_for_make()
+    assert circuit_breaker.is_open
+    VehicleAPICConnector({'make': 'fiat'}).fetch_models_for_make()
+    assert not circuit_breaker.is_open
+
+
+# tests for local vPIC catalogue
+
+@pytest.fixture()
+def vpic_catalogue(tmp_path):
+    dump = tmp_path / "vpic.json"
+    dump.write_text(json.dumps({'Results': FIAT_MODELS['Results'] + [
+        {'Make_ID': 473, 'Make_Name': 'MAZDA', 'Model_ID': 2064, 'Model_Name': 'CX-5'},
+    ]}))
+    call_command("load_vpic_catalogue", str(dump))
+    return dump
+
+
+def test_load_vpic_catalogue_command_is_idempotent(vpic_catalogue):
+    call_command("load_vpic_catalogue", str(vpic_catalogue))
+    assert VehicleMake.objects.count() == 2
+    assert VehicleModel.objects.count() == 4
+
+
+def test_create_car_from_catalogue_does_not_request_external_api(client, vpic_catalogue, vehicle_api_stub):
+    response = client.post(reverse("cars:cars-list"), data={'make': 'mazda', 'model': 'cx-5'})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json().get("model") == "Cx-5"
+    response = client.post(reverse("cars:cars-list"), data={'make': 'mazda', 'model': 'cx-7'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()[0] == NO_MODEL_ERROR_MSG
+    assert vehicle_api_stub.requests == []
+
+
+def test_stale_catalogue_falls_back_to_external_api(client, vpic_catalogue, vehicle_api_stub, settings):
+    settings.VPIC_CATALOGUE_MAX_AGE = 60
+    VehicleMake.objects.update(updated_at=timezone.now() - timedelta(days=1))
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    response = client.post(reverse("cars:cars-list"), data={'make': 'fiat', 'model': 'ducato'})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(vehicle_api_stub.requests) == 1
+
+
+# tests for bulk cars import
+
+def test_import_cars_skips_existing_and_duplicated_cars_and_reports_invalid_rows(car, django_assert_max_num_queries):
+    cars = [
+        {'make': 'FIAT', 'model': '500'},
+        {'make': 'FIAT', 'model': 'DUCATO'},
+        {'make': 'fiat', 'model': 'ducato'},
+        {'make': 'FIAT', 'model': ''},
+        {'make': 'FIAT', 'model': 'Panda'},
+    ]
+    with django_assert_max_num_queries(4):
+        created_ids, errors = import_cars(cars, batch_size=2)
+    assert list(Car.objects.filter(id__in=created_ids).values_list('model', flat=True)) == ['Ducato', 'Panda']
+    assert errors == [{'index': 3, 'errors': {'model': ['This field may not be blank.']}}]
+
+
+@patch(
+    'cars.services.vehicle_api.VehicleAPICConnector.get_vehicle_models_by_make_data',
+    MagicMock(return_value={'Results': [
+        {'Make_ID': 492, 'Make_Name': 'FIAT', 'Model_ID': number, 'Model_Name': f'Model {number}'}
+        for number in range(25)
+    ]})
+)
+def test_all_cars_by_make_creates_all_models_of_make(client):
+    response = client.post(reverse("cars:cars_by_make"), data={"make": "FIAT", "create": "True"})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(response.json()) == 25
+    assert Car.objects.count() == 25
+
+
+def test_cars_created_one_by_one_and_imported_by_make_are_not_duplicated(client, vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    response = client.post(reverse("cars:cars-list"), data={'make': 'fiat', 'model': 'freemont'})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert (response.json()["make"], response.json()["model"]) == ("Fiat", "Freemont")
+    response = client.post(reverse("cars:cars_by_make"), data={'make': 'fiat', 'create': 'True'})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert sorted(Car.objects.values_list('model', flat=True)) == ['500', 'Ducato', 'Freemont']
+    assert set(Car.objects.values_list('make', flat=True)) == {'Fiat'}
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Car.objects.create(make='FIAT', model='FREEMONT')
+
+
+def test_migration_merges_cars_differing_in_case_only(car):
+    migration = importlib.import_module('cars.migrations.0012_car_make_model_lower_uniqueness')
+    with connection.cursor() as cursor:
+        cursor.execute("DROP INDEX car_make_model_lower_uniq")
+    duplicate = Car.objects.create(make=" FIAT", model="500")
+    CarRatingFactory(car_id=car, rating=5)
+    CarRatingFactory(car_id=duplicate, rating=2)
+    migration.merge_duplicate_cars(django_apps, None)
+    with connection.cursor() as cursor:
+        cursor.execute(migration.Migration.operations[1].sql)
+    assert list(Car.objects.values_list('id', 'make', 'model')) == [(car.id, 'Fiat', '500')]
+    car.refresh_from_db()
+    assert (car.rates_number, car.rating_sum, car.avg_rating) == (2, 7, 3.5)
+    assert (car.rating_2_count, car.rating_5_count, car.bayesian_score) == (1, 1, (5 * 3.0 + 7) / 7)
+    assert car.ratings.count() == 2
+    assert CarRatingBucket.objects.get(car=car, granularity=CarRatingBucket.HOUR).count == 2
+
+
+# tests for background import jobs
+
+def test_import_job_imports_makes_and_reports_progress_and_errors(client, celery_eager, vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results'] + [
+        {'Make_ID': 492, 'Make_Name': 'FIAT', 'Model_ID': 1, 'Model_Name': ''},
+    ]}
+    response = client.post(
+        reverse("cars:import_jobs"),
+        data={"makes": ["FIAT", "fiat", "NOTHING"]},
+        content_type="application/json",
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job_id = response.json()["id"]
+    assert response["Location"].endswith(reverse("cars:import_job", args=[job_id]))
+
+    response = client.get(reverse("cars:import_job", args=[job_id]))
+    assert response.status_code == status.HTTP_200_OK
+    job = response.json()
+    assert (job["status"], job["total_makes"], job["processed_makes"], job["created_cars"]) == (
+        ImportJob.FINISHED, 2, 2, 3
+    )
+    assert job["errors"] == [
+        {'make': 'FIAT', 'car': {'make': 'Fiat', 'model': ''}, 'errors': {'model': ['This field may not be blank.']}},
+        {'make': 'NOTHING', 'errors': [NO_MAKE_ERROR_MSG]},
+    ]
+    assert Car.objects.count() == 3
+
+
+def test_import_job_finishes_when_importing_a_make_raises(client, celery_eager, vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    with patch('cars.tasks.import_cars', side_effect=RuntimeError):
+        response = client.post(reverse("cars:import_jobs"), data={"makes": ["fiat", "kia"]},
+                               content_type="application/json")
+    job = ImportJob.objects.get(id=response.json()["id"])
+    assert (job.status, job.processed_makes) == (ImportJob.FINISHED, 2)
+    assert job.errors == [
+        {'make': 'fiat', 'errors': [IMPORT_FAILED_ERROR_MSG]},
+        {'make': 'kia', 'errors': [NO_MAKE_ERROR_MSG]},
+    ]
+
+
+def test_import_job_requires_makes(client):
+    response = client.post(reverse("cars:import_jobs"), data={"makes": []}, content_type="application/json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+# tests for concurrent fetching of many makes
+
+def test_models_of_many_makes_are_fetched_concurrently(vehicle_api_stub, settings):
+    settings.VPIC_MAX_RETRIES = 0
+    vehicle_api_stub.delay = 0.2
+    vehicle_api_stub.models = {f'make{number}': [] for number in range(5)}
+    makes = [f'make{number}' for number in range(5)] + ['MAKE0']
+    start = time.monotonic()
+    responses = get_vehicle_models_by_makes_data(makes, max_workers=5)
+    assert time.monotonic() - start < 0.2 * 3
+    assert sorted(responses) == [f'make{number}' for number in range(5)]
+    assert len(vehicle_api_stub.requests) == 5
+
+
+def test_get_all_cars_by_make_action_imports_selected_makes(admin_client, vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    cars = [
+        CarFactory(make='Fiat', model='500'),
+        CarFactory(make='Fiat', model='Panda'),
+        CarFactory(make='Nothing', model='Nothing'),
+    ]
+    response = admin_client.post(
+        reverse("admin:cars_car_changelist"),
+        data={'action': 'get_all_cars_by_make', '_selected_action': [car.id for car in cars]},
+        follow=True,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [str(message) for message in response.context['messages']] == [
+        f"Make Nothing not imported error: {NO_MAKE_ERROR_MSG}",
+        'Created 2 car(s)',
+    ]
+    assert set(Car.objects.values_list('model', flat=True)) == {'500', 'Panda', 'Freemont', 'Ducato', 'Nothing'}
+
+
+# tests for batch ratings
+
+def test_rate_batch_creates_valid_ratings_and_reports_invalid_rows(client, django_assert_max_num_queries):
+    cars = CarFactory.create_batch(2)
+    ratings = [
+        {'car_id': cars[0].id, 'rating': 5},
+        {'car_id': cars[1].id, 'rating': 2},
+        {'car_id': cars[0].id, 'rating': 3},
+        {'car_id': cars[0].id, 'rating': 6},
+        {'car_id': 0, 'rating': 1},
+        {'rating': 1},
+    ]
+    # rating buckets take one INSERT of missing buckets and one UPDATE per chunk
+    with django_assert_max_num_queries(8):
+        response = client.post(reverse("cars:rate_batch"), data=ratings, content_type="application/json")
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == {'created': 3, 'errors': [
+        {'index': 3, 'errors': {'rating': ['Ensure this value is less than or equal to 5.']}},
+        {'index': 4, 'errors': {'car_id': ['Invalid pk "0" - object does not exist.']}},
+        {'index': 5, 'errors': {'car_id': ['This field is required.']}},
+    ]}
+    cars = Car.objects.order_by('id')
+    assert [(car.rates_number, car.avg_rating) for car in cars] == [(2, 4.0), (1, 2.0)]
+
+
+def test_rate_batch_accepts_ndjson_stream(client, car):
+    ratings = "\n".join(json.dumps({'car_id': car.id, 'rating': rating}) for rating in [1, 2, 3]) + "\n"
+    response = client.post(reverse("cars:rate_batch"), data=ratings, content_type="application/x-ndjson")
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == {'created': 3, 'errors': []}
+    car.refresh_from_db()
+    assert (car.rates_number, car.avg_rating) == (3, 2.0)
+
+
+def test_rate_batch_skips_idempotency_key_saved_concurrently(client, car):
+    ratings = [{'car_id': car.id, 'rating': 5, 'idempotency_key': 'key'}, {'car_id': car.id, 'rating': 1}]
+    response = client.post(reverse("cars:rate_batch"), data=ratings, content_type="application/json")
+    assert response.json() == {'created': 2, 'errors': []}
+    # the other request saved the key after this one checked it
+    with patch('cars.services.rating_import.saved_idempotency_keys', side_effect=[set(), {'key'}]):
+        response = client.post(reverse("cars:rate_batch"), data=ratings, content_type="application/json")
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == {'created': 1, 'errors': []}
+    car.refresh_from_db()
+    assert (car.rates_number, car.rating_sum) == (3, 7)
+    assert not Car.objects.out_of_sync().exists()
+
+
+def test_rate_batch_rejects_batch_without_valid_ratings(client):
+    response = client.post(reverse("cars:rate_batch"), data=[{'car_id': 1}], content_type="application/json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = client.post(reverse("cars:rate_batch"), data={'car_id': 1}, content_type="application/json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+# tests for write-behind ratings
+
+def test_write_behind_rating_is_saved_once_on_flush(client, car, rating_buffer):
+    for _ in range(2):
+        response = client.post(reverse("cars:rate"), data={"car_id": car.id, "rating": 4}, HTTP_IDEMPOTENCY_KEY="abc")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.json() == {"car_id": car.id, "rating": 4, "idempotency_key": "abc"}
+    response = client.post(reverse("cars:rate"), data={"car_id": car.id, "rating": 2})
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert car.ratings.count() == 0
+
+    assert flush_rating_buffer() == 2
+    assert len(rating_buffer) == 0
+    car.refresh_from_db()
+    assert (car.rates_number, car.avg_rating) == (2, 3.0)
+
+
+def test_write_behind_rating_keeps_time_it_was_submitted(client, car, rating_buffer):
+    submitted_at = timezone.now() - timedelta(hours=3)
+    with patch('django.utils.timezone.now', return_value=submitted_at):
+        client.post(reverse("cars:rate"), data={"car_id": car.id, "rating": 4})
+    assert flush_rating_buffer() == 1
+    assert car.ratings.get().created_at == submitted_at
+    bucket_start = CarRatingBucket.bucket_start(submitted_at, CarRatingBucket.HOUR)
+    assert list(car.rating_buckets.filter(granularity=CarRatingBucket.HOUR).values_list('start', 'count')) == [
+        (bucket_start, 1)
+    ]
+
+
+def test_write_behind_rating_is_validated_before_buffering(client, car, rating_buffer):
+    response = client.post(reverse("cars:rate"), data={"car_id": car.id, "rating": 32})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert len(rating_buffer) == 0
+
+
+def test_ratings_of_failed_flush_are_saved_by_next_flush(car, rating_buffer):
+    for number in range(3):
+        rating_buffer.push({"car_id": car.id, "rating": 5, "idempotency_key": str(number)})
+    with patch('cars.services.rating_buffer.import_ratings', MagicMock(side_effect=RuntimeError)):
+        with pytest.raises(RuntimeError):
+            flush_rating_buffer(flush_size=2)
+    assert flush_rating_buffer(flush_size=2) == 3
+    car.refresh_from_db()
+    assert car.rates_number == 3
+
+
+# tests for cars responses cache
+
+def test_cars_list_is_served_from_cache_until_rating_is_created(
+        client, car, response_cache, django_assert_num_queries, django_capture_on_commit_callbacks):
+    assert client.get(reverse("cars:cars-list"))["X-Cache"] == "MISS"
+    with django_assert_num_queries(0):
+        response = client.get(reverse("cars:cars-list"))
+    assert response["X-Cache"] == "HIT"
+    assert response.json()[0]["rates_number"] == 0
+
+    with django_capture_on_commit_callbacks(execute=True):
+        CarRatingFactory(car_id=car, rating=5)
+    response = client.get(reverse("cars:cars-list"))
+    assert response["X-Cache"] == "MISS"
+    assert response.json()[0]["rates_number"] == 1
+    assert response_cache.stats() == {'hits': 1, 'misses': 2, 'not_modified': 0, 'hit_rate': 1 / 3}
+
+
+def test_car_details_conditional_get_returns_not_modified(
+        client, car, django_assert_num_queries, django_capture_on_commit_callbacks):
+    response = client.get(reverse("cars:cars-detail", args=[car.id]))
+    etag, last_modified = response["ETag"], response["Last-Modified"]
+    with django_assert_num_queries(0):
+        response = client.get(reverse("cars:cars-detail", args=[car.id]), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    response = client.get(reverse("cars:cars-detail", args=[car.id]), HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    with django_capture_on_commit_callbacks(execute=True):
+        car.make = "Abarth"
+        car.save()
+    response = client.get(reverse("cars:cars-detail", args=[car.id]), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["make"] == "Abarth"
+    assert response["ETag"] != etag
+
+
+def test_car_details_under_zero_padded_id_are_invalidated_on_change(
+        client, car, response_cache, django_capture_on_commit_callbacks):
+    padded_url = f'{reverse("cars:cars-list")}0{car.id}/'
+    assert client.get(padded_url)["X-Cache"] == "MISS"
+    assert client.get(reverse("cars:cars-detail", args=[car.id]))["X-Cache"] == "HIT"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        car.make = "Abarth"
+        car.save()
+    response = client.get(padded_url)
+    assert response["X-Cache"] == "MISS"
+    assert response.json()["make"] == "Abarth"
+    assert client.get(f'{reverse("cars:cars-list")}abc/').status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_conditional_get_of_missing_car_returns_not_found(client):
+    future = http_date(time.time() + 60 * 60)
+    for headers in [{'HTTP_IF_NONE_MATCH': '*'}, {'HTTP_IF_MODIFIED_SINCE': future}]:
+        response = client.get(reverse("cars:cars-detail", args=[999999]), **headers)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_local_cache_versions_expire_so_changes_of_other_processes_become_visible(client, car, settings):
+    settings.RESPONSE_CACHE_TTL = 1
+    get_response_cache.cache_clear()
+    etag = client.get(reverse("cars:cars-detail", args=[car.id]))["ETag"]
+    Car.objects.filter(id=car.id).update(make="Abarth")
+    response = client.get(reverse("cars:cars-detail", args=[car.id]), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    time.sleep(1.1)
+    response = client.get(reverse("cars:cars-detail", args=[car.id]), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["make"] == "Abarth"
+
+
+# tests for read-only list endpoints
+
+def test_list_endpoints_return_same_data_as_serializers(client):
+    for car in CarFactory.create_batch(3):
+        CarRatingFactory.create_batch(car.id % 3, car_id=car, rating=4)
+    cars = Car.objects.order_by('id')
+    assert client.get(reverse("cars:cars-list")).json() == CarSerializer(cars, many=True).data
+    assert client.get(reverse("cars:popular")).json()["results"] == CarPopularitySerializer(
+        Car.objects.order_by('-rates_number', '-id'), many=True
+    ).data
+
+
+# tests for cars export
+
+def test_export_streams_cars_as_ndjson(client, car):
+    CarRatingFactory.create_batch(2, car_id=car, rating=4)
+    response = client.get(reverse("cars:export", args=["ndjson"]))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson"
+    car.refresh_from_db()
+    assert [json.loads(line) for line in b"".join(response.streaming_content).splitlines()] == [
+        {**CarSerializer(car).data, 'rating_sum': 8}
+    ]
+
+
+def test_export_streams_cars_as_csv(client, car):
+    CarRatingFactory(car_id=car, rating=4)
+    response = client.get(reverse("cars:export", args=["csv"]))
+    assert response["Content-Type"] == "text/csv"
+    assert b"".join(response.streaming_content).decode().splitlines() == [
+        'id,make,model,rating_sum,rates_number,avg_rating,median_rating,bayesian_score,'
+        'rating_1_count,rating_2_count,rating_3_count,rating_4_count,rating_5_count',
+        f'{car.id},Fiat,500,4,1,4.0,4.0,3.1666666666666665,0,0,0,1,0',
+    ]
+    assert client.get(reverse("cars:export", args=["xml"])).status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_export_cars_command_writes_file(car, tmp_path):
+    output = tmp_path / "cars.csv"
+    call_command("export_cars", "--format", "csv", "--output", str(output), "--chunk-size", "1")
+    assert output.read_text().splitlines()[1] == f'{car.id},Fiat,500,0,0,0.0,0,3.0,0,0,0,0,0'
+
+
+# tests for bulk loading cars and ratings
+
+def test_load_cars_command_skips_existing_and_invalid_rows(car, tmp_path, capsys):
+    path = tmp_path / "cars.csv"
+    path.write_text("make,model\nfiat,500\n fiat , PANDA \nFiat,Panda\n,Tipo\n")
+    call_command("load_cars", str(path), "--batch-size", "2")
+    assert list(Car.objects.order_by('id').values_list('make', 'model')) == [('Fiat', '500'), ('Fiat', 'Panda')]
+    assert "Loaded 1 of 4 row(s)" in capsys.readouterr().out
+
+
+def test_load_ratings_command_updates_rating_aggregates(car, tmp_path):
+    path = tmp_path / "ratings.ndjson"
+    rows = [{"car_id": car.id, "rating": 5}, {"car_id": car.id, "rating": "2"}, {"car_id": 404, "rating": 5},
+            {"car_id": car.id, "rating": 6}]
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+    call_command("load_ratings", str(path))
+    car.refresh_from_db()
+    assert (car.rating_sum, car.rates_number, car.avg_rating) == (7, 2, 3.5)
+
+
+def test_loading_rating_history_leaves_trending_cars_unchanged(client, tmp_path):
+    rising, steady, historic = CarFactory.create_batch(3)
+    CarRatingFactory.create_batch(2, car_id=rising)
+    CarRatingFactory(car_id=steady)
+    ranking = [rising.id, steady.id]
+    old = (timezone.now() - timedelta(days=100)).isoformat()
+    path = tmp_path / "ratings.csv"
+    path.write_text("car_id,rating,created_at\n" + f"{historic.id},5,\n" * 5 + f"{historic.id},4,{old}\n" * 5
+                    + f"{historic.id},4,yesterday\n")
+    call_command("load_ratings", str(path))
+    historic.refresh_from_db()
+    assert (historic.rates_number, historic.rating_sum) == (10, 45)
+    assert historic.ratings.filter(created_at=None).count() == 5
+    for params in [{"sort": "trending"}, {"window": "24h"}, {"window": "30d"}]:
+        assert [car["id"] for car in client.get(reverse("cars:popular"), params).json()["results"]] == ranking
+    assert not historic.rating_buckets.exists()
+
+
+def test_csv_stream_reads_rows_as_csv_in_parts():
+    stream = CSVStream(iter([{'make': 'Fiat', 'model': 'Panda, 4x4'}, {'make': 'Kia', 'model': None}]),
+                       ('make', 'model'))
+    assert stream.read(5) + stream.read(100) + stream.read(100) == 'Fiat,"Panda, 4x4"\r\nKia,\r\n'
+    assert stream.rows_read == 2
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason="COPY loading requires PostgreSQL")
+def test_postgresql_bulk_load_merges_staged_rows_and_recomputes_aggregates():
+    fiat = Car.objects.create(make="Fiat", model="500")
+    cars = [{'make': ' FIAT ', 'model': '500'}, {'make': 'kia', 'model': 'RIO'}, {'make': 'KIA ', 'model': 'rio'},
+            {'make': None, 'model': 'Tipo'}, {'make': 'Fiat', 'model': 'x' * 101}]
+    assert load_cars_postgresql(iter(cars)) == (5, 1)
+    assert list(Car.objects.order_by('id').values_list('make', 'model')) == [('Fiat', '500'), ('Kia', 'Rio')]
+    rio = Car.objects.get(make='Kia')
+    assert (rio.rates_number, rio.bayesian_score) == (0, prior_rating())
+
+    now, old = timezone.now(), timezone.now() - timedelta(days=100)
+    ratings = [
+        {'car_id': rio.id, 'rating': 2, 'created_at': now}, {'car_id': rio.id, 'rating': '4', 'created_at': now},
+        {'car_id': rio.id, 'rating': 3, 'created_at': 'x'}, {'car_id': fiat.id, 'rating': 5, 'created_at': old},
+        {'car_id': 404, 'rating': 5, 'created_at': None}, {'car_id': 'x', 'rating': 5, 'created_at': None},
+        {'car_id': fiat.id, 'rating': 6, 'created_at': ''},
+    ]
+    assert load_ratings_postgresql(iter(ratings)) == (7, 3)
+    rio.refresh_from_db()
+    assert (rio.rating_sum, rio.rates_number, rio.avg_rating) == (6, 2, 3)
+    assert rio.rating_histogram == {'1': 0, '2': 1, '3': 0, '4': 1, '5': 0}
+    assert not Car.objects.out_of_sync().exists()
+    assert list(rio.rating_buckets.values_list('granularity', 'count').order_by('granularity')) == [
+        (CarRatingBucket.DAY, 2), (CarRatingBucket.HOUR, 2)
+    ]
+    assert not fiat.rating_buckets.exists()
+    assert list(fiat.ratings.values_list('created_at', flat=True)) == [old]
+
+
+# tests for indexes used by endpoints queries
+
+def query_plan(queryset):
+    """
+    Returns EXPLAIN output of queryset. On PostgreSQL sequential scans are disabled in the test transaction,
+    otherwise planner scans tiny test tables instead of using indexes it would use for big ones.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    return queryset.explain()
+
+
+def test_cars_list_is_filtered_by_make_with_lower_make_index(client, car):
+    CarFactory(make='Kia')
+    response = client.get(reverse("cars:cars-list"), {"make": "FIAT"})
+    assert [row["id"] for row in response.json()] == [car.id]
+    assert 'car_make_lower_idx' in query_plan(Car.objects.by_make('FIAT'))
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason="index range bounds are checked on PostgreSQL")
+def test_next_popular_page_starts_index_scan_at_cursor_position():
+    paginator = KeysetPagination()
+    paginator.ordering = ('-rates_number', '-id')
+    queryset = Car.objects.order_by(*paginator.ordering).filter(paginator.after_position_filter([3, 10]))[:20]
+    plan = query_plan(queryset)
+    assert 'car_popularity_idx' in plan
+    assert 'Index Cond: (rates_number <= 3)' in plan
+
+
+def test_car_details_query_uses_primary_key():
+    plan = query_plan(Car.objects.filter(pk=1))
+    assert 'cars_car_pkey' in plan or 'INTEGER PRIMARY KEY' in plan
+
+
+def test_popular_cars_page_uses_popularity_index():
+    assert 'car_popularity_idx' in query_plan(Car.objects.order_by('-rates_number', '-id')[:20])
+
+
+def test_import_cars_lookup_uses_make_model_unique_index():
+    plan = query_plan(existing_cars([('Fiat', '500'), ('Fiat', 'Panda')]))
+    # SQLite backs unique constraints declared in CREATE TABLE with its own automatically named index
+    assert 'car_make_model_uniq' in plan or 'sqlite_autoindex_cars_car' in plan and 'make=? AND model=?' in plan
+
+
+def test_rating_aggregates_use_covering_car_rating_index():
+    assert 'car_rating_car_rating_idx' in query_plan(Car.objects.with_actual_rating_aggregates())
+
+
+def test_cars_are_unique_by_make_and_model(client, car):
+    created_ids, _ = import_cars([{"make": "Abarth", "model": "500"}, {"make": "fiat", "model": "500"}])
+    assert Car.objects.filter(model='500').count() == 2 and len(created_ids) == 1
+    serializer = CarSerializer(data={"make": "FIAT", "model": " 500"})
+    assert not serializer.is_valid()
+    assert serializer.errors == {"non_field_errors": ["The fields make, model must make a unique set."]}
+
+
+# tests for request metrics
+
+def test_request_timings_are_sent_in_server_timing_header(client, car, request_metrics):
+    response = client.get(reverse("cars:cars-list"))
+    metrics = dict(metric.split(';', 1)[0:2] for metric in response["Server-Timing"].split(', '))
+    assert set(metrics) == {'db', 'serialize', 'total'}
+    assert metrics['db'].endswith('desc="1 queries"')
+
+
+def test_upstream_requests_are_collected_into_metrics(client, request_metrics, vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    vehicle_api_stub.failures = 1
+    response = client.post(reverse("cars:cars_by_make"), data={'make': 'fiat', 'create': 'True'})
+    assert 'upstream;dur=' in response["Server-Timing"] and 'desc="503 200"' in response["Server-Timing"]
+    metrics = client.get(reverse("cars:metrics")).content.decode()
+    assert 'vpic_responses_total{status="200"} 1' in metrics
+    assert 'vpic_responses_total{status="503"} 1' in metrics
+    assert 'http_request_duration_seconds_count{method="POST",status="201",view="cars:cars_by_make"} 1' in metrics
+    assert 'http_request_db_queries_bucket{view="cars:cars_by_make",le="+Inf"} 1' in metrics
+
+
+def test_cache_hit_rates_are_collected_into_metrics(client, car, request_metrics):
+    for _ in range(2):
+        client.get(reverse("cars:cars-detail", args=[car.id]))
+    metrics = client.get(reverse("cars:metrics")).content.decode()
+    assert 'cache_lookups_total{cache="responses",result="hits"} 1' in metrics
+    assert 'cache_lookups_total{cache="responses",result="misses"} 1' in metrics
+    assert 'cache_hit_rate{cache="responses"} 0.5' in metrics
+    assert 'cache_hit_rate{cache="vpic"} 0' in metrics
+
+
+def test_request_metrics_are_off_by_default(client, car):
+    assert "Server-Timing" not in client.get(reverse("cars:cars-list"))
+    assert client.get(reverse("cars:metrics")).status_code == status.HTTP_404_NOT_FOUND
+
+
+# tests for async views
+
+def test_async_create_car_validates_car_against_external_api(client, vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    response = client.post(reverse("cars:async_cars"), data={'make': 'fiat', 'model': 'freemont'})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == CarSerializer(Car.objects.get(model='Freemont')).data
+    response = client.post(reverse("cars:async_cars"), data={'make': 'fiat', 'model': 'panda'},
+                           content_type='application/json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == [NO_MODEL_ERROR_MSG]
+    sync_response = client.post(reverse("cars:cars-list"), data={'make': 'fiat', 'model': 'freemont'})
+    response = client.post(reverse("cars:async_cars"), data={'make': 'fiat', 'model': 'freemont'})
+    assert response.status_code == sync_response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == sync_response.json()
+
+
+def test_async_all_cars_by_make_creates_all_models_of_make(client, vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    response = client.post(reverse("cars:async_cars_by_make"), data={'make': 'fiat', 'create': 'True'})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [car['model'] for car in response.json()] == ['500', 'Freemont', 'Ducato']
+    response = client.post(reverse("cars:async_cars_by_make"), data={'make': 'nothing'})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == [NO_MAKE_ERROR_MSG]
+    assert client.get(reverse("cars:async_cars_by_make")).status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+
+def test_async_views_served_by_wsgi_close_their_http_clients(client, vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    clients = []
+
+    def recording_get_async_client():
+        clients.append(get_async_client())
+        return clients[-1]
+
+    with patch('cars.services.async_vehicle_api.get_async_client', side_effect=recording_get_async_client):
+        for make in ['fiat', 'nothing']:
+            client.post(reverse("cars:async_cars_by_make"), data={'make': make})
+    assert len(clients) == 2
+    assert all(http_client.is_closed for http_client in clients)
+
+
+def test_loadtest_command_compares_sync_and_async_views(capsys):
+    call_command("loadtest_vehicle_api", "--requests", "4", "--threads", "2", "--concurrency", "4", "--delay", "0")
+    output = capsys.readouterr().out
+    assert "wsgi: 4 requests" in output and "asgi: 4 requests" in output and "0 failed" in output
+
+
+# tests for coalescing concurrent external API requests
+
+class InMemoryRedisLock(Lock):
+    """
+    redis-py Lock keeping its key in a dict of the client instead of Redis, token handling is redis-py's own.
+    """
+
+    def register_scripts(self):
+        pass
+
+    def do_acquire(self, token):
+        with self.redis.mutex:
+            return self.redis.tokens.setdefault(self.name, token) == token
+
+    def do_release(self, expected_token):
+        with self.redis.mutex:
+            if self.redis.tokens.get(self.name) != expected_token:
+                raise LockNotOwnedError("Cannot release a lock that's no longer owned")
+            del self.redis.tokens[self.name]
+
+
+class InMemoryLockClient:
+    def __init__(self):
+        self.tokens = {}
+        self.mutex = threading.Lock()
+
+    def lock(self, name, timeout=None, thread_local=True):
+        return InMemoryRedisLock(self, name, timeout=timeout, thread_local=thread_local)
+
+
+class SharedLockCache(LocalCache):
+    """
+    LocalCache with lock() of RedisCache, lets many VehicleAPICache instances imitate separate processes.
+    """
+    prefix = 'vpic'
+    make_key = RedisCache.make_key
+    lock = RedisCache.lock
+
+    def __init__(self):
+        super().__init__()
+        self.client = InMemoryLockClient()
+
+
+def test_concurrent_misses_of_make_share_single_request(vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    vehicle_api_stub.delay = 0.2
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        responses = list(executor.map(
+            lambda make: VehicleAPICConnector({'make': make}).get_models_for_make(), ['fiat', 'FIAT '] * 5
+        ))
+    assert len(vehicle_api_stub.requests) == 1
+    assert all(response == responses[0] for response in responses)
+
+
+def test_concurrent_misses_share_error(vehicle_api_stub, settings):
+    settings.VPIC_MAX_RETRIES = 0
+    vehicle_api_stub.delay = 0.2
+    vehicle_api_stub.failures = 10
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(VehicleAPICConnector({'make': 'fiat'}).get_models_for_make) for _ in range(5)]
+    assert all(isinstance(future.exception(), VehicleAPICConnectionError) for future in futures)
+    assert len(vehicle_api_stub.requests) == 1
+
+
+def test_processes_sharing_cache_fetch_missing_make_once(vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    vehicle_api_stub.delay = 0.2
+    backend = SharedLockCache()
+    caches = [VehicleAPICache(backend, ttl=60, stale_ttl=60, lock_timeout=5) for _ in range(4)]
+    fetch = VehicleAPICConnector({'make': 'fiat'}).fetch_models_for_make
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(lambda cache: cache.get_or_fetch('fiat', fetch), caches))
+    assert [response['Results'] for response in responses] == [FIAT_MODELS['Results']] * 4
+    assert len(vehicle_api_stub.requests) == 1
+
+
+def test_processes_sharing_cache_fetch_missing_make_once_in_async_views(vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    vehicle_api_stub.delay = 0.2
+    backend = SharedLockCache()
+    caches = [VehicleAPICache(backend, ttl=60, stale_ttl=60, lock_timeout=5) for _ in range(4)]
+    connector = AsyncVehicleAPICConnector({'make': 'fiat'})
+
+    async def fetch_many():
+        try:
+            return await asyncio.gather(*(
+                cache.async_get_or_fetch('fiat', connector.async_fetch_models_for_make, None) for cache in caches
+            ))
+        finally:
+            await get_async_client().aclose()
+
+    start = time.monotonic()
+    assert [response['Results'] for response in asyncio.run(fetch_many())] == [FIAT_MODELS['Results']] * 4
+    assert time.monotonic() - start < 5
+    assert len(vehicle_api_stub.requests) == 1
+    assert backend.client.tokens == {}
+
+
+def test_async_cache_lookups_dont_block_event_loop(vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    threads = []
+
+    class ThreadRecordingCache(SharedLockCache):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+
+        def set(self, key, value, timeout=None):
+            threads.append(threading.get_ident())
+            return super().set(key, value, timeout=timeout)
+
+    do_release = InMemoryRedisLock.do_release
+
+    def recording_do_release(lock, expected_token):
+        threads.append(threading.get_ident())
+        return do_release(lock, expected_token)
+
+    cache = VehicleAPICache(ThreadRecordingCache(), ttl=60, stale_ttl=60, lock_timeout=5)
+    connector = AsyncVehicleAPICConnector({'make': 'fiat'})
+
+    async def fetch_twice():
+        try:
+            for _ in range(2):
+                await cache.async_get_or_fetch('fiat', connector.async_fetch_models_for_make, None)
+        finally:
+            await get_async_client().aclose()
+        return threading.get_ident()
+
+    with patch.object(InMemoryRedisLock, 'do_release', recording_do_release):
+        event_loop_thread = asyncio.run(fetch_twice())
+    assert len(threads) == 5
+    assert event_loop_thread not in threads
+
+
+def test_concurrent_async_misses_of_make_share_single_request(vehicle_api_stub):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    vehicle_api_stub.delay = 0.2
+
+    async def fetch_many():
+        connectors = [AsyncVehicleAPICConnector({'make': 'fiat'}) for _ in range(5)]
+        try:
+            return await asyncio.gather(*(connector.async_get_models_for_make() for connector in connectors))
+        finally:
+            await get_async_client().aclose()
+
+    assert [response['Results'] for response in asyncio.run(fetch_many())] == [FIAT_MODELS['Results']] * 5
+    assert len(vehicle_api_stub.requests) == 1
+
+
+# tests for rating histograms
+
+def test_rating_histogram_is_kept_up_to_date(client, car):
+    for rating in [5, 5, 4, 1]:
+        client.post(reverse("cars:rate"), data={"car_id": car.id, "rating": rating})
+    car.ratings.filter(rating=4).delete()
+    car.refresh_from_db()
+    assert car.rating_histogram == {'1': 1, '2': 0, '3': 0, '4': 0, '5': 2}
+    assert (car.median_rating, car.avg_rating, car.bayesian_score) == (5, 3.7, (5 * 3 + 11) / (5 + 3))
+    assert client.get(reverse("cars:cars-detail", args=[car.id])).json()["median_rating"] == 5
+    assert not Car.objects.out_of_sync().exists()
+
+
+def test_median_rating_of_even_number_of_ratings_is_mean_of_middle_ratings():
+    assert histogram_median([0, 1, 0, 1, 0]) == 3
+    assert histogram_median([0, 0, 0, 1, 1]) == 4.5
+    assert histogram_median([0, 0, 0, 0, 0]) == 0
+
+
+def test_migration_backfills_histograms_with_default_prior(car, settings):
+    migration = importlib.import_module('cars.migrations.0008_car_rating_histogram')
+    settings.RATING_PRIOR_MEAN = 4.0
+    CarRatingFactory.create_batch(2, car_id=car, rating=5)
+    CarFactory()
+    Car.objects.update(bayesian_score=0, **{f'rating_{rating}_count': 0 for rating in range(1, 6)})
+    migration.backfill_rating_histograms(django_apps, None)
+    assert list(Car.objects.order_by('id').values_list('rating_5_count', 'bayesian_score')) == [
+        (2, (5 * 3 + 10) / (5 + 2)), (0, 3.0)
+    ]
+
+
+def test_popular_cars_can_be_sorted_by_quality(client):
+    few_perfect, many_good, unrated = CarFactory.create_batch(3)
+    CarRatingFactory.create_batch(2, car_id=few_perfect, rating=5)
+    CarRatingFactory.create_batch(20, car_id=many_good, rating=4)
+    response = client.get(reverse("cars:popular"), {"sort": "quality", "page_size": 2})
+    assert [car["id"] for car in response.json()["results"]] == [many_good.id, few_perfect.id]
+    response = client.get(response.json()["next"])
+    assert [car["id"] for car in response.json()["results"]] == [unrated.id]
+    assert client.get(reverse("cars:popular"), {"sort": "price"}).status_code == status.HTTP_400_BAD_REQUEST
+    assert 'car_quality_idx' in query_plan(Car.objects.order_by('-bayesian_score', '-id')[:20])
+
+
+# tests for time windowed popularity
+
+def test_rating_buckets_follow_created_and_deleted_ratings(car):
+    created_at = timezone.now() - timedelta(days=2)
+    rating = CarRatingFactory(car_id=car, created_at=created_at)
+    CarRatingFactory(car_id=car, created_at=created_at)
+    CarRatingFactory(car_id=car)
+    rating.delete()
+    buckets = dict(
+        CarRatingBucket.objects.filter(start__lte=created_at).values_list('granularity', 'count')
+    )
+    assert buckets == {CarRatingBucket.HOUR: 1, CarRatingBucket.DAY: 1}
+    assert CarRatingBucket.objects.filter(start__gt=created_at).count() == 2
+
+
+def test_popular_cars_within_window_are_ranked_by_recent_ratings(client, django_assert_num_queries):
+    old_favourite, recent, older_recent = CarFactory.create_batch(3)
+    CarRatingFactory.create_batch(5, car_id=old_favourite, created_at=timezone.now() - timedelta(days=40))
+    CarRatingFactory.create_batch(2, car_id=recent)
+    CarRatingFactory(car_id=older_recent, created_at=timezone.now() - timedelta(days=3))
+    CarRatingFactory.create_batch(2, car_id=older_recent, created_at=timezone.now() - timedelta(days=10))
+
+    url = reverse("cars:popular") + "?window=24h"
+    assert [car["window_ratings"] for car in client.get(url).json()["results"]] == [2]
+
+    received = []
+    url = reverse("cars:popular") + "?window=30d&page_size=1"
+    while url:
+        with django_assert_num_queries(1) as captured:
+            response = client.get(url)
+        assert '"cars_carrating"' not in captured.captured_queries[0]['sql']
+        received += [(car["id"], car["window_ratings"]) for car in response.json()["results"]]
+        url = response.json()["next"]
+    assert received == [(older_recent.id, 3), (recent.id, 2)]
+
+    assert client.get(reverse("cars:popular"), {"window": "1y"}).status_code == status.HTTP_400_BAD_REQUEST
+    response = client.get(reverse("cars:popular"), {"window": "7d", "sort": "quality"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_trending_cars_are_ranked_by_decayed_number_of_ratings(client, settings):
+    settings.RATINGS_TRENDING_HALF_LIFE = 24
+    steady, rising, stale = CarFactory.create_batch(3)
+    CarRatingFactory.create_batch(3, car_id=steady, created_at=timezone.now() - timedelta(hours=48))
+    CarRatingFactory.create_batch(2, car_id=rising)
+    CarRatingFactory.create_batch(9, car_id=stale, created_at=timezone.now() - timedelta(days=5))
+    response = client.get(reverse("cars:popular"), {"sort": "trending"})
+    results = response.json()["results"]
+    assert [car["id"] for car in results] == [rising.id, steady.id]
+    assert results[0]["trending_score"] == 2
+    assert results[1]["trending_score"] == pytest.approx(0.75, rel=0.05)
+
+
+def test_trending_pages_are_ranked_at_time_of_the_first_page(client, settings):
+    settings.RATINGS_TRENDING_HALF_LIFE = 24
+    steady, rising = CarFactory.create_batch(2)
+    CarRatingFactory.create_batch(3, car_id=steady, created_at=timezone.now() - timedelta(hours=40))
+    CarRatingFactory.create_batch(2, car_id=rising)
+    response = client.get(reverse("cars:popular"), {"sort": "trending", "page_size": 1})
+    assert [car["id"] for car in response.json()["results"]] == [rising.id]
+    with patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(hours=40)):
+        response = client.get(response.json()["next"])
+    assert [car["id"] for car in response.json()["results"]] == [steady.id]
+
+
+def test_old_rating_buckets_are_pruned_and_can_be_rebuilt(car):
+    CarRatingFactory(car_id=car, created_at=timezone.now() - timedelta(days=40))
+    CarRatingFactory(car_id=car, created_at=timezone.now() - timedelta(days=10))
+    CarRatingFactory(car_id=car)
+    assert CarRatingBucket.objects.count() == 3
+    old = timezone.now() - timedelta(days=40)
+    CarRatingBucket.objects.bulk_create([
+        CarRatingBucket(car=car, granularity=granularity, count=1,
+                        start=CarRatingBucket.bucket_start(old, granularity))
+        for granularity in CarRatingBucket.GRANULARITIES
+    ])
+    assert CarRatingBucket.objects.prune() == 2
+    CarRatingBucket.objects.update(count=0)
+    call_command("recompute_car_ratings")
+    assert sorted(CarRatingBucket.objects.values_list('granularity', 'count')) == [
+        (CarRatingBucket.DAY, 1), (CarRatingBucket.DAY, 1), (CarRatingBucket.HOUR, 1)
+    ]
+
+
+# tests for cars search
+
+def test_search_ranks_name_prefix_then_word_prefix_then_similar_names(client):
+    fiat_500 = CarFactory(make='Fiat', model='500')
+    fiat_panda = CarFactory(make='Fiat', model='Panda')
+    CarRatingFactory.create_batch(10, car_id=fiat_panda, rating=5)
+    abarth = CarFactory(make='Abarth', model='Fiat replica')
+    CarFactory(make='Ford', model='Fiesta')
+    response = client.get(reverse("cars:search"), {"q": " FIA"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [car["id"] for car in response.json()] == [fiat_panda.id, fiat_500.id, abarth.id]
+    assert [car["id"] for car in client.get(reverse("cars:search"), {"q": "fiat", "limit": 1}).json()] == [
+        fiat_panda.id
+    ]
+    assert [car["id"] for car in client.get(reverse("cars:search"), {"q": "fait"}).json()] == [
+        fiat_panda.id, fiat_500.id, abarth.id
+    ]
+
+
+def test_search_sees_created_cars_and_requires_query(client, django_capture_on_commit_callbacks):
+    assert client.get(reverse("cars:search"), {"q": "pan"}).json() == []
+    with django_capture_on_commit_callbacks(execute=True):
+        car = CarFactory(make='Fiat', model='Panda')
+    assert client.get(reverse("cars:search"), {"q": "pan"}).json() == [{
+        'id': car.id, 'make': 'Fiat', 'model': 'Panda', 'rates_number': 0, 'avg_rating': 0.0,
+        'bayesian_score': 3.0,
+    }]
+    assert client.get(reverse("cars:search"), {"q": " "}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+# tests for read replicas
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica_0'])
+def test_reads_go_to_replica_until_client_writes(client, car, settings):
+    settings.READ_REPLICAS_ENABLED = True
+    settings.RESPONSE_CACHE_TTL = 0
+    with CaptureQueriesContext(connections['replica_0']) as replica_queries, \
+            CaptureQueriesContext(connections['default']) as primary_queries:
+        assert client.get(reverse("cars:cars-list")).status_code == status.HTTP_200_OK
+    assert (len(replica_queries), len(primary_queries)) == (1, 0)
+
+    with CaptureQueriesContext(connections['replica_0']) as replica_queries:
+        response = client.post(reverse("cars:rate"), data={"car_id": car.id, "rating": 5})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.cookies["read_primary"]["max-age"] == settings.READ_REPLICA_STICKY_SECONDS
+    assert len(replica_queries) == 0
+
+    with CaptureQueriesContext(connections['replica_0']) as replica_queries:
+        assert client.get(reverse("cars:cars-detail", args=[car.id])).json()["rates_number"] == 1
+    assert len(replica_queries) == 0
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica_0'])
+def test_responses_of_just_changed_cars_are_cached_from_primary(client, car, settings):
+    settings.READ_REPLICAS_ENABLED = True
+    CarRatingFactory(car_id=car, rating=5)
+    with CaptureQueriesContext(connections['replica_0']) as replica_queries:
+        assert client.get(reverse("cars:cars-detail", args=[car.id]))["X-Cache"] == "MISS"
+    assert len(replica_queries) == 0
+
+
+def test_reads_outside_of_requests_go_to_primary():
+    assert Car.objects.all().db == 'default'
+    with reading_from('replica_0'):
+        assert Car.objects.all().db == 'replica_0'
+        assert Car.objects.db_manager(hints={}).all().db == 'replica_0'
+    assert Car.objects.all().db == 'default'
+
+
+# tests for partitioned ratings
+
+def partition_ratings(settings):
+    """
+    Partitions ratings table with migration 0011, returns the migration module.
+    """
+    settings.RATINGS_PARTITIONED = True
+    settings.RATINGS_PARTITIONS_AHEAD = 1
+    migration = importlib.import_module('cars.migrations.0011_partitioned_car_ratings')
+    with connection.schema_editor() as schema_editor:
+        migration.partition_ratings(django_apps, schema_editor)
+    return migration
+
+
+def test_rating_partitions_are_managed_only_when_ratings_are_partitioned():
+    december = datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert month_start(datetime(2025, 12, 31, 23, 59, tzinfo=timezone.utc)) == december
+    assert next_month(december) == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert partition_name(december) == 'cars_carrating_y2025m12'
+    if connection.vendor != 'postgresql':
+        assert create_upcoming_partitions(3) == []
+        with pytest.raises(CommandError):
+            call_command("manage_rating_partitions")
+
+
+def test_migrations_dont_touch_rating_keys_missing_on_partitioned_table():
+    loader = MigrationLoader(connection)
+    operations = [
+        operation
+        for (app, name), migration in loader.disk_migrations.items()
+        if app == 'cars' and name > '0011'
+        for operation in migration.operations
+    ]
+    changes = MigrationAutodetector(loader.project_state(), ProjectState.from_apps(django_apps)).changes(loader.graph)
+    operations += [operation for migration in changes.get('cars', []) for operation in migration.operations]
+    for operation in operations:
+        if getattr(operation, 'model_name', None) == 'carrating':
+            assert not isinstance(operation, (AddConstraint, RemoveConstraint)), operation.describe()
+            assert {getattr(operation, 'name', None), getattr(operation, 'old_name', None)}.isdisjoint(
+                {'id', 'idempotency_key'}
+            ), operation.describe()
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason="declarative partitioning requires PostgreSQL")
+def test_partitioned_ratings_keep_aggregates_and_archive_old_months(car, settings):
+    old = timezone.now() - timedelta(days=120)
+    CarRatingFactory(car_id=car, rating=1, created_at=old)
+    partition_ratings(settings)
+    CarRatingFactory(car_id=car, rating=5)
+    car.refresh_from_db()
+    assert (car.rates_number, car.rating_sum) == (2, 6)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT tableoid::regclass::text FROM cars_carrating ORDER BY id")
+        assert [name for name, in cursor.fetchall()] == [partition_name(old), partition_name(timezone.now())]
+
+    assert archive_partitions(next_month(old), drop=True) == [partition_name(old)]
+    car.refresh_from_db()
+    assert (car.rates_number, car.rating_sum) == (1, 5)
+    assert not Car.objects.out_of_sync().exists()
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason="declarative partitioning requires PostgreSQL")
+def test_upcoming_partitions_take_their_ratings_from_default_partition(car, settings):
+    partition_ratings(settings)
+    months = [month_start(timezone.now())]
+    for _ in range(4):
+        months.append(next_month(months[-1]))
+    CarRatingFactory(car_id=car, created_at=months[3] + timedelta(days=3), idempotency_key='later')
+    with connection.cursor() as cursor:
+        # blocks creating partition of months[2], later months are still created
+        cursor.execute(f"CREATE TABLE {partition_name(months[2])} (id integer)")
+    assert create_upcoming_partitions(4) == [partition_name(months[3]), partition_name(months[4])]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT tableoid::regclass::text FROM cars_carrating")
+        assert [name for name, in cursor.fetchall()] == [partition_name(months[3])]
+    with pytest.raises(IntegrityError), transaction.atomic():
+        CarRating.objects.bulk_create([CarRating(car_id=car, rating=3, idempotency_key='later')])
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason="declarative partitioning requires PostgreSQL")
+def test_partitioned_ratings_keep_idempotency_keys_unique(car, settings):
+    CarRatingFactory(car_id=car, rating=1, idempotency_key='saved')
+    partition_ratings(settings)
+    CarRatingFactory(car_id=car, rating=2, idempotency_key='new')
+    for key in ['saved', 'new']:
+        with pytest.raises(IntegrityError), transaction.atomic():
+            CarRating.objects.bulk_create([CarRating(car_id=car, rating=3, idempotency_key=key)])
+    CarRating.objects.filter(idempotency_key='new').delete()
+    CarRating.objects.bulk_create([CarRating(car_id=car, rating=3, idempotency_key='new')])
+    assert CarRating.objects.filter(idempotency_key='new').count() == 1
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason="declarative partitioning requires PostgreSQL")
+def test_ratings_can_be_partitioned_again_after_migrating_back(car, settings):
+    CarRatingFactory(car_id=car, rating=1)
+    migration = partition_ratings(settings)
+    with connection.schema_editor() as schema_editor:
+        migration.unpartition_ratings(django_apps, schema_editor)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence('cars_carrating', 'id')")
+        assert cursor.fetchone()[0] == 'public.cars_carrating_id_seq'
+    partition_ratings(settings)
+    CarRatingFactory(car_id=car, rating=5)
+    assert list(CarRating.objects.order_by('id').values_list('rating', flat=True)) == [1, 5]
+
+
+# tests for throttling and load shedding
+
+def throttle_rates(settings, **rates):
+    settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}
+
+
+def test_rate_is_throttled_per_client_with_retry_after(client, car, settings):
+    throttle_rates(settings, ratings='2/min')
+    for _ in range(2):
+        response = client.post(reverse('cars:rate'), data={'car_id': 1, 'rating': 5})
+        assert response.status_code == status.HTTP_201_CREATED
+    response = client.post(reverse('cars:rate'), data={'car_id': 1, 'rating': 5})
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response['Retry-After'] == '30'
+    response = client.post(reverse('cars:rate'), data={'car_id': 1, 'rating': 5}, REMOTE_ADDR='10.0.0.2')
+    assert response.status_code == status.HTTP_201_CREATED
+    assert car.ratings.count() == 3
+
+
+def test_global_bucket_throttles_all_clients_of_scope(client, vehicle_api_stub, settings):
+    throttle_rates(settings, upstream_global='1/h')
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    assert client.post(reverse("cars:cars_by_make"), data={'make': 'fiat'}).status_code == status.HTTP_200_OK
+    response = client.post(reverse("cars:async_cars_by_make"), data={'make': 'fiat'}, REMOTE_ADDR='10.0.0.2')
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response['Retry-After'] == '3600'
+    assert client.get(reverse('cars:cars-list')).status_code == status.HTTP_200_OK
+
+
+def test_token_buckets_take_tokens_from_all_buckets_or_none():
+    assert parse_rate('30/min') == (0.5, 30)
+    buckets = LocalTokenBuckets()
+    limits = [('client', 1, 2), ('global', 10, 1)]
+    with patch('cars.services.token_buckets.time.monotonic', return_value=100):
+        assert buckets.take(limits) == 0
+        assert buckets.take(limits) == pytest.approx(0.1)
+    with patch('cars.services.token_buckets.time.monotonic', return_value=100.25):
+        assert buckets.take(limits) == 0
+        assert buckets.take(limits) == pytest.approx(0.75)
+
+
+def test_redis_token_buckets_fall_back_to_local_buckets():
+    buckets = RedisTokenBuckets(fallback=LocalTokenBuckets(), url='redis://localhost:1')
+    assert buckets.take([('client', 1, 1)]) == 0
+    assert buckets.take([('client', 1, 1)]) > 0
+    assert not buckets.available
+
+
+def test_upstream_views_over_concurrency_limit_are_shed(client, vehicle_api_stub, upstream_limiter):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    upstream_limiter.acquire()
+    for url in [reverse("cars:cars_by_make"), reverse("cars:async_cars_by_make"), reverse("cars:cars-list")]:
+        response = client.post(url, data={'make': 'fiat', 'model': '500'})
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response['Retry-After'] == '1'
+    assert vehicle_api_stub.requests == []
+    upstream_limiter.release()
+    for _ in range(2):
+        assert client.post(reverse("cars:cars_by_make"), data={'make': 'fiat'}).status_code == status.HTTP_200_OK
+    assert client.post(reverse("cars:async_cars_by_make"), data={'make': 'nothing'}).status_code == 400
+    assert client.post(reverse("cars:cars-list"), data={'make': 'fiat', 'model': '500'}).status_code == 201
+
+
+def test_upstream_slot_is_released_after_unhandled_exception(client, vehicle_api_stub, upstream_limiter):
+    vehicle_api_stub.models = {'fiat': FIAT_MODELS['Results']}
+    client.raise_request_exception = False
+    with patch.object(VehicleAPICConnector, 'get_vehicle_models_by_make_data', side_effect=RuntimeError):
+        response = client.post(reverse("cars:cars_by_make"), data={'make': 'fiat'})
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+    assert client.post(reverse("cars:cars_by_make"), data={'make': 'fiat'}).status_code == status.HTTP_200_OK
@@ -0,0 +1,123 @@
+import threading
+from functools import lru_cache, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from cars.services.token_buckets import get_token_buckets
+
+RATE_PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """
+    Returns (tokens per second, capacity) of a token bucket from DRF style "number/period" rate: bucket holds
+    "number" tokens, so that many requests can be sent at once, and is refilled within the period.
+    """
+    number, period = rate.split('/')
+    return int(number) / RATE_PERIODS[period[0]], int(number)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles views with "throttle_scope" attribute with two token buckets: one per client, identified by IP
+    address, and one shared by all clients. Their rates are taken from DEFAULT_THROTTLE_RATES under the scope
+    and "<scope>_global" keys, a missing rate disables that bucket. Views without scope aren't throttled.
+    Request gets 429 with Retry-After header unless both buckets have a token.
+    """
+    wait_seconds = None
+
+    def allow_request(self, request, view):
+        return self.allow(request, getattr(view, 'throttle_scope', None))
+
+    def allow(self, request, scope):
+        if scope is None:
+            return True
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        limits = [
+            (key, *parse_rate(rate))
+            for key, rate in [
+                (f'{scope}:client:{self.get_ident(request)}', rates.get(scope)),
+                (f'{scope}:global', rates.get(f'{scope}_global')),
+            ]
+            if rate
+        ]
+        if not limits:
+            return True
+        self.wait_seconds = get_token_buckets().take(limits)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Service is overloaded, try again later.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = wait
+
+
+class ConcurrencyLimiter:
+    """
+    Caps number of requests handled at once by the process. Request over the limit doesn't wait for a free slot,
+    it's rejected with ServiceOverloaded, so excess load is shed before any work starts. Limit 0 disables it.
+    """
+
+    def __init__(self, max_concurrency, retry_after):
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+    def acquire(self):
+        if self._semaphore is not None and not self._semaphore.acquire(blocking=False):
+            raise ServiceOverloaded(wait=self.retry_after)
+
+    def release(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+@lru_cache(maxsize=None)
+def get_upstream_limiter():
+    """
+    Returns limiter of requests which call vPIC API, shared by sync and async views of the process.
+    """
+    return ConcurrencyLimiter(settings.UPSTREAM_MAX_CONCURRENCY, retry_after=settings.UPSTREAM_RETRY_AFTER)
+
+
+def throttled(scope):
+    """
+    Throttles async view with TokenBucketThrottle under given scope, raises Throttled handled by async_api_view.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapped_view(request, *args, **kwargs):
+            throttle = TokenBucketThrottle()
+            if not await sync_to_async(throttle.allow, thread_sensitive=False)(request, scope):
+                raise Throttled(throttle.wait())
+            return await view(request, *args, **kwargs)
+        return wrapped_view
+    return decorator
+
+
+def upstream_limited(view):
+    """
+    Sheds requests of async view over upstream concurrency limit, raises ServiceOverloaded handled by
+    async_api_view.
+    """
+    @wraps(view)
+    async def wrapped_view(request, *args, **kwargs):
+        limiter = get_upstream_limiter()
+        limiter.acquire()
+        try:
+            return await view(request, *args, **kwargs)
+        finally:
+            limiter.release()
+    return wrapped_view
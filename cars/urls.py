@@ -1,7 +1,9 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from cars.views import CarsViewSet, CarRatingCreateAPIView, PopularCarListAPIView, AllCarsByMakeAPIView
+from cars.views import CarsViewSet, CarRatingCreateAPIView, PopularCarListAPIView, AllCarsByMakeAPIView, \
+    ImportJobCreateAPIView, ImportJobRetrieveAPIView, CarRatingBatchCreateAPIView, CarsExportAPIView, MetricsView, \
+    CarSearchAPIView, async_all_cars_by_make, async_create_car
 
 router = DefaultRouter()
 router.register(r'cars', CarsViewSet, basename="cars")
@@ -10,8 +12,16 @@ app_name = 'cars'
 
 urlpatterns = [
     path(r'rate/', CarRatingCreateAPIView.as_view(), name='rate'),
+    path(r'rate/batch/', CarRatingBatchCreateAPIView.as_view(), name='rate_batch'),
     path(r'popular/', PopularCarListAPIView.as_view(), name='popular'),
-    path(r'cars_by_make/', AllCarsByMakeAPIView.as_view(), name="cars_by_make")
+    path(r'search/', CarSearchAPIView.as_view(), name='search'),
+    path(r'cars_by_make/', AllCarsByMakeAPIView.as_view(), name="cars_by_make"),
+    path(r'export/<str:export_format>/', CarsExportAPIView.as_view(), name="export"),
+    path(r'import_jobs/', ImportJobCreateAPIView.as_view(), name="import_jobs"),
+    path(r'import_jobs/<uuid:pk>/', ImportJobRetrieveAPIView.as_view(), name="import_job"),
+    path(r'metrics', MetricsView.as_view(), name="metrics"),
+    path(r'async/cars/', async_create_car, name="async_cars"),
+    path(r'async/cars_by_make/', async_all_cars_by_make, name="async_cars_by_make"),
 ]
 
 urlpatterns += router.urls
@@ -1,16 +1,63 @@
-from django.db.models import Count
+import json
+import math
+import uuid
+from functools import cached_property, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, status
-from rest_framework.generics import CreateAPIView, ListAPIView
+from rest_framework.exceptions import APIException, NotFound, ParseError, ValidationError
+from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 
-from cars.models import Car, CarRating
-from cars.serializers import CarSerializer, CarRatingSerializer, CarPopularitySerializer, CreateCarSerializer
-from cars.services.vehicle_api import VehicleAPICConnector
+from cars.mixins import CachedResponseMixin, UpstreamLimitMixin
+from cars.models import Car, CarRating, CarRatingBucket, ImportJob
+from cars.pagination import INVALID_CURSOR_ERROR_MSG, KeysetPagination
+from cars.parsers import NDJSONParser
+from cars.renderers import FastJSONRenderer
+from cars.serializers import CAR_VALUES_FIELDS, CarSerializer, CarRatingSerializer, CarPopularitySerializer, \
+    CreateCarSerializer, ImportJobSerializer, car_values_representation
+from cars.services.async_vehicle_api import AsyncVehicleAPICConnector, close_async_client
+from cars.services.car_import import import_cars
+from cars.services.export import EXPORT_FORMATS, export_cars
+from cars.services.metrics import cache_exposition, get_request_metrics
+from cars.services.rating_buffer import buffer_rating
+from cars.services.rating_import import import_ratings
+from cars.services.search import search_cars
+from cars.services.response_cache import CARS_LIST_KEY, car_key, get_response_cache, page_key
+from cars.services.vehicle_api import VehicleAPICConnector, get_vehicle_api_cache
+from cars.tasks import start_import_job
+from cars.throttling import throttled, upstream_limited
 
 
-class CarsViewSet(viewsets.ModelViewSet):
+class CarsViewSet(CachedResponseMixin, UpstreamLimitMixin, viewsets.ModelViewSet):
+    """
+    Cars list can be filtered case-insensitively by "make" query param.
+    Creating a car validates it against external API, so it's throttled and limited like other upstream calls.
+    """
     queryset = Car.objects.all()
+    lookup_value_regex = r'\d+'
+
+    @property
+    def throttle_scope(self):
+        return 'upstream' if self.action == 'create' else None
+
+    @property
+    def upstream_limited(self):
+        return self.action == 'create'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list' and (make := self.request.query_params.get('make')):
+            queryset = queryset.by_make(make)
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -18,43 +65,327 @@ class CarsViewSet(viewsets.ModelViewSet):
         else:
             return CarSerializer
 
+    def list(self, request, *args, **kwargs):
+        """
+        Lists cars straight from values() rows, skipping per row serializer instantiation.
+        Rows are turned into the same dicts as CarSerializer returns.
+        """
+        return self.cached_response(
+            request,
+            key=page_key(request.get_full_path()),
+            version_keys=[CARS_LIST_KEY],
+            get_response=lambda: Response([
+                car_values_representation(row)
+                for row in self.filter_queryset(self.get_queryset()).values(*CAR_VALUES_FIELDS)
+            ]),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Cached under key of normalised id, so "/cars/01/" is invalidated together with "/cars/1/".
+        """
+        pk = int(kwargs['pk'])
+        return self.cached_response(
+            request,
+            key=car_key(pk),
+            version_keys=[car_key(pk)],
+            get_response=lambda: super(CarsViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
 
 class CarRatingCreateAPIView(CreateAPIView):
+    """
+    Creates a rating. In write-behind mode (RATINGS_WRITE_BEHIND setting) validated rating is only buffered
+    and 202 is returned, rating is saved by flush_buffered_ratings task. Optional "Idempotency-Key" header
+    makes sure buffered rating sent many times is saved once.
+    """
     serializer_class = CarRatingSerializer
     queryset = CarRating.objects.all()
+    throttle_scope = 'ratings'
+
+    def create(self, request, *args, **kwargs):
+        if not settings.RATINGS_WRITE_BEHIND:
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        idempotency_key = request.headers.get('Idempotency-Key') or uuid.uuid4().hex
+        if len(idempotency_key) > 64:
+            raise ValidationError({'idempotency_key': ['Ensure this field has no more than 64 characters.']})
+        buffer_rating(serializer.validated_data['car_id'].id, serializer.validated_data['rating'], idempotency_key)
+        return Response(
+            status=status.HTTP_202_ACCEPTED,
+            data={**serializer.data, 'idempotency_key': idempotency_key},
+        )
+
+
+class CarRatingBatchCreateAPIView(APIView):
+    """
+    Creates many ratings at once from JSON array or NDJSON stream of {"car_id", "rating"} objects.
+    Valid ratings are saved even if some rows are invalid, errors are reported per row index.
+    """
+    parser_classes = [JSONParser, NDJSONParser]
+    throttle_scope = 'ratings'
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of ratings")
+        if len(request.data) > settings.RATINGS_BATCH_MAX_ROWS:
+            raise ValidationError(f"Ensure there are no more than {settings.RATINGS_BATCH_MAX_ROWS} ratings")
+        created, errors = import_ratings(request.data)
+        response_status = status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST
+        return Response(status=response_status, data={'created': created, 'errors': errors})
 
 
 class PopularCarListAPIView(ListAPIView):
+    """
+    Lists cars ordered by number of ratings or, with "sort=quality" param, by bayesian score of ratings.
+    Both rankings are read from denormalized columns kept up to date on each rating insert, pages are fetched
+    from "car_popularity_idx" or "car_quality_idx" index.
+    With "window=24h|7d|30d" param cars are ranked by number of ratings within the window and with "sort=trending"
+    by exponentially decayed number of recent ratings, both are summed from hourly or daily rating buckets.
+    Time these rankings are computed at is pinned in cursors, so next pages don't skip or repeat cars
+    when a new hour starts.
+    """
     serializer_class = CarPopularitySerializer
+    queryset = Car.objects.all()
+    pagination_class = KeysetPagination
+    sort_query_param = 'sort'
+    window_query_param = 'window'
+    orderings = {
+        'popularity': ('-rates_number', '-id'),
+        'quality': ('-bayesian_score', '-id'),
+        'trending': ('-trending_score', '-id'),
+    }
+
+    @cached_property
+    def sort(self):
+        sort = self.request.query_params.get(self.sort_query_param, 'popularity')
+        if sort not in self.orderings:
+            raise ValidationError({self.sort_query_param: [f'Choose one of: {", ".join(self.orderings)}']})
+        return sort
+
+    @cached_property
+    def window(self):
+        window = self.request.query_params.get(self.window_query_param)
+        if window is None:
+            return None
+        if window not in CarRatingBucket.WINDOWS:
+            raise ValidationError({self.window_query_param: [f'Choose one of: {", ".join(CarRatingBucket.WINDOWS)}']})
+        if self.sort != 'popularity':
+            raise ValidationError({self.window_query_param: ['Only popularity can be ranked within a window.']})
+        return window
+
+    @property
+    def ordering(self):
+        if self.window:
+            return ('-window_ratings', '-id')
+        return self.orderings[self.sort]
+
+    @cached_property
+    def now(self):
+        pinned = self.paginator.get_pinned(self.request)
+        if pinned is None:
+            return timezone.now()
+        try:
+            now = parse_datetime(pinned) if isinstance(pinned, str) else None
+        except ValueError:
+            now = None
+        if now is None or now.tzinfo is None:
+            raise NotFound(INVALID_CURSOR_ERROR_MSG)
+        return now
+
+    @property
+    def pinned(self):
+        if self.sort == 'trending' or self.window:
+            return self.now.isoformat()
+        return None
 
     def get_queryset(self):
-        return Car.objects.all().annotate(rating_count=Count('ratings')).order_by('-rating_count')
+        queryset = super().get_queryset()
+        if self.sort == 'trending':
+            return queryset.with_trending_score(self.now)
+        if self.window:
+            return queryset.with_window_ratings(self.window, self.now)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lists page of values() rows with the same fields as CarPopularitySerializer and ranking annotation,
+        skipping serializer.
+        """
+        queryset = self.get_queryset()
+        queryset = queryset.values(*CarPopularitySerializer.Meta.fields, *queryset.query.annotations)
+        return self.get_paginated_response(self.paginate_queryset(queryset))
 
 
-class AllCarsByMakeAPIView(APIView):
+class CarSearchAPIView(APIView):
+    """
+    Searches cars by "q" query param matched case-insensitively with prefix of "make model" name, prefix of
+    any word of it or, for 3 or more characters, fuzzy with trigram similarity. Best matches come first and
+    equally good ones are ordered by bayesian score of ratings. Number of results is set by "limit" param.
+    """
+    query_param = 'q'
+    limit_query_param = 'limit'
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request):
+        query = request.query_params.get(self.query_param, '').strip()
+        if not query:
+            raise ValidationError({self.query_param: ['This field is required.']})
+        try:
+            limit = min(max(int(request.query_params[self.limit_query_param]), 1), self.max_limit)
+        except (KeyError, ValueError):
+            limit = self.default_limit
+        return Response(search_cars(query, limit))
+
+
+class CarsExportAPIView(APIView):
+    """
+    Streams all cars with their rating aggregates as NDJSON or CSV, rows are read with server-side cursor
+    and sent as soon as they are fetched.
+    """
+
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise NotFound(f'Unknown export format, available formats: {", ".join(EXPORT_FORMATS)}')
+        lines, content_type = export_cars(export_format)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="cars.{export_format}"'
+        return response
+
+
+def create_cars(cars):
+    created_cars_ids, _ = import_cars(cars)
+    return CarSerializer(Car.objects.filter(id__in=created_cars_ids).order_by('id'), many=True).data
+
+
+def validated_cars(cars):
+    serializer = CarSerializer(data=cars, many=True)
+    serializer.is_valid()
+    return serializer.data
+
+
+class AllCarsByMakeAPIView(UpstreamLimitMixin, APIView):
     """
     Allows to see all car models by specifc make.
-    Optional if "create" param is passed it creates Car objects from first 10 endries in API response.
+    Optional if "create" param is passed it creates Car objects from all entries in API response.
     """
+    throttle_scope = 'upstream'
 
     def post(self, request):
         connector = VehicleAPICConnector(request.data)
         list_of_cars = connector.get_vehicle_models_by_make_data()
         formatted_list_of_cars = connector.validate_vehicles_by_make_data(list_of_cars)
-        length = 10 if len(formatted_list_of_cars) >= 10 else len(formatted_list_of_cars)
-        cars_to_create = formatted_list_of_cars[:length]
         if request.data.get("create") == "True":
-            created_cars_ids = []
-            for car in cars_to_create:
-                car = CarSerializer(data=car)
-                if car.is_valid():
-                    created_car, created = Car.objects.get_or_create(**car.validated_data)
-                    if created:
-                        car_id = created_car.id
-                        created_cars_ids.append(car_id)
-            serializer = CarSerializer(data=Car.objects.filter(id__in=created_cars_ids), many=True)
-            serializer.is_valid()
-            return Response(status=status.HTTP_201_CREATED, data=serializer.data)
-        serializer = CarSerializer(data=cars_to_create, many=True)
-        serializer.is_valid()
-        return Response(status=status.HTTP_200_OK, data=serializer.data)
+            return Response(status=status.HTTP_201_CREATED, data=create_cars(formatted_list_of_cars))
+        return Response(status=status.HTTP_200_OK, data=validated_cars(formatted_list_of_cars))
+
+
+class ImportJobCreateAPIView(CreateAPIView):
+    """
+    Starts background import of all models of given makes. Returns job id with status 202,
+    progress and errors can be checked with ImportJobRetrieveAPIView.
+    """
+    serializer_class = ImportJobSerializer
+    throttle_scope = 'upstream'
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = start_import_job(serializer.validated_data['makes'])
+        job.refresh_from_db()
+        headers = {'Location': reverse('cars:import_job', args=[job.id], request=request)}
+        return Response(status=status.HTTP_202_ACCEPTED, data=self.get_serializer(job).data, headers=headers)
+
+
+class ImportJobRetrieveAPIView(RetrieveAPIView):
+    serializer_class = ImportJobSerializer
+    queryset = ImportJob.objects.all()
+
+
+class MetricsView(APIView):
+    """
+    Serves request metrics and response and vPIC API cache hit rates of current process in Prometheus text
+    format, available when REQUEST_METRICS_ENABLED is on.
+    """
+
+    def get(self, request):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise NotFound
+        caches = {'responses': get_response_cache().stats(), 'vpic': get_vehicle_api_cache().stats()}
+        return HttpResponse(
+            get_request_metrics().exposition() + cache_exposition(caches), content_type='text/plain; version=0.0.4'
+        )
+
+
+def async_api_view(view):
+    """
+    Decorates async POST view, which awaits external API instead of blocking a worker thread. Under ASGI one worker
+    serves many such requests at once, only ORM queries are run in a thread. Like DRF views it's exempt from CSRF
+    and answers APIException with JSON error, with Retry-After header when exception has "wait".
+    Under WSGI the view runs in an event loop of its own, HTTP client of that loop is closed when it returns.
+    """
+    @wraps(view)
+    async def wrapped_view(request, *args, **kwargs):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as e:
+            data = e.detail if isinstance(e, ValidationError) else {'detail': e.detail}
+            response = json_response(data, status=e.status_code)
+            if wait := getattr(e, 'wait', None):
+                response['Retry-After'] = str(math.ceil(wait))
+            return response
+        finally:
+            if not isinstance(request, ASGIRequest):
+                await close_async_client()
+    wrapped_view.csrf_exempt = True
+    return wrapped_view
+
+
+def get_request_data(request):
+    """
+    Returns JSON or form data of request.
+    """
+    if request.content_type != 'application/json':
+        return request.POST.dict()
+    try:
+        return json.loads(request.body)
+    except ValueError as e:
+        raise ParseError(f'JSON parse error - {e}')
+
+
+def json_response(data, status):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+@async_api_view
+@throttled('upstream')
+@upstream_limited
+async def async_create_car(request):
+    """
+    Creates car like CarsViewSet, validating make and model against external API without blocking a thread.
+    """
+    serializer = CreateCarSerializer(data=get_request_data(request))
+    await sync_to_async(serializer.is_valid)(raise_exception=True)
+    connector = AsyncVehicleAPICConnector(serializer.validated_data)
+    new_car = connector.validate_vehicle_data(await connector.async_get_vehicle_data())
+    car = await sync_to_async(Car.objects.create)(**new_car)
+    return json_response(CarSerializer(car).data, status=status.HTTP_201_CREATED)
+
+
+@async_api_view
+@throttled('upstream')
+@upstream_limited
+async def async_all_cars_by_make(request):
+    """
+    Async version of AllCarsByMakeAPIView.
+    """
+    data = get_request_data(request)
+    connector = AsyncVehicleAPICConnector(data)
+    list_of_cars = connector.validate_vehicles_by_make_data(await connector.async_get_vehicle_models_by_make_data())
+    if data.get("create") == "True":
+        return json_response(await sync_to_async(create_cars)(list_of_cars), status=status.HTTP_201_CREATED)
+    return json_response(await sync_to_async(validated_cars)(list_of_cars), status=status.HTTP_200_OK)
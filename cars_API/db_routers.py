@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+read_database = ContextVar('read_database', default=None)
+
+
+@contextmanager
+def reading_from(database):
+    """
+    Sends reads of the current context to given database, None means primary.
+    """
+    token = read_database.set(database)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+def reading_from_primary():
+    return reading_from(None)
+
+
+class ReadReplicaRouter:
+    """
+    Sends reads to the replica chosen for the current request by ReadReplicaMiddleware and everything else,
+    including reads outside of requests, to primary. Replicas copy primary, so they are never migrated.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.READ_REPLICA_DATABASES
@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cars.middleware.RequestMetricsMiddleware',
+    'cars.middleware.ReadReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,6 +73,20 @@ DATABASES = {
     }
 }
 
+# Read replicas, one database per host of DATABASE_REPLICA_HOSTS with credentials of default database. With
+# READ_REPLICAS_ENABLED safe method requests read from a random replica, except for clients which sent a write
+# request in last READ_REPLICA_STICKY_SECONDS (should exceed replication lag), those read from primary.
+# In tests replicas mirror default database.
+
+READ_REPLICAS_ENABLED = env.bool('READ_REPLICAS_ENABLED', default=False)
+READ_REPLICA_STICKY_SECONDS = env.int('READ_REPLICA_STICKY_SECONDS', default=5)
+READ_REPLICA_DATABASES = []
+for index, host in enumerate(env.list('DATABASE_REPLICA_HOSTS', default=[DATABASES['default']['HOST']])):
+    READ_REPLICA_DATABASES.append(f'replica_{index}')
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['cars_API.db_routers.ReadReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -117,11 +133,141 @@ STATICFILES_DIRS = (os.path.join(STATIC_ROOT, 'css/'),
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Views with "throttle_scope" are throttled with token buckets refilled at "number/period" rates: one bucket per
+# client IP and one "<scope>_global" bucket shared by all clients, empty rate disables a bucket. "ratings" scope
+# covers rating endpoints, "upstream" views calling vPIC API
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'cars.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'cars.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'ratings': env('THROTTLE_RATINGS_RATE', default='120/min'),
+        'ratings_global': env('THROTTLE_RATINGS_GLOBAL_RATE', default='6000/min'),
+        'upstream': env('THROTTLE_UPSTREAM_RATE', default='30/min'),
+        'upstream_global': env('THROTTLE_UPSTREAM_GLOBAL_RATE', default='600/min'),
+    },
+    # number of proxies in front of the app, client IP is then taken from X-Forwarded-For header
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=None),
+}
+
+REDIS_URL = env('REDIS_URL', default="redis://redis:6379")
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
+CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', default=False)
+CELERY_BEAT_SCHEDULE = {
+    'flush-rating-buffer': {
+        'task': 'cars.tasks.flush_buffered_ratings',
+        'schedule': env.float('RATINGS_BUFFER_FLUSH_INTERVAL', default=5),
+    },
+    'prune-rating-buckets': {
+        'task': 'cars.tasks.prune_rating_buckets',
+        'schedule': 60 * 60,
+    },
+    'create-rating-partitions': {
+        'task': 'cars.tasks.create_rating_partitions',
+        'schedule': 24 * 60 * 60,
+    },
 }
 
-CELERY_BROKER_URL = "redis://redis:6379"
-CELERY_RESULT_BACKEND = "redis://redis:6379"
+# NHTSA vPIC API connection, timeouts are in seconds, failed requests are retried with jittered exponential backoff
+# and after VPIC_CIRCUIT_FAILURE_THRESHOLD failed calls in a row requests fail fast for VPIC_CIRCUIT_RESET_TIMEOUT
+
+VPIC_BASE_URL = env('VPIC_BASE_URL', default='https://vpic.nhtsa.dot.gov/api/')
+VPIC_POOL_SIZE = env.int('VPIC_POOL_SIZE', default=10)
+VPIC_CONNECT_TIMEOUT = env.float('VPIC_CONNECT_TIMEOUT', default=3.05)
+VPIC_READ_TIMEOUT = env.float('VPIC_READ_TIMEOUT', default=10)
+VPIC_MAX_RETRIES = env.int('VPIC_MAX_RETRIES', default=2)
+VPIC_BACKOFF_FACTOR = env.float('VPIC_BACKOFF_FACTOR', default=0.5)
+VPIC_CIRCUIT_FAILURE_THRESHOLD = env.int('VPIC_CIRCUIT_FAILURE_THRESHOLD', default=5)
+VPIC_CIRCUIT_RESET_TIMEOUT = env.float('VPIC_CIRCUIT_RESET_TIMEOUT', default=30)
+VPIC_MAX_CONCURRENCY = env.int('VPIC_MAX_CONCURRENCY', default=8)
+# connection pool of async views, one ASGI worker keeps many requests in flight
+VPIC_ASYNC_POOL_SIZE = env.int('VPIC_ASYNC_POOL_SIZE', default=200)
+
+# NHTSA vPIC API responses cache, backend is "local" (per process) or "redis" (shared), ttl 0 disables cache
+
+VPIC_CACHE_BACKEND = env('VPIC_CACHE_BACKEND', default='local')
+VPIC_CACHE_TTL = env.int('VPIC_CACHE_TTL', default=60 * 60)
+VPIC_CACHE_STALE_TTL = env.int('VPIC_CACHE_STALE_TTL', default=24 * 60 * 60)
+# concurrent misses of the same make are fetched once per process, with redis backend once for all processes
+# which wait for the fetch up to VPIC_CACHE_LOCK_TIMEOUT seconds
+VPIC_CACHE_LOCK_TIMEOUT = env.float('VPIC_CACHE_LOCK_TIMEOUT', default=30)
+VPIC_CACHE_MAX_SIZE = env.int('VPIC_CACHE_MAX_SIZE', default=1024)
+
+# Local copy of NHTSA vPIC catalogue loaded with "load_vpic_catalogue" command is used instead of external API
+# for makes loaded less than VPIC_CATALOGUE_MAX_AGE seconds ago, 0 means catalogue never goes stale
+
+VPIC_CATALOGUE_MAX_AGE = env.int('VPIC_CATALOGUE_MAX_AGE', default=30 * 24 * 60 * 60)
+
+# Number of rows inserted with a single statement when importing cars
+
+CARS_IMPORT_BATCH_SIZE = env.int('CARS_IMPORT_BATCH_SIZE', default=500)
+
+# Number of ratings inserted with a single statement and max number of ratings in one batch request
+
+RATINGS_IMPORT_BATCH_SIZE = env.int('RATINGS_IMPORT_BATCH_SIZE', default=1000)
+RATINGS_BATCH_MAX_ROWS = env.int('RATINGS_BATCH_MAX_ROWS', default=10000)
+
+# Write-behind mode of rating endpoint, ratings are buffered ("redis" - shared, "local" - per process) and saved
+# in chunks of RATINGS_BUFFER_FLUSH_SIZE by celery beat task every RATINGS_BUFFER_FLUSH_INTERVAL seconds
+
+RATINGS_WRITE_BEHIND = env.bool('RATINGS_WRITE_BEHIND', default=False)
+RATINGS_BUFFER_BACKEND = env('RATINGS_BUFFER_BACKEND', default='redis')
+RATINGS_BUFFER_FLUSH_SIZE = env.int('RATINGS_BUFFER_FLUSH_SIZE', default=1000)
+
+# Cars ranked by quality are ordered by bayesian score: average rating computed as if each car had
+# RATING_PRIOR_WEIGHT extra ratings equal to RATING_PRIOR_MEAN, run "recompute_car_ratings" after changing them
+
+RATING_PRIOR_MEAN = env.float('RATING_PRIOR_MEAN', default=3.0)
+RATING_PRIOR_WEIGHT = env.int('RATING_PRIOR_WEIGHT', default=5)
+
+# Ratings are counted in hourly and daily buckets serving "/popular/?window=24h|7d|30d" and trending ranking,
+# trending score sums hourly buckets of last RATINGS_TRENDING_HOURS, ratings count half as much every
+# RATINGS_TRENDING_HALF_LIFE hours. Buckets older than the longest window are pruned by celery beat task
+
+RATINGS_TRENDING_HOURS = env.int('RATINGS_TRENDING_HOURS', default=72)
+RATINGS_TRENDING_HALF_LIFE = env.float('RATINGS_TRENDING_HALF_LIFE', default=24)
+
+# PostgreSQL only: ratings table partitioned by month of creation, applied by migration 0011 (migrate back to 0010
+# and forward to switch existing database). Partitions of next RATINGS_PARTITIONS_AHEAD months are created
+# daily by celery beat task, old ones are archived with "manage_rating_partitions --archive-before" command
+
+RATINGS_PARTITIONED = env.bool('RATINGS_PARTITIONED', default=False)
+RATINGS_PARTITIONS_AHEAD = env.int('RATINGS_PARTITIONS_AHEAD', default=3)
+
+# Token buckets of throttled views, backend is "redis" (shared, falls back to "local" while Redis is unavailable)
+# or "local" (per process, holding up to THROTTLE_LOCAL_MAX_SIZE buckets)
+
+THROTTLE_BACKEND = env('THROTTLE_BACKEND', default='local')
+THROTTLE_LOCAL_MAX_SIZE = env.int('THROTTLE_LOCAL_MAX_SIZE', default=10000)
+
+# Requests calling vPIC API over UPSTREAM_MAX_CONCURRENCY handled at once by a process are rejected with 503
+# and Retry-After of UPSTREAM_RETRY_AFTER seconds instead of waiting, 0 disables the limit
+
+UPSTREAM_MAX_CONCURRENCY = env.int('UPSTREAM_MAX_CONCURRENCY', default=0)
+UPSTREAM_RETRY_AFTER = env.int('UPSTREAM_RETRY_AFTER', default=1)
+
+# Cache of cars list and details responses, backend is "local" (per process, changes made by other processes
+# are visible after RESPONSE_CACHE_TTL seconds) or "redis" (shared), ttl 0 disables cache
+
+RESPONSE_CACHE_BACKEND = env('RESPONSE_CACHE_BACKEND', default='local')
+RESPONSE_CACHE_TTL = env.int('RESPONSE_CACHE_TTL', default=60)
+RESPONSE_CACHE_MAX_SIZE = env.int('RESPONSE_CACHE_MAX_SIZE', default=10000)
+
+# Per request SQL, vPIC API, serialization and total timings sent in Server-Timing header and collected into
+# histograms served at /metrics (per process)
+
+REQUEST_METRICS_ENABLED = env.bool('REQUEST_METRICS_ENABLED', default=False)
+
+# Number of rows fetched from database at once when exporting cars
+
+CARS_EXPORT_CHUNK_SIZE = env.int('CARS_EXPORT_CHUNK_SIZE', default=2000)